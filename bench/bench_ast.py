@@ -0,0 +1,103 @@
+"""Microbenchmark of the tactic-AST dependency extractor.
+
+The corpus is every `petanque/ast` answer of the given pet-server recordings
+(see `pet_replay.py`), or synthetic `rewrite`-like ASTs when none is given.
+The extractor is checked against the original recursive implementation and
+timed against it.
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from typing import Any, Dict, Iterator, List
+
+from src.parser.ast_deps import list_dependencies
+
+def read_keyword(keyword: str, l: list, result: list) -> list:
+    """Original recursive walk, kept as the reference."""
+    if isinstance(l, list):
+        if len(l) >= 3 and l[0] == keyword:
+            result.append((l[1], l[2]))
+            l = l[3:]
+        for el in l:
+            result = read_keyword(keyword, el, result)
+    elif isinstance(l, dict):
+        for el in l.values():
+            result = read_keyword(keyword, el, result)
+    return result
+
+def reference_dependencies(ast: dict) -> List[str]:
+    """Original `list_dependencies`, with its quadratic deduplication."""
+    dependencies = [".".join(map(lambda w: w[1], dir_path[1] + [name])) for dir_path, name in read_keyword("Ser_Qualid", ast["v"]["expr"], [])]
+    return [dependency for i, dependency in enumerate(dependencies) if not dependency in dependencies[:i]]
+
+def _loc(i: int) -> Dict[str, Any]:
+    return {"fname": ["InFile", {"dirpath": None, "file": "/tmp/input.v"}], "line_nb": 1, "bol_pos": 0,
+            "line_nb_last": 1, "bol_pos_last": 0, "bp": i, "ep": i + 5}
+
+def _node(v: Any, i: int) -> Dict[str, Any]:
+    return {"v": v, "loc": _loc(i)}
+
+def synthetic_ast(rng: random.Random, n_refs: int, vocabulary: int = 50) -> Dict[str, Any]:
+    """AST shaped like a long `rewrite !a b -c ... => [x [y z]]` tactic."""
+    refs = []
+    for i in range(n_refs):
+        name = f"lemma{rng.randrange(vocabulary)}"
+        qualid = ["Ser_Qualid", ["DirPath", [["Id", "ssrnat"], ["Id", "mathcomp"]]], ["Id", name]]
+        refs.append(_node(["CRef", _node(qualid, i), None], i))
+        refs.append(["RWMult", ["Precise", rng.randrange(3)], _node(["IPatId", ["Id", f"x{i}"]], i)])
+    return _node({"control": [], "attrs": [], "expr": ["VernacExtend", ["TacticExtend", refs]]}, 0)
+
+def _find_ast(value: Any):
+    """First `{"v": {"expr": ...}}` object inside a recorded answer."""
+    if isinstance(value, dict):
+        if isinstance(value.get("v"), dict) and "expr" in value["v"]:
+            return value
+        value = list(value.values())
+    if isinstance(value, list):
+        for item in value:
+            found = _find_ast(item)
+            if found is not None:
+                return found
+    return None
+
+def recorded_asts(paths: List[str]) -> Iterator[Dict[str, Any]]:
+    """ASTs answered to `petanque/ast` requests in pet-server recordings."""
+    for path in paths:
+        with open(path) as file:
+            for line in file:
+                record = json.loads(line)
+                if record["method"] == "petanque/ast":
+                    ast = _find_ast(record["response"].get("result"))
+                    if ast is not None:
+                        yield ast
+
+def _time(fn, corpus, repeat: int) -> float:
+    """Best time over `repeat` passes on the corpus, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for ast in corpus:
+            fn(ast)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the AST dependency extractor.")
+    parser.add_argument("recordings", nargs="*", help="pet-server recordings to take the ASTs from")
+    parser.add_argument("--synthetic", default=2000, type=int, help="Number of synthetic ASTs without recordings")
+    parser.add_argument("--max-refs", default=200, type=int, help="Largest number of references in a synthetic AST")
+    parser.add_argument("--repeat", default=5, type=int)
+    parser.add_argument("--min-speedup", default=1.0, type=float, help="Exit 1 if slower than this against the reference")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    corpus = list(recorded_asts(args.recordings)) if args.recordings else [synthetic_ast(rng, rng.randint(1, args.max_refs)) for _ in range(args.synthetic)]
+    mismatches = sum(list_dependencies(ast) != reference_dependencies(ast) for ast in corpus)
+    reference = _time(reference_dependencies, corpus, args.repeat)
+    current = _time(list_dependencies, corpus, args.repeat)
+    print(f"{len(corpus)} ASTs: reference {reference / len(corpus) * 1e6:.1f}us, current {current / len(corpus) * 1e6:.1f}us per AST, "
+          f"speedup x{reference / current:.2f}, {mismatches} mismatches")
+    sys.exit(1 if mismatches or reference / current < args.min_speedup else 0)
@@ -0,0 +1,145 @@
+"""Offline benchmark of steps 2 and 3 against a recorded pet-server.
+
+A recording directory holds `pet.jsonl` (made with `pet_replay.py record`)
+and the `sources.jsonl` of the library it was recorded on (plus `blobs/` if
+the sources reference a blob store). Both stages run end to end on a copy of
+it while `ReplayServer`s answer on the pet-server ports; each stage runs in
+its own process so its peak RSS can be reported.
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import replace
+from typing import Any, Dict
+
+from src.config.opam_config import OpamConfig
+from script.utils import iter_jsonl
+from script.steps.step_2_metadata import extract_metadata
+from script.steps.step_3_elements import extract_elements
+from bench.pet_replay import Recording, ReplayServer
+
+STAGES = [("metadata", extract_metadata), ("elements", extract_elements)]
+
+def _run_stage(stage_fn, config: OpamConfig, kwargs: Dict[str, Any], result_queue):
+    """Child process: run one stage quietly and report its wall time and peak RSS.
+
+    With `--workers`, step 3 replays in forked worker processes, whose peak
+    (`RUSAGE_CHILDREN`, once they are joined) is reported next to the stage's own.
+    """
+    sys.stdout = open(os.devnull, 'w')
+    start = time.perf_counter()
+    stage_fn(config, **kwargs)
+    seconds = time.perf_counter() - start
+    result_queue.put((seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss))
+
+def _count(path: str) -> int:
+    """Number of entries of a JSONL output (0 if missing)."""
+    return sum(1 for _ in iter_jsonl(path)) if os.path.exists(path) else 0
+
+def prepare(recording_dir: str, config: OpamConfig, workdir: str) -> OpamConfig:
+    """Copy the recorded inputs into `workdir` and point the config there."""
+    output = os.path.join(workdir, config.name)
+    shutil.copy(os.path.join(recording_dir, "sources.jsonl"), output + '_sources.jsonl')
+    if os.path.isdir(os.path.join(recording_dir, "blobs")):
+        shutil.copytree(os.path.join(recording_dir, "blobs"), output + '_blobs')
+    return replace(config, output=output)
+
+def run_benchmark(recording_dir: str, config: OpamConfig, port: int = 18765, workers: int = 1, replay_mode: str = "theorem") -> Dict[str, Any]:
+    """Run every stage against the replay servers and return per-stage figures."""
+    recording = Recording([os.path.join(recording_dir, "pet.jsonl")])
+    servers = [ReplayServer(port + i, recording) for i in range(workers)]
+    for server in servers:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    ctx = mp.get_context("fork")
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            config = prepare(recording_dir, config, workdir)
+            kwargs = {"port": port, "external_pet": True, "max_memory": 1.0, "workers": workers, "replay_mode": replay_mode}
+            for name, stage_fn in STAGES:
+                before = recording.stats()
+                result_queue = ctx.Queue()
+                process = ctx.Process(target=_run_stage, args=(stage_fn, config, kwargs, result_queue))
+                process.start()
+                process.join()
+                if process.exitcode != 0:
+                    raise RuntimeError(f"{name} failed with exit code {process.exitcode}")
+                seconds, max_rss_kb, workers_max_rss_kb = result_queue.get()
+                after = recording.stats()
+                entries = _count(f"{config.output}_{name}.jsonl")
+                theorems = sum(len(entry["theorems"]) for entry in iter_jsonl(config.output + '_metadata.jsonl')) if name == "metadata" else entries
+                rpcs = sum(after["calls"].values()) - sum(before["calls"].values())
+                results[name] = {
+                    "entries": entries,
+                    "theorems": theorems,
+                    "seconds": seconds,
+                    "theorems_per_s": theorems / seconds if seconds else 0.0,
+                    "rpcs": rpcs,
+                    "rpcs_per_theorem": rpcs / theorems if theorems else 0.0,
+                    "calls": {method: n - before["calls"].get(method, 0) for method, n in after["calls"].items()},
+                    "misses": after["misses"] - before["misses"],
+                    "peak_rss_mb": max(max_rss_kb, workers_max_rss_kb) / 1024,
+                    "stage_rss_mb": max_rss_kb / 1024,
+                    "workers_rss_mb": workers_max_rss_kb / 1024,
+                }
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+    return results
+
+def regressions(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float):
+    """Describe every figure worse than `baseline` by more than `tolerance`."""
+    found = []
+    for name, stage in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if stage["theorems_per_s"] < base["theorems_per_s"] * (1 - tolerance):
+            found.append(f"{name}: {stage['theorems_per_s']:.2f} theorems/s vs {base['theorems_per_s']:.2f}")
+        if stage["rpcs_per_theorem"] > base["rpcs_per_theorem"] * (1 + tolerance):
+            found.append(f"{name}: {stage['rpcs_per_theorem']:.2f} RPCs/theorem vs {base['rpcs_per_theorem']:.2f}")
+        if stage["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance):
+            found.append(f"{name}: {stage['peak_rss_mb']:.0f} MB peak RSS vs {base['peak_rss_mb']:.0f}")
+    return found
+
+def print_results(results: Dict[str, Any]):
+    """One line per stage."""
+    print(f"{'stage':<10} {'theorems':>9} {'seconds':>9} {'thm/s':>9} {'RPC/thm':>9} {'RSS MB':>8} {'misses':>7}")
+    for name, stage in results.items():
+        print(f"{name:<10} {stage['theorems']:>9} {stage['seconds']:>9.2f} {stage['theorems_per_s']:>9.2f} "
+              f"{stage['rpcs_per_theorem']:>9.2f} {stage['peak_rss_mb']:>8.0f} {stage['misses']:>7}")
+        if stage["misses"]:
+            print(f"WARNING: {stage['misses']} requests of {name} were not in the recording")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark steps 2 and 3 against a recorded pet-server.")
+    parser.add_argument("--recording", required=True, help="Directory with pet.jsonl and sources.jsonl")
+    parser.add_argument("--config-path", default="config/coq-actuary.yaml", help="Config of the recorded library")
+    parser.add_argument("--port", default=18765, type=int, help="First port of the replay servers")
+    parser.add_argument("--workers", default=1, type=int)
+    parser.add_argument("--replay-mode", default="theorem", choices=["theorem", "file"])
+    parser.add_argument("--json", default=None, help="Write the results to this file")
+    parser.add_argument("--baseline", default=None, help="Results of a previous run; exit 1 on regression")
+    parser.add_argument("--tolerance", default=0.1, type=float, help="Allowed relative regression against --baseline")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.recording, OpamConfig.from_yaml(args.config_path), args.port, args.workers, args.replay_mode)
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            found = regressions(results, json.load(file), args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if found else 0)
@@ -0,0 +1,203 @@
+"""Record/replay stand-in for pet-server, for offline benchmarks and tests.
+
+`record` sits between a client and a real pet-server and appends every
+request/response pair to a JSONL recording. `serve` answers requests from one
+or more recordings without Coq or Docker: a request is matched on its method
+and parameters, and identical requests get their recorded answers in order.
+A request without an exact match falls back to the first recorded request of
+the same method whose parameters it contains, so hand-written recordings can
+leave out the parameters that do not matter (URIs, options, timeouts).
+"""
+
+import argparse
+import codecs
+import json
+import socket
+import socketserver
+import threading
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List
+
+STATS_METHOD = "replay/stats"
+
+def request_key(method: str, params: Any) -> str:
+    """Canonical key of a request."""
+    return json.dumps([method, params], sort_keys=True, separators=(",", ":"))
+
+def contains(params: Any, pattern: Any) -> bool:
+    """Whether `params` holds every key of `pattern` (recursively) with the same values."""
+    if isinstance(pattern, dict):
+        return isinstance(params, dict) and all(key in params and contains(params[key], value) for key, value in pattern.items())
+    return params == pattern
+
+class JsonStream:
+    """Split a byte stream into the JSON objects it carries (newline-framed or not)."""
+
+    def __init__(self):
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.json = json.JSONDecoder()
+        self.buffer = ""
+
+    def feed(self, data: bytes) -> List[Dict[str, Any]]:
+        """Add bytes and return every complete object."""
+        self.buffer += self.decoder.decode(data)
+        objects = []
+        while True:
+            text = self.buffer.lstrip()
+            if not text or not text.rstrip().endswith("}"):
+                self.buffer = text
+                return objects
+            try:
+                obj, end = self.json.raw_decode(text)
+            except json.JSONDecodeError:
+                self.buffer = text
+                return objects
+            objects.append(obj)
+            self.buffer = text[end:]
+
+def _send(sock: socket.socket, obj: Dict[str, Any]):
+    sock.sendall((json.dumps(obj) + "\n").encode("utf-8"))
+
+class Recording:
+    """Recorded answers indexed by request key."""
+
+    def __init__(self, paths: List[str]):
+        self.answers: Dict[str, Deque[Dict[str, Any]]] = defaultdict(deque)
+        self.last: Dict[str, Dict[str, Any]] = {}
+        self.lock = threading.Lock()
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.misses = 0
+        self.patterns: Dict[str, List[Any]] = defaultdict(list)
+        for path in paths:
+            with open(path, 'r') as file:
+                for line in file:
+                    if line.strip():
+                        record = json.loads(line)
+                        key = request_key(record["method"], record["params"])
+                        if key not in self.answers:
+                            self.patterns[record["method"]].append((record["params"], key))
+                        self.answers[key].append(record["response"])
+
+    def _match(self, method: str, params: Any) -> str:
+        """Key of the recorded request answering `params`: its own, else the first one it contains."""
+        key = request_key(method, params)
+        if key in self.answers:
+            return key
+        for pattern, recorded in self.patterns.get(method, ()):
+            if contains(params, pattern):
+                return recorded
+        return key
+
+    def answer(self, method: str, params: Any) -> Dict[str, Any]:
+        """Recorded `result`/`error` for a request; repeats replay the last answer."""
+        key = self._match(method, params)
+        with self.lock:
+            self.calls[method] += 1
+            queue = self.answers.get(key)
+            if queue:
+                self.last[key] = queue.popleft()
+            if key in self.last:
+                return self.last[key]
+            self.misses += 1
+        return {"error": {"code": -32000, "message": f"{method} not recorded"}}
+
+    def stats(self) -> Dict[str, Any]:
+        """Number of calls per method and of unrecorded requests."""
+        with self.lock:
+            return {"calls": dict(self.calls), "misses": self.misses}
+
+class _ReplayHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        stream = JsonStream()
+        recording: Recording = self.server.recording
+        while True:
+            data = self.request.recv(65536)
+            if not data:
+                return
+            for request in stream.feed(data):
+                if request.get("method") == STATS_METHOD:
+                    answer = {"result": recording.stats()}
+                else:
+                    answer = recording.answer(request.get("method"), request.get("params"))
+                if "id" in request:
+                    _send(self.request, {"jsonrpc": "2.0", "id": request["id"], **answer})
+
+class _RecordHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        upstream = socket.create_connection(self.server.upstream)
+        client_stream, upstream_stream = JsonStream(), JsonStream()
+        pending = {}
+        try:
+            while True:
+                data = self.request.recv(65536)
+                if not data:
+                    return
+                upstream.sendall(data)
+                for request in client_stream.feed(data):
+                    if "id" in request:
+                        pending[request["id"]] = request
+                while pending:
+                    data = upstream.recv(65536)
+                    if not data:
+                        return
+                    self.request.sendall(data)
+                    for response in upstream_stream.feed(data):
+                        request = pending.pop(response.get("id"), None)
+                        if request is not None:
+                            self.server.write(request, response)
+        finally:
+            upstream.close()
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+class ReplayServer(_Server):
+    """pet-server stand-in answering from recordings."""
+
+    def __init__(self, port: int, recording: Recording, host: str = "127.0.0.1"):
+        self.recording = recording
+        super().__init__((host, port), _ReplayHandler)
+
+class RecordingProxy(_Server):
+    """Proxy to a real pet-server that records every request/response pair."""
+
+    def __init__(self, port: int, upstream_port: int, output: str, host: str = "127.0.0.1"):
+        self.upstream = (host, upstream_port)
+        self.output = output
+        self.lock = threading.Lock()
+        super().__init__((host, port), _RecordHandler)
+
+    def write(self, request: Dict[str, Any], response: Dict[str, Any]):
+        """Append one exchange to the recording."""
+        record = {"method": request.get("method"), "params": request.get("params"),
+                  "response": {k: response[k] for k in ("result", "error") if k in response}}
+        with self.lock, open(self.output, 'a') as file:
+            file.write(json.dumps(record) + "\n")
+
+def replay_stats(port: int, host: str = "127.0.0.1") -> Dict[str, Any]:
+    """Ask a running replay server for its call counters."""
+    with socket.create_connection((host, port)) as sock:
+        _send(sock, {"jsonrpc": "2.0", "id": 0, "method": STATS_METHOD, "params": {}})
+        stream = JsonStream()
+        while True:
+            for response in stream.feed(sock.recv(65536)):
+                return response["result"]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Record or replay pet-server traffic.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    record = sub.add_parser("record", help="Proxy a real pet-server and record its answers")
+    record.add_argument("--port", default=9765, type=int, help="Port the proxy listens on (give it to the steps with --external-pet)")
+    record.add_argument("--upstream-port", default=8765, type=int, help="Port of the real pet-server")
+    record.add_argument("--output", required=True, help="Recording to append to")
+    serve = sub.add_parser("serve", help="Answer requests from recordings")
+    serve.add_argument("--port", default=8765, type=int)
+    serve.add_argument("recordings", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        server = RecordingProxy(args.port, args.upstream_port, args.output)
+    else:
+        server = ReplayServer(args.port, Recording(args.recordings))
+    server.serve_forever()
@@ -1,53 +1,63 @@
-"""Command-line entry point that runs every extraction stage in order."""
+"""Command-line entry point that runs every extraction stage for every library."""
 
 import argparse
 import os
 
-from tqdm import tqdm
-
-from src.config.opam_config import OpamConfig
+from script.scheduler import LibraryScheduler
 from script.steps.step_0_docker import build_image
 from script.steps.step_1_sources import extract_sources
 from script.steps.step_2_metadata import extract_metadata
 from script.steps.step_3_elements import extract_elements
+from script.steps.step_4_dataset import export_dataset
+from script.steps.step_5_views import build_views
+
+STAGES = [
+    ("docker", build_image),
+    ("sources", extract_sources),
+    ("metadata", extract_metadata),
+    ("elements", extract_elements),
+    ("dataset", export_dataset),
+    ("views", build_views),
+]
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Build docker image")
     parser.add_argument("--config-path", default="config/", help="Configuration file path")
     parser.add_argument("--rebuild", default=False, help="Ignore if image already exists")
     parser.add_argument("--port", default=8765, type=int, help="Port used for pet-server")
-    parser.add_argument("--max_memory", default=0.80, type=float)    
+    parser.add_argument("--max_memory", default=0.80, type=float, help="Host memory fraction above which a growing pet-server container is restarted")
+    parser.add_argument("--worker-memory-gb", default=0.0, type=float, help="Memory limit of each pet-server container in steps 2 and 3 (default: --max_memory of the host split over --max-jobs x --workers)")
     parser.add_argument("--toc-timeout", default=5*60, type=int)
     parser.add_argument("--extract-timeout", default=2*60, type=int)
+    parser.add_argument("--min-timeout", default=10, type=int, help="Shortest time limit of a theorem in step 3's first pass")
+    parser.add_argument("--timeout-factor", default=4.0, type=float, help="Step 3 time limit as a multiple of a theorem's estimated cost (0 keeps --extract-timeout)")
     parser.add_argument("--kill-clone", default=False, type=bool)
+    parser.add_argument("--workers", default=1, type=int, help="Number of pet-server workers used in step 3")
+    parser.add_argument("--warm-standby", default=0, type=int, help="Pre-started containers kept ready for failover in steps 2 and 3")
+    parser.add_argument("--replay-mode", default="theorem", choices=["theorem", "file"], help="Proof replay strategy used in step 3")
+    parser.add_argument("--intern-goals", action="store_true", help="Store goals once in <output>_goals in step 3")
+    parser.add_argument("--min-premises", default=1, type=int, help="Skip steps with fewer premises in the exported training set")
+    parser.add_argument("--premise-index", default=None, help="Premise index updated by the dataset stage (default: premise_index next to the outputs)")
+    parser.add_argument("--chunk-lines", default=100, type=int, help="Lines per stored chunk of the read views")
+    parser.add_argument("--max-jobs", default=1, type=int, help="Number of (library, stage) jobs running at once")
+    parser.add_argument("--job-memory-gb", default=0.0, type=float, help="Free RAM required before starting another job")
+    parser.add_argument("--report-every", default=60.0, type=float, help="Seconds between progress reports")
     args = parser.parse_args()
 
-    all_configs = []
-    for config_filename in os.listdir(args.config_path):
-        config_path = os.path.join(args.config_path, config_filename)
-        all_configs.append(OpamConfig.from_yaml(config_path))
-    
-    for config in tqdm(all_configs, desc="Building All Docker Images"):
-        try:
-            build_image(config, **vars(args))
-        except Exception as e:
-            print(f"ignore {config.name}")
-
-    for config in tqdm(all_configs, desc="Extracting All Sources"):
-        try:
-            extract_sources(config, **vars(args))
-        except Exception as e:
-            print(f"ignore {config.name}")
-        
-    
-    for config in tqdm(all_configs, desc="Extracting All Metadata"):
-        try:
-            extract_metadata(config, **vars(args))
-        except Exception as e:
-            print(f"ignore {config.name}")
-
-    for config in tqdm(all_configs, desc="Extracting All Elements"):
-        try:
-            extract_elements(config, **vars(args))
-        except Exception as e:
-            print(f"ignore {config.name}")
+    config_paths = [os.path.join(args.config_path, config_filename) for config_filename in sorted(os.listdir(args.config_path))]
+    stage_kwargs = {k: v for k, v in vars(args).items() if k not in ("config_path", "port", "max_jobs", "job_memory_gb", "report_every")}
+    # Jobs share the host: each pet-server container gets its part of --max_memory.
+    stage_kwargs["jobs"] = args.max_jobs
+    scheduler = LibraryScheduler(
+        config_paths,
+        STAGES,
+        stage_kwargs,
+        max_jobs=args.max_jobs,
+        job_memory_gb=args.job_memory_gb,
+        base_port=args.port,
+        ports_per_job=max(args.workers, 1),
+        report_every=args.report_every,
+    )
+    failed = scheduler.run()
+    for name, stage in failed:
+        print(f"ignore {name} ({stage})")
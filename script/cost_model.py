@@ -0,0 +1,140 @@
+"""Replay-cost estimates of theorems, used to order step 3 and size its timeouts."""
+
+import os
+import statistics
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from script.metrics_report import load_metrics
+
+# Operations that bring pet-server to the start of a proof, not part of the proof itself.
+START_OPS = ("start", "advance")
+
+def proof_lines(theorems: List[Dict[str, Any]]) -> List[int]:
+    """Lines between the end of each theorem's statement and the start of the next theorem.
+
+    An upper bound on the length of its proof, read from the metadata ranges
+    alone. The last theorem of a file gets the median of the others.
+    """
+    order = sorted(range(len(theorems)), key=lambda i: (theorems[i]["range"]["start"]["line"], theorems[i]["range"]["start"]["character"]))
+    sizes = [1] * len(theorems)
+    for i, j in zip(order, order[1:]):
+        sizes[i] = max(1, theorems[j]["range"]["start"]["line"] - theorems[i]["range"]["end"]["line"])
+    if len(order) > 1:
+        sizes[order[-1]] = int(statistics.median(sizes[i] for i in order[:-1]))
+    return sizes
+
+@dataclass
+class TheoremHistory:
+    """Outcome of the earlier replays of one theorem."""
+
+    runs: int = 0
+    failures: int = 0
+    seconds: float = 0.0
+    start: float = 0.0
+
+def load_history(metrics_path: str) -> Dict[Tuple[str, str], TheoremHistory]:
+    """Per `(file, theorem)` replay history, from the theorem scopes of a metrics sidecar."""
+    history: Dict[Tuple[str, str], TheoremHistory] = {}
+    if not os.path.exists(metrics_path):
+        return history
+    _, scopes = load_metrics(metrics_path, stage="elements")
+    for scope in scopes:
+        if scope["kind"] != "theorem":
+            continue
+        record = history.setdefault((scope.get("file", ""), scope["name"]), TheoremHistory())
+        record.runs += 1
+        if scope.get("ok", True):
+            start = sum(scope["ops"].get(op, 0.0) for op in START_OPS)
+            record.seconds = max(record.seconds, scope["total_s"] - start)
+            record.start = max(record.start, start)
+        else:
+            record.failures += 1
+    return history
+
+class CostModel:
+    """Estimated replay time and timeout of each theorem.
+
+    A theorem replayed successfully before costs the time its proof took then
+    (without `start`/`advance`); any other costs `per_line` seconds per line of
+    its proof span, with `per_line` fitted on the theorems that have both. Only
+    theorems with such a timing get an adaptive timeout: `factor` times the
+    estimate plus the slowest start seen in their file, within
+    `[min_timeout, max_timeout]`. The others keep `max_timeout`. A theorem that
+    never succeeded and failed in `max_failures` runs is an offender, left for
+    the final pass.
+    """
+
+    def __init__(self, history: Optional[Dict[Tuple[str, str], TheoremHistory]] = None, factor: float = 4.0,
+                 min_timeout: float = 10.0, max_timeout: float = 120.0, max_failures: int = 2, per_line: float = 0.5):
+        self.history = history or {}
+        self.factor = factor
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.max_failures = max_failures
+        self.per_line = per_line
+        self.start_cost: Dict[str, float] = {}
+        for (file, _), record in self.history.items():
+            self.start_cost[file] = max(self.start_cost.get(file, 0.0), record.start)
+
+    def fit(self, sizes: Iterable[Tuple[Tuple[str, str], int]]):
+        """Set `per_line` to the median time per line of the known theorems among `(key, lines)`."""
+        ratios = [self.history[key].seconds / lines for key, lines in sizes
+                  if lines and key in self.history and self.history[key].seconds > 0]
+        if ratios:
+            self.per_line = statistics.median(ratios)
+
+    def known(self, key: Tuple[str, str]) -> bool:
+        """Whether the theorem was replayed successfully before."""
+        record = self.history.get(key)
+        return record is not None and record.seconds > 0
+
+    def estimate(self, key: Tuple[str, str], lines: int) -> float:
+        """Expected proof replay time in seconds."""
+        if self.known(key):
+            return self.history[key].seconds
+        return self.per_line * max(lines, 1)
+
+    def timeout(self, key: Tuple[str, str], estimate: float) -> float:
+        """Time limit of a first-pass replay."""
+        if not self.factor or not self.known(key):
+            return self.max_timeout
+        limit = self.factor * estimate + self.start_cost.get(key[0], 0.0)
+        return min(self.max_timeout, max(self.min_timeout, limit))
+
+    def offender(self, key: Tuple[str, str]) -> bool:
+        """Whether the theorem kept failing in earlier runs."""
+        record = self.history.get(key)
+        return record is not None and not record.seconds and record.failures >= self.max_failures
+
+    def schedule(self, files: Iterable[Tuple[Any, List[Dict[str, Any]], List[int]]], per_file: bool = False) -> Tuple[List[tuple], List[tuple]]:
+        """Split the `todo` theorems of `(ref, theorems, todo)` files into a first pass and a final pass.
+
+        `ref` locates the file (e.g. the offset of its metadata entry) and
+        `todo` lists the indices of its theorems left to replay. Only the keys
+        and sizes of those are kept, not the entries. The result is made of
+        `(ref, indices, timeouts)` tasks, the first pass longest first. In
+        `per_file` mode a file keeps its theorems in document order (minus
+        the offenders) and costs their sum. Final-pass tasks hold the
+        offenders, with `max_timeout`.
+        """
+        planned = []
+        for ref, theorems, todo in files:
+            sizes = proof_lines(theorems)
+            planned.append((ref, [(i, (theorems[i]["origin"], theorems[i]["name"]), sizes[i]) for i in todo]))
+        self.fit((key, lines) for _, sized in planned for _, key, lines in sized)
+
+        first, final = [], []
+        for ref, sized in planned:
+            normal = [(i, self.estimate(key, lines), key) for i, key, lines in sized if not self.offender(key)]
+            offenders = [i for i, key, _ in sized if self.offender(key)]
+            groups = [normal] if per_file else [[item] for item in normal]
+            for group in groups:
+                if group:
+                    cost = sum(estimate for _, estimate, _ in group)
+                    first.append((cost, (ref, [i for i, _, _ in group], [self.timeout(key, estimate) for _, estimate, key in group])))
+            for group in ([offenders] if per_file else [[i] for i in offenders]):
+                if group:
+                    final.append((ref, group, [self.max_timeout] * len(group)))
+        first.sort(key=lambda item: -item[0])
+        return [task for _, task in first], final
@@ -0,0 +1,88 @@
+"""Summarize a `<output>_metrics.jsonl` tracing sidecar."""
+
+import argparse
+import json
+from typing import Any, Dict, List, Optional
+
+from src.parser.metrics import BOUNDS_MS
+
+def load_metrics(path: str, stage: Optional[str] = None):
+    """Return the last snapshot of every run plus every closed scope."""
+    snapshots: Dict[str, Dict[str, Any]] = {}
+    scopes: List[Dict[str, Any]] = []
+    with open(path, 'r') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if stage and record.get("stage") != stage:
+                continue
+            if record["kind"] == "snapshot":
+                snapshots[record["run_id"]] = record
+            else:
+                scopes.append(record)
+    return list(snapshots.values()), scopes
+
+def merge_ops(snapshots: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Sum operation stats over runs and workers."""
+    ops: Dict[str, Dict[str, Any]] = {}
+    for snapshot in snapshots:
+        for op, stats in snapshot["ops"].items():
+            merged = ops.setdefault(op, {"count": 0, "total_s": 0.0, "max_s": 0.0, "hist": [0] * len(stats["hist"])})
+            merged["count"] += stats["count"]
+            merged["total_s"] += stats["total_s"]
+            merged["max_s"] = max(merged["max_s"], stats["max_s"])
+            merged["hist"] = [a + b for a, b in zip(merged["hist"], stats["hist"])]
+    return ops
+
+def percentile_ms(hist: List[int], q: float) -> float:
+    """Upper bound (ms) of the histogram bucket holding the `q` quantile."""
+    total = sum(hist)
+    if not total:
+        return 0.0
+    seen = 0
+    for i, count in enumerate(hist):
+        seen += count
+        if seen >= q * total:
+            return BOUNDS_MS[i] if i < len(BOUNDS_MS) else float("inf")
+    return float("inf")
+
+def merge_counters(snapshots: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Sum counters (restarts, cache hits...) over runs and workers."""
+    counters: Dict[str, int] = {}
+    for snapshot in snapshots:
+        for name, value in snapshot["counters"].items():
+            counters[name] = counters.get(name, 0) + value
+    return counters
+
+def print_report(path: str, top: int = 10, stage: Optional[str] = None):
+    """Print the cost breakdown by operation and the slowest files/theorems."""
+    snapshots, scopes = load_metrics(path, stage)
+    ops = merge_ops(snapshots)
+    grand_total = sum(stats["total_s"] for stats in ops.values()) or 1.0
+    print(f"{'operation':<20}{'count':>10}{'total s':>12}{'share':>8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for op, stats in sorted(ops.items(), key=lambda item: -item[1]["total_s"]):
+        mean = 1000 * stats["total_s"] / max(stats["count"], 1)
+        print(f"{op:<20}{stats['count']:>10}{stats['total_s']:>12.1f}{stats['total_s'] / grand_total:>8.1%}{mean:>10.1f}"
+              f"{percentile_ms(stats['hist'], 0.5):>10.1f}{percentile_ms(stats['hist'], 0.95):>10.1f}{1000 * stats['max_s']:>10.1f}")
+    counters = merge_counters(snapshots)
+    if counters:
+        print("\ncounters: " + ", ".join(f"{name}={value}" for name, value in sorted(counters.items())))
+    for kind in ("file", "theorem"):
+        selected = sorted((scope for scope in scopes if scope["kind"] == kind), key=lambda scope: -scope["total_s"])[:top]
+        if not selected:
+            continue
+        print(f"\nslowest {kind}s:")
+        for scope in selected:
+            breakdown = ", ".join(f"{op}={seconds:.1f}s" for op, seconds in sorted(scope["ops"].items(), key=lambda item: -item[1])[:4])
+            status = "" if scope.get("ok", True) else " [failed]"
+            where = f" ({scope['file']})" if "file" in scope else ""
+            print(f"  {scope['total_s']:>9.1f}s  {scope['name']}{where}{status}: {breakdown}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Summarize extraction metrics.")
+    parser.add_argument("--metrics", required=True, help="Path to a <output>_metrics.jsonl file")
+    parser.add_argument("--top", default=10, type=int, help="Number of slowest files/theorems to list")
+    parser.add_argument("--stage", default=None, choices=["metadata", "elements"], help="Only report one stage")
+    args = parser.parse_args()
+    print_report(args.metrics, top=args.top, stage=args.stage)
@@ -0,0 +1,163 @@
+"""Run the extraction stages of many libraries concurrently."""
+
+import multiprocessing as mp
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import psutil
+
+from src.config.opam_config import OpamConfig
+from script.segments import manifest_count
+
+@dataclass
+class Library:
+    """One configuration going through the stages, in order."""
+
+    config_path: str
+    config: OpamConfig
+    stage: int = 0
+    started: Optional[float] = None
+    stage_started: Optional[float] = None
+    failed: List[str] = field(default_factory=list)
+
+def _run_stage(stage_fn: Callable, config_path: str, kwargs: Dict[str, Any], log_path: Optional[str]):
+    """Child process: run one stage of one library, logging to its own file."""
+    if log_path:
+        os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+        log = open(log_path, 'a', buffering=1)
+        sys.stdout = sys.stderr = log
+    config = OpamConfig.from_yaml(config_path)
+    try:
+        stage_fn(config, **kwargs)
+    except Exception as e:
+        print(f"ignore {config.name}: {e}")
+        sys.exit(1)
+
+class LibraryScheduler:
+    """Schedule `(library, stage)` jobs as a dependency graph under a resource budget.
+
+    A library's stage `k + 1` starts as soon as its stage `k` finishes (failed
+    stages are reported and the library moves on, as `all_steps.py` always
+    did). At most `max_jobs` jobs run at once and a new one is only launched
+    when `job_memory_gb` of RAM is available. Every running job owns a slot,
+    which gives it a distinct block of `ports_per_job` pet-server ports.
+    """
+
+    def __init__(self, config_paths: Sequence[str], stages: Sequence[Tuple[str, Callable]], stage_kwargs: Dict[str, Any],
+                 max_jobs: int = 1, job_memory_gb: float = 0.0, base_port: int = 8765, ports_per_job: int = 1,
+                 report_every: float = 30.0, log: bool = True):
+        self.libraries = [Library(path, OpamConfig.from_yaml(path)) for path in config_paths]
+        self.stages = list(stages)
+        self.stage_kwargs = stage_kwargs
+        self.max_jobs = max_jobs
+        self.job_memory_gb = job_memory_gb
+        self.base_port = base_port
+        self.ports_per_job = ports_per_job
+        self.report_every = report_every
+        self.log = log
+        self.ctx = mp.get_context("fork")
+        self.free_slots = list(range(max_jobs))
+        self.running: Dict[int, Tuple[Library, mp.Process, int]] = {}
+        self.durations: Dict[str, List[float]] = {name: [] for name, _ in self.stages}
+
+    def _can_launch(self) -> bool:
+        """Whether the CPU/RAM budget allows one more job."""
+        if not self.free_slots:
+            return False
+        if self.job_memory_gb and self.running:
+            return psutil.virtual_memory().available >= self.job_memory_gb * 2**30
+        return True
+
+    def _launch(self, library: Library):
+        """Start the next stage of `library` in its own process."""
+        name, stage_fn = self.stages[library.stage]
+        slot = self.free_slots.pop(0)
+        kwargs = dict(self.stage_kwargs, port=self.base_port + slot * self.ports_per_job, new_config_path=library.config_path)
+        log_path = f"{library.config.output}_{name}.log" if self.log else None
+        process = self.ctx.Process(target=_run_stage, args=(stage_fn, library.config_path, kwargs, log_path), daemon=False)
+        now = time.time()
+        library.started = library.started or now
+        library.stage_started = now
+        process.start()
+        self.running[process.pid] = (library, process, slot)
+
+    def _reap(self):
+        """Collect finished jobs and advance their libraries."""
+        for pid, (library, process, slot) in list(self.running.items()):
+            if process.is_alive():
+                continue
+            process.join()
+            del self.running[pid]
+            self.free_slots.append(slot)
+            name, _ = self.stages[library.stage]
+            self.durations[name].append(time.time() - library.stage_started)
+            if process.exitcode != 0:
+                library.failed.append(name)
+                print(f"ignore {library.config.name} ({name})")
+            library.stage += 1
+
+    def _mean_duration(self, stage: int) -> Optional[float]:
+        """Average duration of a stage over the jobs finished so far."""
+        values = self.durations[self.stages[stage][0]]
+        return sum(values) / len(values) if values else None
+
+    def _eta(self, library: Library) -> Optional[float]:
+        """Remaining time of a library from the mean duration of each remaining stage."""
+        eta = 0.0
+        for stage in range(library.stage, len(self.stages)):
+            mean = self._mean_duration(stage)
+            if mean is None:
+                return None
+            eta += mean
+        if library.stage_started and library.stage < len(self.stages):
+            eta -= min(time.time() - library.stage_started, self._mean_duration(library.stage))
+        return eta
+
+    def _records(self, library: Library) -> Optional[int]:
+        """Entries written so far by the running stage: compacted ones (resume sidecar) plus committed segments."""
+        name = self.stages[library.stage][0]
+        output = f"{library.config.output}_{name}.jsonl"
+        sidecar = output + '.uids'
+        committed = manifest_count(output)
+        if committed is None and not os.path.exists(sidecar):
+            return None
+        return (os.path.getsize(sidecar) // 16 if os.path.exists(sidecar) else 0) + (committed or 0)
+
+    def report(self):
+        """Print one progress line per running library plus an overall ETA."""
+        done = sum(library.stage >= len(self.stages) for library in self.libraries)
+        print(f"[scheduler] {done}/{len(self.libraries)} libraries done, {len(self.running)} jobs running")
+        for library, _, _ in self.running.values():
+            elapsed = time.time() - library.stage_started
+            records = self._records(library)
+            rate = f"{records / max(elapsed, 1e-9):.2f} entries/s" if records is not None else "-"
+            eta = self._eta(library)
+            eta = f"{eta / 60:.1f} min" if eta is not None else "?"
+            print(f"  {library.config.name}: {self.stages[library.stage][0]} for {elapsed / 60:.1f} min, {rate}, ETA {eta}")
+        remaining = [self._eta(library) for library in self.libraries if library.stage < len(self.stages)]
+        if remaining and all(eta is not None for eta in remaining):
+            print(f"  overall ETA {sum(remaining) / self.max_jobs / 60:.1f} min")
+
+    def run(self):
+        """Run every stage of every library, returning the failed `(library, stage)` pairs."""
+        last_report = 0.0
+        while True:
+            self._reap()
+            busy = {library.config_path for library, _, _ in self.running.values()}
+            ready = [library for library in self.libraries if library.stage < len(self.stages) and library.config_path not in busy]
+            if not ready and not self.running:
+                break
+            # Libraries further along the pipeline first, so outputs complete early.
+            for library in sorted(ready, key=lambda library: -library.stage):
+                if not self._can_launch():
+                    break
+                self._launch(library)
+            if time.time() - last_report >= self.report_every:
+                self.report()
+                last_report = time.time()
+            time.sleep(0.2)
+        self.report()
+        return [(library.config.name, name) for library in self.libraries for name in library.failed]
@@ -0,0 +1,213 @@
+"""Crash-safe JSONL output written as segment files by any number of processes."""
+
+import fcntl
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+from script.utils import ResumeIndex
+
+MANIFEST = "manifest.jsonl"
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def manifest_count(output: str) -> Optional[int]:
+    """UIDs committed to the segments of `output` since its last compaction (`None` without segments).
+
+    Reads the manifest without taking the lock, e.g. for progress reports from
+    another process; a torn last record is not counted.
+    """
+    path = os.path.join(output + '.segments', MANIFEST)
+    if not os.path.exists(path):
+        return None
+    count = 0
+    with open(path, 'rb') as file:
+        file.readline()
+        for line in file:
+            if line.endswith(b"\n"):
+                count += len(json.loads(line)["uids"])
+    return count
+
+class SegmentStore:
+    """Drop-in replacement for `ResumeIndex` that never leaves a torn entry behind.
+
+    Entries are buffered and written as segment files under `<output>.segments/`.
+    A segment is fsynced under a temporary name, then renamed and recorded with
+    the digests of its UIDs in an append-only manifest, both under a file lock
+    shared by all writers. A killed writer loses at most its buffer, which the
+    next run redoes. `compact` appends the committed segments to `output`
+    (through a `ResumeIndex`, which repairs a torn tail), skipping UIDs already
+    there, so a compaction interrupted at any point can simply be run again.
+    """
+
+    def __init__(self, uid_generator: Callable[[Dict], str], output: str, max_bytes: int = 8 * 2**20, flush_interval: float = 30.0):
+        self.uid_generator = uid_generator
+        self.output = output
+        self.root = output + '.segments'
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.writer = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.seq = 0
+        self.buffer: List[bytes] = []
+        self.buffer_digests: List[int] = []
+        self.buffer_bytes = 0
+        self.buffer_since = None
+        self.segments: Dict[str, List[int]] = {}
+        self.digests = set()
+        self.manifest_offset = 0
+        self.generation = None
+        self.created = None
+        self.base = None
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock():
+            self._refresh()
+            self._adopt_orphans()
+
+    @contextmanager
+    def _lock(self):
+        """Exclusive lock shared by every process writing to this output."""
+        with open(os.path.join(self.root, ".lock"), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def _refresh(self):
+        """Read the manifest records committed since the last call (lock held).
+
+        Each compaction starts a manifest with a new generation in its first
+        line; seeing one means the output grew and its index is reloaded.
+        """
+        path = os.path.join(self.root, MANIFEST)
+        if self.base is None:
+            self.base = ResumeIndex(self.uid_generator, self.output)
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb') as file:
+            header = file.readline()
+            if not header.endswith(b"\n"):
+                return
+            generation = json.loads(header)["generation"]
+            if generation != self.generation:
+                if generation != self.created:
+                    self.base = ResumeIndex(self.uid_generator, self.output)
+                self.segments, self.manifest_offset, self.generation = {}, len(header), generation
+                self.digests = set(self.buffer_digests)
+            file.seek(self.manifest_offset)
+            for line in file:
+                if not line.endswith(b"\n"):
+                    break
+                self.manifest_offset += len(line)
+                record = json.loads(line)
+                self.segments[record["segment"]] = record["uids"]
+                self.digests.update(record["uids"])
+
+    def _commit(self, name: str, digests: List[int]):
+        """Record a renamed segment in the manifest (lock held)."""
+        path = os.path.join(self.root, MANIFEST)
+        if not os.path.exists(path):
+            self.created = self._new_manifest()
+        with open(path, 'ab') as file:
+            size = file.tell()
+            if size:
+                with open(path, 'rb') as reader:
+                    reader.seek(size - 1)
+                    if reader.read(1) != b"\n":
+                        # A writer died mid-record: drop the torn tail.
+                        reader.seek(0)
+                        file.truncate(reader.read().rfind(b"\n") + 1)
+            file.write((json.dumps({"segment": name, "uids": digests}) + "\n").encode('utf-8'))
+            file.flush()
+            os.fsync(file.fileno())
+        self._refresh()
+
+    def _new_manifest(self):
+        """Atomically replace the manifest by an empty one of a new generation, returned (lock held)."""
+        generation = uuid.uuid4().hex
+        tmp = os.path.join(self.root, f".tmp-{MANIFEST}")
+        with open(tmp, 'wb') as file:
+            file.write((json.dumps({"generation": generation}) + "\n").encode('utf-8'))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp, os.path.join(self.root, MANIFEST))
+        return generation
+
+    def _adopt_orphans(self):
+        """Record segments renamed by a writer that died before updating the manifest (lock held)."""
+        for name in sorted(os.listdir(self.root)):
+            if name.startswith("seg-") and name not in self.segments:
+                with open(os.path.join(self.root, name), 'rb') as file:
+                    digests = [ResumeIndex.digest(self.uid_generator(json.loads(line))) for line in file if line.strip()]
+                self._commit(name, digests)
+
+    def __contains__(self, uid: str) -> bool:
+        digest = ResumeIndex.digest(uid)
+        return digest in self.digests or digest in self.base.digests
+
+    def __len__(self) -> int:
+        return len(self.digests | self.base.digests)
+
+    def append(self, entry: Dict):
+        """Buffer `entry`, writing a segment once the buffer is full or old enough."""
+        line = (json.dumps(entry) + "\n").encode('utf-8')
+        digest = ResumeIndex.digest(self.uid_generator(entry))
+        if not self.buffer:
+            self.buffer_since = time.monotonic()
+        self.buffer.append(line)
+        self.buffer_digests.append(digest)
+        self.buffer_bytes += len(line)
+        self.digests.add(digest)
+        if self.buffer_bytes >= self.max_bytes or time.monotonic() - self.buffer_since >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write the buffer as a new segment and commit it."""
+        if not self.buffer:
+            return
+        name = f"seg-{self.writer}-{self.seq:06d}.jsonl"
+        tmp = os.path.join(self.root, f".tmp-{name}")
+        with open(tmp, 'wb') as file:
+            file.write(b"".join(self.buffer))
+            file.flush()
+            os.fsync(file.fileno())
+        with self._lock():
+            os.replace(tmp, os.path.join(self.root, name))
+            self._commit(name, self.buffer_digests)
+        self.seq += 1
+        self.buffer, self.buffer_digests, self.buffer_bytes = [], [], 0
+
+    def compact(self):
+        """Append every committed segment to `output` and start an empty manifest."""
+        self.flush()
+        with self._lock():
+            self._refresh()
+            for name, digests in self.segments.items():
+                path = os.path.join(self.root, name)
+                if not os.path.exists(path):
+                    continue
+                with open(path, 'rb') as file:
+                    lines = [line for line in file if line.strip()]
+                # Synced before the manifest is reset and the segment removed, its only other copy.
+                self.base.extend([(line, digest) for line, digest in zip(lines, digests) if digest not in self.base.digests], sync=True)
+            self._new_manifest()
+            for name in os.listdir(self.root):
+                if name.startswith("seg-") and name in self.segments:
+                    os.remove(os.path.join(self.root, name))
+                elif name.startswith(".tmp-seg-") and not _pid_alive(int(name.split("-")[2])):
+                    os.remove(os.path.join(self.root, name))
+            self._refresh()
+
+    def close(self, compact: bool = True):
+        """Flush the buffer and, unless told otherwise, compact."""
+        if compact:
+            self.compact()
+        else:
+            self.flush()
@@ -3,14 +3,16 @@
 import argparse
 import os
 import json
+import time
 from dataclasses import asdict
 import yaml
 from tqdm import tqdm
 
 from src.parser.opam_docker import OpamDocker
 from src.config.opam_config import OpamConfig
+from src.store.blob_store import BlobStore
 
-def extract_sources(config: OpamConfig, new_config_path: str, port: int=8765, kill_clone=False, **_):
+def extract_sources(config: OpamConfig, new_config_path: str, port: int=8765, kill_clone=False, export_mode="archive", blob_store=False, **_):
     """Dump every `.v` file of the target OPAM packages into JSONL."""
     opam_docker = OpamDocker(config, kill_clone=kill_clone)
     opam_docker.start_pet(port)
@@ -34,13 +36,27 @@ def extract_sources(config: OpamConfig, new_config_path: str, port: int=8765, ki
         pass
 
 
-    for package_name in tqdm(config.packages, desc="Libraries", leave=False):
-        lib = opam_docker.extract_files(package_name, config.info_path)
-        for filepath in tqdm(lib['subfiles'], desc="Files", position=1, leave=False):
-            source = opam_docker.get_source(filepath)
-            with open(output_sources, 'a') as file:
-                new_entry = {"library": lib, "source": source.to_dict()}
-                file.write(json.dumps(new_entry) + "\n")
+    store = BlobStore.for_output(config.output, create=True) if blob_store else None
+    start, n_files = time.perf_counter(), 0
+    if export_mode == "archive":
+        with open(output_sources, 'w') as file:
+            for package_name in tqdm(config.packages, desc="Libraries", leave=False):
+                lib = opam_docker.extract_files(package_name, config.info_path)
+                for source in opam_docker.export_sources(lib):
+                    new_entry = {"library": lib, "source": source.to_dict(store)}
+                    file.write(json.dumps(new_entry) + "\n")
+                    n_files += 1
+    else:
+        for package_name in tqdm(config.packages, desc="Libraries", leave=False):
+            lib = opam_docker.extract_files(package_name, config.info_path)
+            for filepath in tqdm(lib['subfiles'], desc="Files", position=1, leave=False):
+                source = opam_docker.get_source(filepath)
+                with open(output_sources, 'a') as file:
+                    new_entry = {"library": lib, "source": source.to_dict(store)}
+                    file.write(json.dumps(new_entry) + "\n")
+                n_files += 1
+    elapsed = time.perf_counter() - start
+    print(f"Exported {n_files} files in {elapsed:.1f}s ({n_files / max(elapsed, 1e-9):.1f} files/s, {export_mode} mode)")
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Parse libraries.")
@@ -48,6 +64,8 @@ if __name__ == '__main__':
     parser.add_argument("--new-config-path", default="config/coq-actuary.yaml", help="New configuration file path")
     parser.add_argument("--port", default=8765, type=int, help="Port used for pet-server")
     parser.add_argument("--kill-clone", default=True, type=bool, help="Only authorized one container to be bound to the image.")
+    parser.add_argument("--export-mode", default="archive", choices=["archive", "exec"], help="'archive' streams each package in one tar archive, 'exec' reads files one `docker exec` at a time")
+    parser.add_argument("--blob-store", action="store_true", help="Keep source texts in <output>_blobs and only their hash in the JSONL outputs")
     args = parser.parse_args()
 
     config = OpamConfig.from_yaml(args.config_path)
@@ -1,62 +1,85 @@
 """Step 2: enrich sources with load paths and theorem metadata."""
 
 import argparse
-import json
 from dataclasses import asdict
 from functools import partial
+from pytanque import PetanqueError
 from tqdm import tqdm
 
 from src.config.opam_config import OpamConfig
-from src.parser.opam_docker import OpamDocker
+from src.parser.warm_pool import WarmPool, standby_ports
 from src.parser.tiny_rocq_parser import TinyRocqParser, Source
-from script.utils import extract_done, uid_metadata, ram_used_frac, restart_docker, time_limit
+from src.store.blob_store import BlobStore
+from src.parser.metrics import Metrics
+from src.parser.memory_controller import MemoryController
+from src.parser.resolution_cache import ResolutionCache
+from script.segments import SegmentStore
+from script.utils import Recovery, iter_sources, uid_metadata, time_limit, metrics_path, report_stats, start_pet_server
 
-def extract_metadata(config: OpamConfig, port: int=8765, kill_clone=False, toc_timeout=5*60, extract_timeout=2*60, max_memory=0.8, **_):
+def locate_cache_path(config: OpamConfig) -> str:
+    """Path of the persisted load path and `Locate` answers of a library."""
+    return config.output + '_locate_cache.json'
+
+def extract_metadata(config: OpamConfig, port: int=8765, kill_clone=False, toc_timeout=5*60, extract_timeout=2*60, max_memory=0.8, warm_standby=0, external_pet=False, worker_memory_gb=0.0, jobs=1, **_):
     """Collect metadata for each source, including ToC and load path."""
-    opam_docker = OpamDocker(config, kill_clone=kill_clone)
-    opam_docker.start_pet(port)
-    tiny_parser = TinyRocqParser(port)
+    opam_docker = start_pet_server(config, port, kill_clone=kill_clone, external_pet=external_pet)
+    tiny_parser = TinyRocqParser(port, metrics=Metrics(metrics_path(config), stage="metadata"), locate_cache=ResolutionCache(locate_cache_path(config), autosave=100))
+    warm_pool = WarmPool(config, standby_ports(port, warm_standby)) if warm_standby else None
+    recovery = Recovery(config, tiny_parser, kill_clone=kill_clone, session_errors=(PetanqueError, AssertionError), warm_pool=warm_pool, metrics=tiny_parser.metrics)
+    memory = MemoryController.for_workers(1, max_memory, worker_memory_gb, jobs).start(opam_docker)
 
-    output_sources = config.output + '_sources.jsonl' 
     output_metadata = config.output + '_metadata.jsonl'
+    store = BlobStore.for_output(config.output)
     
-    done = extract_done(uid_metadata, output_metadata)
+    done = SegmentStore(uid_metadata, output_metadata)
 
-    sources_file = open(output_sources, 'r')
-    for line in tqdm(sources_file.readlines()):
-        entry = json.loads(line)
+    for entry in tqdm(iter_sources(config.output)):
         library = entry['library']
-        source = Source.from_dict(entry['source'])
-        filepath = source.path
-        if ram_used_frac() > max_memory:
-            print("Reset memory")
-            opam_docker = restart_docker(opam_docker, config, port, kill_clone=kill_clone)
+        source = Source.from_dict(entry['source'], store)
+        reason = memory.restart_reason()
+        if reason is not None:
+            print(f"Reset memory: {reason}")
+            tiny_parser.metrics.count("memory_restart")
+            opam_docker = recovery(opam_docker, tier="pet")
+            memory.watch(opam_docker)
         
-        if filepath in done:
+        if str(source.path) in done:
             continue
         try:
-            with time_limit(toc_timeout, "extract_proof"):
-                theorems = tiny_parser.extract_toc(source)
-
-            with time_limit(extract_timeout, "extract_proof"):
-                if theorems:
-                    loadpath, dependencies = tiny_parser.extract_dependencies(source, theorems)
-                    new_entry = {"library": library, "source": source.to_dict(), "loadpath": loadpath, "dependencies": dependencies, "theorems": [asdict(thm) for thm in theorems]}
-                    with open(output_metadata, 'a') as file:
-                        file.write(json.dumps(new_entry) + "\n")
+            with tiny_parser.metrics.scope("file", str(source.path)):
+                with time_limit(toc_timeout, "extract_proof"):
+                    theorems = tiny_parser.extract_toc(source)
+
+                with time_limit(extract_timeout, "extract_proof"):
+                    if theorems:
+                        loadpath, dependencies = tiny_parser.extract_dependencies(source, theorems)
+                        new_entry = {"library": library, "source": source.to_dict(store), "loadpath": loadpath, "dependencies": dependencies, "theorems": [asdict(thm) for thm in theorems]}
+                        with tiny_parser.metrics.timer("write"):
+                            done.append(new_entry)
         except Exception as e:
             print(f"WARNING: {e}")
-            opam_docker = restart_docker(opam_docker, config, port, kill_clone=kill_clone)
+            opam_docker = recovery(opam_docker, e)
+            memory.watch(opam_docker)
             continue
+    done.close()
+    memory.close()
+    tiny_parser.metrics.set_info("memory", memory.stats())
+    tiny_parser.locate_cache.save()
+    report_stats(tiny_parser, recovery)
+    if warm_pool is not None:
+        warm_pool.close()
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Parse libraries.")
     parser.add_argument("--config-path", default="config/coq-actuary.yaml", help="Config file for extraction")
     parser.add_argument("--port", default=8765, type=int, help="Port used for pet-server")
-    parser.add_argument("--max_memory", default=0.80, type=float)    
+    parser.add_argument("--max_memory", default=0.80, type=float, help="Host memory fraction above which a growing pet-server container is restarted")
+    parser.add_argument("--worker-memory-gb", default=0.0, type=float, help="Memory limit of the pet-server container (default: --max_memory of the host)")
     parser.add_argument("--toc-timeout", default=5*60, type=int)
     parser.add_argument("--extract-timeout", default=2*60, type=int)
     parser.add_argument("--kill-clone", default=False, type=bool)
+    parser.add_argument("--warm-standby", default=0, type=int, help="Number of pre-started containers kept ready for failover")
+    parser.add_argument("--external-pet", action="store_true", help="Use the pet-server already listening on --port instead of starting a container")
     args = parser.parse_args()
 
     config = OpamConfig.from_yaml(args.config_path)
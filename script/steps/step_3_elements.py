@@ -1,56 +1,251 @@
 """Step 3: replay proofs to capture goals, steps, and dependencies."""
 
 import argparse
-import json
 from dataclasses import asdict
+from itertools import chain
+from typing import Optional
+
+import docker
+from pytanque import PetanqueError
 from tqdm import tqdm
 
 from src.config.opam_config import OpamConfig
 from src.parser.opam_docker import OpamDocker
-from src.parser.tiny_rocq_parser import TinyRocqParser, Element, Source
-from script.utils import extract_done, uid_theorem, ram_used_frac, restart_docker, time_limit
+from src.parser.warm_pool import WarmPool, standby_ports
+from src.parser.tiny_rocq_parser import TinyRocqParser, FileReplay, Element, Source, ProofNotFound
+from src.parser.resolution_cache import ResolutionCache
+from src.parser.metrics import Metrics
+from src.parser.memory_controller import MemoryController
+from src.parser.state_cache import StateCache
+from src.store.blob_store import BlobStore
+from src.store.goal_table import GoalTable
+from script.cost_model import CostModel, load_history
+from script.segments import SegmentStore
+from script.utils import Recovery, iter_jsonl_offsets, read_jsonl_at, uid_theorem, time_limit, metrics_path, report_stats, start_pet_server
+from script.worker_pool import WorkerPool, worker_loop, report_container
 
-def extract_elements(config: OpamConfig, port: int=8765, kill_clone=False, extract_timeout=2*60, max_memory=0.8, **_):
-    """Replay proofs for each theorem and capture all proof steps."""
-    opam_docker = OpamDocker(config, kill_clone=kill_clone)
-    opam_docker.start_pet(port)
-    tiny_parser = TinyRocqParser(port)
+# Files whose `Source` a worker keeps, so their theorems do not rebuild it.
+SOURCE_CACHE_SIZE = 64
 
-    output_elements = config.output + '_elements.jsonl' 
-    output_metadata = config.output + '_metadata.jsonl'
-    
-    done = extract_done(uid_theorem, output_elements)
-
-    sources_file = open(output_metadata, 'r')
-    for line in tqdm(sources_file.readlines()):
-        entry = json.loads(line)
-        theorems = [Element.from_dict(thm) for thm in entry['theorems']]
-        source = Source.from_dict(entry['source'])
-        library = entry['library']
-        for theorem in tqdm(theorems, desc="Elements", position=1, leave=False):
-            if ram_used_frac() > max_memory:
-                print("RESET MEMORY")
-                opam_docker = restart_docker(opam_docker, config, port, kill_clone=kill_clone)
-            if uid_theorem(theorem) in done:
-                continue
+def replay_theorem(replay: FileReplay, library, theorem: Element, extract_timeout=2*60, source_ref=None, goal_table: Optional[GoalTable]=None):
+    """Replay one theorem and return its `_elements.jsonl` entry (goals as ids with a `goal_table`)."""
+    metrics = replay.parser.metrics
+    with metrics.scope("theorem", theorem.name, file=theorem.origin), time_limit(extract_timeout, "extract_proof"):
+        steps = replay(theorem)
+        with metrics.timer("serialize"):
+            serialized = goal_table.intern_steps(steps) if goal_table is not None else [asdict(step) for step in steps]
+            new_entry = {"library": library, "theorem": asdict(theorem), "steps": serialized}
+        if source_ref is not None:
+            new_entry["source"] = source_ref
+        return new_entry
+
+def about_cache_path(config: OpamConfig) -> str:
+    """Location of the `About` resolution cache of a library image."""
+    return config.output + '_about_cache.json'
+
+def make_recovery(config: OpamConfig, port: int, tiny_parser: TinyRocqParser, kill_clone=False, warm_standby=0) -> Recovery:
+    """Tiered recovery where Coq-side failures only reset the session."""
+    warm_pool = WarmPool(config, standby_ports(port, warm_standby)) if warm_standby else None
+    return Recovery(config, tiny_parser, kill_clone=kill_clone, session_errors=(PetanqueError, AssertionError), warm_pool=warm_pool, metrics=tiny_parser.metrics)
+
+def iter_files(output: str, done: SegmentStore):
+    """Yield `(offset, theorems, todo)` for the metadata entries with theorems not yet extracted.
+
+    `offset` locates the entry in `<output>_metadata.jsonl` and `todo` lists
+    the indices of its remaining theorems.
+    """
+    for offset, entry in iter_jsonl_offsets(output + '_metadata.jsonl'):
+        todo = [i for i, thm in enumerate(entry['theorems']) if uid_theorem(Element.from_dict(thm)) not in done]
+        if todo:
+            yield offset, entry['theorems'], todo
+
+def load_tasks(output: str, plan, store: Optional[BlobStore] = None):
+    """Turn `(offset, indices, timeouts)` plan items into `(library, source, theorems, modules, timeouts)` tasks.
+
+    A metadata entry is read when its task comes up and kept while the next
+    items share its offset, so only the plan stays in memory. With a blob
+    store, the source is sent as a `{"path", "hash"}` reference that workers
+    resolve once per file (see `load_source`).
+    """
+    cached_offset, entry = None, None
+    with open(output + '_metadata.jsonl', 'rb') as file:
+        for offset, indices, timeouts in plan:
+            if offset != cached_offset:
+                entry = read_jsonl_at(file, offset)
+                if store is not None and 'content' in entry['source']:
+                    entry['source'] = Source.from_dict(entry['source']).to_dict(store)
+                cached_offset = offset
+            yield entry['library'], entry['source'], [entry['theorems'][i] for i in indices], entry['dependencies'], timeouts
+
+def passes(output: str, first, final, retries, store: Optional[BlobStore] = None):
+    """`(name, tasks, count)` of the first and final passes; `retries` is filled during the first."""
+    yield "Elements", load_tasks(output, first, store), len(first)
+    yield "Elements (final pass)", chain(load_tasks(output, final, store), retries), len(final) + len(retries)
+
+def load_source(source_dict, store, sources: Optional[StateCache] = None):
+    """`Source` of a task and its reference for the elements (`None` without a blob store), built once per file with `sources`."""
+    def build():
+        source = Source.from_dict(source_dict, store)
+        return source, (source.to_dict(store) if store is not None else None)
+    if sources is None:
+        return build()
+    return sources.get_or_create((str(source_dict['path']), source_dict.get('hash')), build)[0]
+
+def _container_id(opam_docker):
+    """Id of the container to clean up if the worker dies (none for an external pet-server)."""
+    return opam_docker.container.id if opam_docker.container is not None else None
+
+def replay_task(task, tiny_parser: TinyRocqParser, store, goal_table, restart, memory: MemoryController, replay_mode="theorem", max_timeout=2*60, label="", sources: Optional[StateCache] = None):
+    """Replay the theorems of a `(library, source, theorems, modules, timeouts)` task.
+
+    Returns their entries, and a final-pass task for the theorems cut by a
+    timeout shorter than `max_timeout` (or `None`).
+    """
+    library, source_dict, theorems, modules, timeouts = task
+    source, source_ref = load_source(source_dict, store, sources)
+    replay = tiny_parser.file_replay(source, modules, incremental=replay_mode == "file")
+    entries, retry = [], []
+    with tiny_parser.metrics.scope("file", str(source.path)):
+        for thm, timeout in zip(theorems, timeouts):
+            reason = memory.restart_reason()
+            if reason is not None:
+                print(f"RESET MEMORY{label}: {reason}")
+                tiny_parser.metrics.count("memory_restart")
+                restart(tier="pet")
+                replay.reset()
             try:
-                with time_limit(extract_timeout, "extract_proof"):
-                    steps = tiny_parser(theorem, source)
-                    new_entry = {"library": library, "theorem": asdict(theorem), "steps": [asdict(step) for step in steps]}
-                    with open(output_elements, 'a') as file:
-                        file.write(json.dumps(new_entry) + "\n")
+                entries.append(replay_theorem(replay, library, Element.from_dict(thm), timeout, source_ref, goal_table))
+            except ProofNotFound:
+                # Raised before any call: the state is intact and the next advance checks the skipped text.
+                print(f"WARNING{label}: no proof found for {thm['name']}")
+                tiny_parser.metrics.count("proof_not_found")
             except Exception as e:
-                print(f"WARNING: {e}")
-                opam_docker = restart_docker(opam_docker, config, port)
-                continue
+                print(f"WARNING{label}: {e}")
+                if isinstance(e, TimeoutError) and timeout < max_timeout:
+                    retry.append(thm)
+                restart(e)
+                replay.reset()
+    replay.close()
+    return entries, ((library, source_dict, retry, modules, [max_timeout] * len(retry)) if retry else None)
+
+def cost_model(config: OpamConfig, extract_timeout=2*60, min_timeout=10, timeout_factor=4.0) -> CostModel:
+    """Cost model of a library, from the theorem timings of its earlier runs."""
+    return CostModel(load_history(metrics_path(config)), factor=timeout_factor, min_timeout=min_timeout, max_timeout=extract_timeout)
+
+def _worker_main(worker_id, port, task_queue, result_queue, config: OpamConfig, extract_timeout, max_memory, replay_mode, warm_standby=0, external_pet=False, intern_goals=False,
+                 workers=1, worker_memory_gb=0.0, jobs=1):
+    """Worker process: own one container and pet-server, replay the theorems it is given."""
+    state = {"docker": start_pet_server(config, port, external_pet=external_pet)}
+    report_container(result_queue, worker_id, _container_id(state["docker"]))
+    memory = MemoryController.for_workers(workers, max_memory, worker_memory_gb, jobs).start(state["docker"])
+    tiny_parser = TinyRocqParser(port, about_cache=ResolutionCache(about_cache_path(config)), metrics=Metrics(metrics_path(config), stage="elements", worker=worker_id))
+    store = BlobStore.for_output(config.output)
+    goal_table = GoalTable.for_output(config.output, create=intern_goals)
+    recovery = make_recovery(config, port, tiny_parser, warm_standby=warm_standby)
+    sources = StateCache(SOURCE_CACHE_SIZE)
+
+    def restart(error=None, tier=None):
+        state["docker"] = recovery(state["docker"], error, tier)
+        memory.watch(state["docker"])
+        report_container(result_queue, worker_id, _container_id(state["docker"]))
+
+    def handle(task):
+        return replay_task(task, tiny_parser, store, goal_table, restart, memory, replay_mode, extract_timeout, f" (worker {worker_id})", sources)
+
+    try:
+        worker_loop(worker_id, task_queue, result_queue, handle)
+    finally:
+        memory.close()
+        tiny_parser.metrics.set_info("memory", memory.stats())
+        tiny_parser.about_cache.save()
+        report_stats(tiny_parser, recovery, f" (worker {worker_id})")
+        if recovery.warm_pool is not None:
+            recovery.warm_pool.close()
+        state["docker"].close()
+
+def extract_elements_parallel(config: OpamConfig, workers: int, port: int=8765, kill_clone=False, extract_timeout=2*60, max_memory=0.8, replay_mode="theorem", warm_standby=0, external_pet=False, intern_goals=False, min_timeout=10, timeout_factor=4.0, worker_memory_gb=0.0, jobs=1):
+    """Shard theorems across `workers` containers, each running its own pet-server, longest first."""
+    output_elements = config.output + '_elements.jsonl'
+
+    if kill_clone and not external_pet:
+        OpamDocker.kill_clones(docker.from_env(), config.name + ':' + config.tag)
+
+    done = SegmentStore(uid_theorem, output_elements)
+    per_file = replay_mode == "file"
+    first, final = cost_model(config, extract_timeout, min_timeout, timeout_factor).schedule(iter_files(config.output, done), per_file)
+    retries = []
+    for name, tasks, count in passes(config.output, first, final, retries, BlobStore.for_output(config.output)):
+        if not count:
+            continue
+        pool = WorkerPool(workers, _worker_main, (config, extract_timeout, max_memory, replay_mode, warm_standby, external_pet, intern_goals, workers, worker_memory_gb, jobs), base_port=port)
+        for entries, retry in tqdm(pool.run(tasks), desc=name, total=count):
+            for new_entry in entries:
+                if uid_theorem(new_entry) not in done:
+                    done.append(new_entry)
+            if retry is not None:
+                retries.append(retry)
+    done.close()
+
+def extract_elements(config: OpamConfig, port: int=8765, kill_clone=False, extract_timeout=2*60, max_memory=0.8, workers=1, replay_mode="theorem", warm_standby=0, external_pet=False, intern_goals=False, min_timeout=10, timeout_factor=4.0, worker_memory_gb=0.0, jobs=1, **_):
+    """Replay proofs for each theorem and capture all proof steps.
+
+    Each theorem's time limit is derived from its estimated cost (see
+    `CostModel`). Theorems cut by such a shortened limit, and those that kept
+    failing in earlier runs, are replayed last with the full `extract_timeout`.
+    """
+    if workers > 1:
+        return extract_elements_parallel(config, workers, port=port, kill_clone=kill_clone, extract_timeout=extract_timeout, max_memory=max_memory, replay_mode=replay_mode, warm_standby=warm_standby, external_pet=external_pet, intern_goals=intern_goals, min_timeout=min_timeout, timeout_factor=timeout_factor, worker_memory_gb=worker_memory_gb, jobs=jobs)
+
+    state = {"docker": start_pet_server(config, port, kill_clone=kill_clone, external_pet=external_pet)}
+    tiny_parser = TinyRocqParser(port, about_cache=ResolutionCache(about_cache_path(config)), metrics=Metrics(metrics_path(config), stage="elements"))
+    recovery = make_recovery(config, port, tiny_parser, kill_clone=kill_clone, warm_standby=warm_standby)
+    memory = MemoryController.for_workers(1, max_memory, worker_memory_gb, jobs).start(state["docker"])
+
+    def restart(error=None, tier=None):
+        state["docker"] = recovery(state["docker"], error, tier)
+        memory.watch(state["docker"])
+
+    output_elements = config.output + '_elements.jsonl' 
+    
+    done = SegmentStore(uid_theorem, output_elements)
+    store = BlobStore.for_output(config.output)
+    goal_table = GoalTable.for_output(config.output, create=intern_goals)
+    sources = StateCache(SOURCE_CACHE_SIZE)
+
+    # Files stay whole: a single pet-server gains nothing from reordering their theorems.
+    first, final = cost_model(config, extract_timeout, min_timeout, timeout_factor).schedule(iter_files(config.output, done), per_file=True)
+    retries = []
+    for name, tasks, count in passes(config.output, first, final, retries):
+        for task in tqdm(tasks, desc=name, total=count):
+            entries, retry = replay_task(task, tiny_parser, store, goal_table, restart, memory, replay_mode, extract_timeout, sources=sources)
+            with tiny_parser.metrics.timer("write"):
+                for new_entry in entries:
+                    done.append(new_entry)
+            if retry is not None:
+                retries.append(retry)
+    done.close()
+    memory.close()
+    tiny_parser.metrics.set_info("memory", memory.stats())
+    tiny_parser.about_cache.save()
+    report_stats(tiny_parser, recovery)
+    if recovery.warm_pool is not None:
+        recovery.warm_pool.close()
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Parse libraries.")
     parser.add_argument("--config-path", default="config/coq-actuary.yaml", help="Config file for extraction")
     parser.add_argument("--port", default=8765, type=int, help="Port used for pet-server")
-    parser.add_argument("--max_memory", default=0.80, type=float)    
-    parser.add_argument("--extract-timeout", default=2*60, type=int)
+    parser.add_argument("--max_memory", default=0.80, type=float, help="Host memory fraction above which a worker whose container keeps growing is restarted")
+    parser.add_argument("--worker-memory-gb", default=0.0, type=float, help="Memory limit of each worker's container (default: its share of --max_memory of the host)")
+    parser.add_argument("--extract-timeout", default=2*60, type=int, help="Longest time limit of a theorem (used as is in the final pass)")
+    parser.add_argument("--min-timeout", default=10, type=int, help="Shortest time limit of a theorem in the first pass")
+    parser.add_argument("--timeout-factor", default=4.0, type=float, help="First-pass time limit as a multiple of the estimated cost (0 keeps --extract-timeout)")
     parser.add_argument("--kill-clone", default=False, type=bool)
+    parser.add_argument("--workers", default=1, type=int, help="Number of pet-server workers; worker i uses port + i")
+    parser.add_argument("--replay-mode", default="theorem", choices=["theorem", "file"], help="'file' walks each source once, reusing the state of the previous theorem")
+    parser.add_argument("--warm-standby", default=0, type=int, help="Number of pre-started containers kept ready for failover (per worker)")
+    parser.add_argument("--external-pet", action="store_true", help="Use the pet-server(s) already listening on --port (+ i per worker) instead of starting containers")
+    parser.add_argument("--intern-goals", action="store_true", help="Store each distinct goal once in <output>_goals and refer to it by id in the steps")
     args = parser.parse_args()
 
     config = OpamConfig.from_yaml(args.config_path)
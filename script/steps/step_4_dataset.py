@@ -0,0 +1,39 @@
+"""Step 4: export proof steps as a columnar, memory-mapped training set."""
+
+import argparse
+import os
+import time
+
+from src.config.opam_config import OpamConfig
+from src.store.columnar import export_elements
+from src.store.premise_index import update_index
+from script.utils import iter_elements
+
+def dataset_path(config: OpamConfig) -> str:
+    """Location of the exported training set of a library."""
+    return config.output + '_dataset'
+
+def premise_index_path(config: OpamConfig) -> str:
+    """Default location of the premise index shared by the libraries of an output directory."""
+    return os.path.join(os.path.dirname(config.output), 'premise_index')
+
+def export_dataset(config: OpamConfig, min_premises=1, premise_index=None, **_):
+    """Convert `<output>_elements.jsonl` into `<output>_dataset/` and update the premise index."""
+    start = time.perf_counter()
+    rows = export_elements(iter_elements(config.output), dataset_path(config), min_premises=min_premises)
+    print(f"{rows} steps exported to {dataset_path(config)} in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    premise_index = premise_index or premise_index_path(config)
+    stats = update_index(premise_index, config.name, iter_elements(config.output))
+    print(f"premise index {premise_index} ({config.name}): {stats} in {time.perf_counter() - start:.1f}s")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export the training set.")
+    parser.add_argument("--config-path", default="config/coq-actuary.yaml", help="Config file for extraction")
+    parser.add_argument("--min-premises", default=1, type=int, help="Skip steps with fewer premises")
+    parser.add_argument("--premise-index", default=None, help="Premise index to update (default: premise_index next to the outputs)")
+    args = parser.parse_args()
+
+    config = OpamConfig.from_yaml(args.config_path)
+    export_dataset(config, **vars(args))
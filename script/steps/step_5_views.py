@@ -0,0 +1,36 @@
+"""Step 5: precompute the simplified views served by the `read` tool."""
+
+import argparse
+import shutil
+import time
+
+from tqdm import tqdm
+
+from src.config.opam_config import OpamConfig
+from src.parser.parser import Source
+from src.store.blob_store import BlobStore
+from src.store.read_views import ReadViewWriter, simplify, views_path
+from script.utils import iter_metadata, iter_sources
+
+def build_views(config: OpamConfig, chunk_lines=100, **_):
+    """Write a proof-elided view of every source of `<output>_sources.jsonl` to `<output>_views/`."""
+    start = time.perf_counter()
+    theorems = {entry['source']['path']: entry['theorems'] for entry in iter_metadata(config.output)}
+    store = BlobStore.for_output(config.output)
+    root = views_path(config.output)
+    shutil.rmtree(root, ignore_errors=True)
+    writer = ReadViewWriter(root, chunk_lines=chunk_lines)
+    for entry in tqdm(iter_sources(config.output), desc="Views"):
+        source = Source.from_dict(entry['source'], store)
+        writer.add(str(source.path), simplify(source, theorems.get(str(source.path), [])))
+    writer.close()
+    print(f"{len(writer.index)} views written to {root} in {time.perf_counter() - start:.1f}s")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build read views.")
+    parser.add_argument("--config-path", default="config/coq-actuary.yaml", help="Config file for extraction")
+    parser.add_argument("--chunk-lines", default=100, type=int, help="Lines per stored chunk")
+    args = parser.parse_args()
+
+    config = OpamConfig.from_yaml(args.config_path)
+    build_views(config, **vars(args))
@@ -0,0 +1,33 @@
+"""Build or query the logical-path table of contents of every extracted library."""
+
+import argparse
+import glob
+import itertools
+import os
+import time
+
+from src.store.toc_index import TocIndex, build_toc_index
+from script.utils import iter_jsonl
+
+def build(output_dir: str, index: str) -> int:
+    """Index the `*_metadata.jsonl` files of `output_dir` into `index`."""
+    paths = sorted(glob.glob(os.path.join(output_dir, "*_metadata.jsonl")))
+    return build_toc_index(itertools.chain.from_iterable(iter_jsonl(path) for path in paths), index)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Table of contents keyed by logical path.")
+    parser.add_argument("--output-dir", default="export/output", help="Directory holding the *_metadata.jsonl outputs")
+    parser.add_argument("--index", default=None, help="Index directory (default: toc_index in --output-dir)")
+    parser.add_argument("--query", default=None, help="Render this logical path instead of building ('' for the roots)")
+    parser.add_argument("--page", default=0, type=int)
+    parser.add_argument("--page-size", default=50, type=int)
+    args = parser.parse_args()
+
+    index = args.index or os.path.join(args.output_dir, "toc_index")
+    if args.query is None:
+        start = time.perf_counter()
+        nodes = build(args.output_dir, index)
+        print(f"{nodes} nodes written to {index} in {time.perf_counter() - start:.1f}s")
+    else:
+        toc = TocIndex(index)
+        print(toc.render(args.query, args.page, args.page_size), end="")
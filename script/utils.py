@@ -2,17 +2,20 @@
 
 import signal
 from contextlib import contextmanager
-from typing import List, Dict, Any, Union
+from typing import List, Dict, Any, Tuple, Union, Iterator
 from collections.abc import Callable
+import hashlib
 import json
 import os
-import psutil
+import struct
 import gc
+import socket
 import time
 
 
-from src.parser.opam_docker import OpamDocker
+from src.parser.opam_docker import OpamDocker, ExternalPet
 from src.parser.parser import Element, Source
+from src.store.goal_table import GoalTable
 
 @contextmanager
 def time_limit(seconds, name="call"):
@@ -43,29 +46,149 @@ def uid_source(source: Union[Dict, Source]) -> str:
 
 def uid_metadata(source: Dict) -> str:
     """Unique identifier for a metadata entry."""
-    return source['source']
-
-def extract_done(uid_generator: Callable[[Dict], str], output: str) -> Dict[str, Dict]:
-    """Read a JSONL file and return already processed entries keyed by UID."""
-    done = {}
-    if not os.path.exists(output):
-        return done
-    with open(output, 'r') as file:
-        for line in file.readlines():
-            entry = json.loads(line)
-            uid = uid_generator(entry)
-            assert uid not in done, f"Collision with {output}: {uid} already known"
-            done[uid] = entry
-    return done
-
-def is_done(uid_generator: Callable[[Dict], str], obj: Dict, done: Dict[str, Dict]) -> bool:
-    """Check whether an object already exists in the processed cache."""
-    return uid_generator(obj) in done
-
-def ram_used_frac() -> float:
-    """Return the fraction of system RAM that is currently used."""
-    vm = psutil.virtual_memory()
-    return vm.used / vm.total
+    return source['source']['path']
+
+def iter_jsonl(path: str) -> Iterator[Dict]:
+    """Stream the entries of a JSONL file one line at a time."""
+    with open(path, 'r') as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+def iter_jsonl_offsets(path: str) -> Iterator[Tuple[int, Dict]]:
+    """Stream `(byte offset, entry)` pairs of a JSONL file, for `read_jsonl_at`."""
+    offset = 0
+    with open(path, 'rb') as file:
+        for line in file:
+            if line.strip():
+                yield offset, json.loads(line)
+            offset += len(line)
+
+def read_jsonl_at(file, offset: int) -> Dict:
+    """Entry starting at `offset` of a JSONL file opened in binary mode."""
+    file.seek(offset)
+    return json.loads(file.readline())
+
+def iter_sources(output: str) -> Iterator[Dict]:
+    """Stream the entries of `<output>_sources.jsonl`."""
+    return iter_jsonl(output + '_sources.jsonl')
+
+def iter_metadata(output: str) -> Iterator[Dict]:
+    """Stream the entries of `<output>_metadata.jsonl`."""
+    return iter_jsonl(output + '_metadata.jsonl')
+
+def iter_elements(output: str, expand_goals: bool = True) -> Iterator[Dict]:
+    """Stream the entries of `<output>_elements.jsonl`, with interned goals rebuilt unless `expand_goals` is off."""
+    goal_table = GoalTable.for_output(output) if expand_goals else None
+    for entry in iter_jsonl(output + '_elements.jsonl'):
+        yield goal_table.expand_entry(entry) if goal_table is not None else entry
+
+class ResumeIndex:
+    """UID hashes of the entries already written to a JSONL output.
+
+    Only 64-bit digests are kept in memory. With `sidecar`, every digest is also
+    appended to `<output>.uids` together with the byte offset of the end of its
+    entry, so a restart reads the sidecar and only parses the part of the JSONL
+    file written after it (normally nothing).
+    """
+
+    RECORD = struct.Struct("<QQ")
+
+    def __init__(self, uid_generator: Callable[[Dict], str], output: str, sidecar: bool = True):
+        self.uid_generator = uid_generator
+        self.output = output
+        self.sidecar_path = output + '.uids' if sidecar else None
+        self.digests = set()
+        self._load()
+
+    @staticmethod
+    def digest(uid: str) -> int:
+        """64-bit digest of a UID."""
+        return int.from_bytes(hashlib.blake2b(uid.encode('utf-8'), digest_size=8).digest(), 'little')
+
+    def _load(self):
+        """Rebuild the digest set from the sidecar, then index the JSONL tail."""
+        if not os.path.exists(self.output):
+            if self.sidecar_path and os.path.exists(self.sidecar_path):
+                os.remove(self.sidecar_path)
+            return
+        covered = 0
+        if self.sidecar_path and os.path.exists(self.sidecar_path):
+            with open(self.sidecar_path, 'rb') as file:
+                data = file.read()
+            n_records = len(data) // self.RECORD.size
+            for digest, end in self.RECORD.iter_unpack(data[:n_records * self.RECORD.size]):
+                self.digests.add(digest)
+                covered = end
+            if covered > os.path.getsize(self.output):
+                # The output was truncated or rewritten: the sidecar cannot be trusted.
+                self.digests = set()
+                covered = n_records = 0
+            with open(self.sidecar_path, 'r+b') as file:
+                file.truncate(n_records * self.RECORD.size)
+        torn = False
+        with open(self.output, 'rb') as file:
+            file.seek(covered)
+            for line in file:
+                if not line.endswith(b"\n"):
+                    torn = True
+                    break
+                covered += len(line)
+                if not line.strip():
+                    continue
+                uid = self.uid_generator(json.loads(line))
+                digest = self.digest(uid)
+                assert digest not in self.digests, f"Collision with {self.output}: {uid} already known"
+                self._record(digest, covered)
+        if torn:
+            print(f"WARNING: dropping truncated last line of {self.output}")
+            with open(self.output, 'r+b') as file:
+                file.truncate(covered)
+
+    def _record(self, digest: int, end: int):
+        """Remember a digest and persist it to the sidecar."""
+        self.digests.add(digest)
+        if self.sidecar_path:
+            with open(self.sidecar_path, 'ab') as file:
+                file.write(self.RECORD.pack(digest, end))
+
+    def __contains__(self, uid: str) -> bool:
+        return self.digest(uid) in self.digests
+
+    def __len__(self) -> int:
+        return len(self.digests)
+
+    def append(self, entry: Dict):
+        """Write `entry` to the output and mark it as done."""
+        with open(self.output, 'ab') as file:
+            file.write((json.dumps(entry) + "\n").encode('utf-8'))
+            end = file.tell()
+        self._record(self.digest(self.uid_generator(entry)), end)
+
+    def extend(self, records: List[tuple], sync: bool = False):
+        """Write already serialized `(line, digest)` records with one write to the output and one to the sidecar.
+
+        With `sync`, both files are fsynced before returning.
+        """
+        if not records:
+            return
+        with open(self.output, 'ab') as file:
+            end = file.tell()
+            file.write(b"".join(line for line, _ in records))
+            if sync:
+                file.flush()
+                os.fsync(file.fileno())
+        sidecar = []
+        for line, digest in records:
+            end += len(line)
+            self.digests.add(digest)
+            sidecar.append(self.RECORD.pack(digest, end))
+        if self.sidecar_path:
+            with open(self.sidecar_path, 'ab') as file:
+                file.write(b"".join(sidecar))
+                if sync:
+                    file.flush()
+                    os.fsync(file.fileno())
 
 def restart_docker(opam_docker, config, port, kill_clone=False):
     """Restart a docker container to clean up state and memory usage."""
@@ -75,6 +198,114 @@ def restart_docker(opam_docker, config, port, kill_clone=False):
         pass
     gc.collect()
     time.sleep(0.25)
-    opam_docker = OpamDocker(config, kill_clone=kill_clone)
+    return start_pet_server(config, port, kill_clone=kill_clone, external_pet=isinstance(opam_docker, ExternalPet))
+
+def start_pet_server(config, port, kill_clone=False, external_pet=False):
+    """New container with pet-server listening on `port`, or the server already running there with `external_pet`."""
+    opam_docker = ExternalPet() if external_pet else OpamDocker(config, kill_clone=kill_clone)
     opam_docker.start_pet(port)
     return opam_docker
+
+def metrics_path(config) -> str:
+    """Location of the tracing sidecar of a library."""
+    return config.output + '_metrics.jsonl'
+
+def report_stats(tiny_parser, recovery: "Recovery", label: str = ""):
+    """Print cache, connection and recovery stats, and flush them to the metrics sidecar."""
+    stats = {"about_cache": tiny_parser.about_cache.stats(), "connections": tiny_parser.pool.stats(), "recovery": recovery.stats()}
+    if tiny_parser.locate_cache.path:
+        stats["locate_cache"] = tiny_parser.locate_cache.stats()
+    for name, value in stats.items():
+        print(f"{name}{label}: {value}")
+        tiny_parser.metrics.set_info(name, value)
+    tiny_parser.metrics.flush()
+
+class Recovery:
+    """Escalating recovery after a failed extraction.
+
+    Tiers, cheapest first: drop the parser's connections (`session`), restart
+    the pet-server process inside the running container (`pet`), and only then
+    recreate the container (`container`). Each tier is followed by a health
+    check; the next tier runs only if it fails. Latencies are recorded per tier.
+
+    With a `WarmPool`, the `pet` and `container` tiers switch to a standby
+    container when one is ready, and the parser is rebound to its port.
+    """
+
+    TIERS = ("session", "pet", "container")
+
+    def __init__(self, config, tiny_parser=None, kill_clone=False, session_errors=(AssertionError,), warm_pool=None, metrics=None):
+        self.config = config
+        self.metrics = metrics
+        self.tiny_parser = tiny_parser
+        self.kill_clone = kill_clone
+        self.warm_pool = warm_pool
+        self.session_errors = session_errors
+        self.latencies = {tier: [] for tier in self.TIERS}
+
+    def first_tier(self, error: BaseException = None) -> str:
+        """Errors reported by Coq only need a new session; a timeout means pet-server is still busy."""
+        if error is not None and isinstance(error, self.session_errors):
+            return "session"
+        return "pet"
+
+    def _healthy(self, opam_docker, tier: str) -> bool:
+        """pet-server accepts connections, and after a restart its process is alive.
+
+        The process check runs `docker exec`, so the `session` tier only tries the socket.
+        """
+        if tier != "session" and not opam_docker.pet_alive():
+            return False
+        try:
+            with socket.create_connection(("127.0.0.1", opam_docker.pet_port), timeout=1):
+                return True
+        except OSError:
+            return False
+
+    def _apply(self, tier: str, opam_docker):
+        """Run one recovery tier and return the (possibly new) container."""
+        warm = None
+        if tier != "session" and self.warm_pool is not None:
+            warm = self.warm_pool.swap(opam_docker)
+        if warm is not None:
+            opam_docker = warm
+        elif tier == "pet":
+            opam_docker.restart_pet()
+        elif tier == "container":
+            # Killing clones would also kill the standby containers.
+            kill_clone = self.kill_clone and self.warm_pool is None
+            opam_docker = restart_docker(opam_docker, self.config, opam_docker.pet_port, kill_clone=kill_clone)
+        if self.tiny_parser is not None:
+            self.tiny_parser.rebind(opam_docker.pet_port)
+        return opam_docker
+
+    def __call__(self, opam_docker, error: BaseException = None, tier: str = None):
+        """Recover from `error`, starting at `tier` (or the tier the error calls for)."""
+        start = self.TIERS.index(tier or self.first_tier(error))
+        for tier in self.TIERS[start:]:
+            t0 = time.perf_counter()
+            try:
+                opam_docker = self._apply(tier, opam_docker)
+                healthy = tier == "container" or self._healthy(opam_docker, tier)
+            except Exception as e:
+                if tier == "container":
+                    raise
+                print(f"WARNING: {tier} recovery failed: {e}")
+                healthy = False
+            self.latencies[tier].append(time.perf_counter() - t0)
+            if self.metrics is not None:
+                self.metrics.record(f"recover:{tier}", self.latencies[tier][-1])
+                self.metrics.count(f"restart:{tier}")
+            if healthy:
+                return opam_docker
+        return opam_docker
+
+    def stats(self) -> Dict[str, Any]:
+        """Count, mean and max latency of each tier."""
+        stats = {
+            tier: {"count": len(values), "mean_s": sum(values) / len(values) if values else 0.0, "max_s": max(values, default=0.0)}
+            for tier, values in self.latencies.items()
+        }
+        if self.warm_pool is not None:
+            stats["warm_pool"] = {"swaps": self.warm_pool.swaps, "misses": self.warm_pool.misses}
+        return stats
@@ -0,0 +1,161 @@
+"""Pool of worker processes, each bound to its own pet-server port."""
+
+import multiprocessing as mp
+import queue
+from typing import Any, Callable, Dict, Iterable, Iterator
+
+import docker
+
+READY = "ready"
+DONE = "done"
+CONTAINER = "container"
+
+def report_container(result_queue, worker_id: int, container_id: str):
+    """Tell the pool which container a worker currently owns."""
+    result_queue.put((CONTAINER, worker_id, container_id))
+
+def worker_loop(worker_id: int, task_queue, result_queue, handle: Callable[[Any], Any]):
+    """Serve tasks from `task_queue` until the pool sends `None`."""
+    result_queue.put((READY, worker_id, None))
+    while True:
+        task = task_queue.get()
+        if task is None:
+            return
+        result_queue.put((DONE, worker_id, handle(task)))
+
+class WorkerPool:
+    """Shard tasks across worker processes and respawn the ones that die.
+
+    `worker_main(worker_id, port, task_queue, result_queue, *worker_args)` runs
+    in each child; it is expected to start its own pet-server on `port` and
+    then hand over to `worker_loop`. Worker `i` always gets `base_port + i`, so
+    a respawned worker reuses the port of the one it replaces.
+    """
+
+    def __init__(self, n_workers: int, worker_main: Callable, worker_args: tuple = (), base_port: int = 8765, max_retries: int = 1, max_respawns: int = 100):
+        self.ctx = mp.get_context("fork")
+        self.n_workers = n_workers
+        self.worker_main = worker_main
+        self.worker_args = worker_args
+        self.base_port = base_port
+        self.max_retries = max_retries
+        self.max_respawns = max_respawns
+        self.result_queue = self.ctx.Queue()
+        self.processes: Dict[int, mp.Process] = {}
+        self.task_queues: Dict[int, Any] = {}
+        self.containers: Dict[int, str] = {}
+        self.in_flight: Dict[int, Any] = {}
+        self.retries: Dict[int, int] = {}
+        self.respawns = 0
+        self._seq = 0
+        self._docker_client = None
+
+    def port(self, worker_id: int) -> int:
+        """Return the pet-server port owned by a worker."""
+        return self.base_port + worker_id
+
+    def _spawn(self, worker_id: int):
+        """Start (or restart) the process for `worker_id`."""
+        task_queue = self.ctx.Queue()
+        process = self.ctx.Process(
+            target=self.worker_main,
+            args=(worker_id, self.port(worker_id), task_queue, self.result_queue, *self.worker_args),
+            daemon=True,
+        )
+        process.start()
+        self.task_queues[worker_id] = task_queue
+        self.processes[worker_id] = process
+
+    def _remove_container(self, worker_id: int):
+        """Remove the container left behind by a dead worker."""
+        container_id = self.containers.pop(worker_id, None)
+        if container_id is None:
+            return
+        try:
+            if self._docker_client is None:
+                self._docker_client = docker.from_env()
+            self._docker_client.containers.get(container_id).remove(force=True)
+        except Exception as e:
+            print(f"WARNING: failed to remove container of worker {worker_id}: {e}")
+
+    def _reap(self, pending: list):
+        """Respawn dead workers and requeue the task they were running."""
+        for worker_id, process in list(self.processes.items()):
+            if process.is_alive():
+                continue
+            process.join()
+            del self.processes[worker_id]
+            self._remove_container(worker_id)
+            job = self.in_flight.pop(worker_id, None)
+            if job is None and process.exitcode == 0:
+                continue
+            print(f"WARNING: worker {worker_id} died (exit code {process.exitcode}), restarting it")
+            if self.respawns >= self.max_respawns:
+                raise RuntimeError(f"Workers died {self.respawns} times, giving up")
+            if job is not None:
+                seq, _ = job
+                self.retries[seq] = self.retries.get(seq, 0) + 1
+                if self.retries[seq] <= self.max_retries:
+                    pending.append(job)
+                else:
+                    print(f"WARNING: dropping task after {self.max_retries} retries")
+            self.respawns += 1
+            self._spawn(worker_id)
+
+    def _dispatch(self, worker_id: int, tasks: Iterator[Any], pending: list) -> bool:
+        """Give the next task to an idle worker, or tell it to stop."""
+        if pending:
+            job = pending.pop()
+        else:
+            task = next(tasks, None)
+            if task is None:
+                self.task_queues[worker_id].put(None)
+                return False
+            job = (self._seq, task)
+            self._seq += 1
+        self.in_flight[worker_id] = job
+        self.task_queues[worker_id].put(job[1])
+        return True
+
+    def run(self, tasks: Iterable[Any]) -> Iterator[Any]:
+        """Dispatch `tasks` to the workers and yield results as they arrive."""
+        tasks = iter(tasks)
+        pending = []
+        stopped = set()
+        for worker_id in range(self.n_workers):
+            self._spawn(worker_id)
+        try:
+            while len(stopped) < self.n_workers or self.in_flight or pending:
+                self._reap(pending)
+                try:
+                    kind, worker_id, payload = self.result_queue.get(timeout=1.0)
+                except queue.Empty:
+                    continue
+                if kind == CONTAINER:
+                    self.containers[worker_id] = payload
+                    continue
+                if kind == DONE:
+                    self.in_flight.pop(worker_id, None)
+                    yield payload
+                if self._dispatch(worker_id, tasks, pending):
+                    stopped.discard(worker_id)
+                else:
+                    stopped.add(worker_id)
+        finally:
+            self.close()
+
+    def close(self):
+        """Stop every worker and wait for them to exit."""
+        for worker_id, process in self.processes.items():
+            if process.is_alive():
+                try:
+                    self.task_queues[worker_id].put(None)
+                except Exception:
+                    pass
+        for worker_id, process in self.processes.items():
+            process.join(timeout=30)
+            if process.is_alive():
+                process.kill()
+                process.join()
+                self._remove_container(worker_id)
+        self.processes.clear()
@@ -0,0 +1,49 @@
+"""Extraction of the names referenced by a tactic AST."""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+QUALID = "Ser_Qualid"
+
+def qualid_references(ast: Dict[str, Any]) -> List[Tuple[str, Optional[Any]]]:
+    """Qualified names referenced by a tactic AST, in first-occurrence order.
+
+    Each name comes with the `loc` of the innermost AST node enclosing it. The
+    tree is walked once, depth-first and left to right, with a stack of child
+    iterators, so no list is copied. `loc` subtrees hold no references and are
+    not entered; as in the recursive walk this replaces, nothing is read inside
+    a `Ser_Qualid` node except its trailing arguments.
+    """
+    found: Dict[str, Optional[Any]] = {}
+    stack = [iter((ast["v"]["expr"],))]
+    locs = [ast.get("loc")]
+    while stack:
+        for node in stack[-1]:
+            t = type(node)
+            if t is list:
+                if len(node) >= 3 and node[0] == QUALID:
+                    name = ".".join([part[1] for part in node[1][1]] + [node[2][1]])
+                    if name not in found:
+                        found[name] = locs[-1]
+                    if len(node) == 3:
+                        continue
+                    node = node[3:]
+                stack.append(iter(node))
+                locs.append(locs[-1])
+                break
+            if t is dict:
+                loc = node.get("loc")
+                if loc is None:
+                    stack.append(iter(node.values()))
+                    locs.append(locs[-1])
+                else:
+                    stack.append(iter([value for key, value in node.items() if key != "loc"]))
+                    locs.append(loc)
+                break
+        else:
+            stack.pop()
+            locs.pop()
+    return list(found.items())
+
+def list_dependencies(ast: Dict[str, Any]) -> List[str]:
+    """Extract clean dependency names from an AST."""
+    return [name for name, _ in qualid_references(ast)]
@@ -0,0 +1,121 @@
+"""asyncio variant of `TinyRocqParser` issuing independent pet-server queries concurrently."""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+from src.parser.parser import Element, Source, Step
+from src.parser.resolution_cache import ResolutionCache
+from src.parser.metrics import Metrics
+from src.parser.tiny_rocq_parser import TinyRocqParser
+
+class AsyncTinyRocqParser:
+    """Same surface as `TinyRocqParser` (`__call__`, `extract_toc`, `extract_dependencies`), as coroutines.
+
+    Pytanque is blocking, so each query runs in a worker thread on its own
+    pooled connection. A theorem stays on one pet-server (its states live
+    there), but within a step the `ast` and `run` of the tactic are sent
+    together, then the `About`s of its constants and the `goals` of the new
+    state. At most `max_theorems` theorems are in flight, spread over the
+    backends of `ports` by load.
+    """
+
+    def __init__(self, ports: List[int], timeout=30, about_cache: Optional[ResolutionCache] = None, connections: int = 4,
+                 max_theorems: int = 8, metrics: Optional[Metrics] = None, locate_cache: Optional[ResolutionCache] = None):
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.about_cache = about_cache if about_cache is not None else ResolutionCache()
+        self.locate_cache = locate_cache if locate_cache is not None else ResolutionCache()
+        self.timeout = timeout
+        self.backends = [TinyRocqParser(port, timeout, self.about_cache, pool_size=connections, metrics=self.metrics, locate_cache=self.locate_cache)
+                         for port in ports]
+        self.load = [0] * len(self.backends)
+        self.executor = ThreadPoolExecutor(max_workers=len(ports) * connections)
+        self.max_theorems = max_theorems
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    @property
+    def slots(self) -> asyncio.Semaphore:
+        """Bound on the theorems in flight (created in the running loop)."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_theorems)
+        return self._slots
+
+    async def _call(self, parser: TinyRocqParser, fn: Callable[[Any], Any]):
+        """Run `fn(client)` on a pooled connection of `parser`, in a worker thread."""
+        def blocking():
+            with parser.pool.connection() as client:
+                return fn(client)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, blocking)
+
+    def _pick(self) -> int:
+        """Backend with the fewest theorems in flight."""
+        return min(range(len(self.backends)), key=self.load.__getitem__)
+
+    async def _extract_proof(self, parser: TinyRocqParser, theorem: Element, source: Source, modules: Optional[List[str]]) -> List[Step]:
+        """Replay a proof, overlapping the independent queries of each step."""
+        proof_attempt, context = parser._proof_plan(theorem, source, modules)
+        state = await self._call(parser, lambda c: parser._rpc("start", c.start, source.path, theorem.name))
+        goals = await self._call(parser, lambda c: parser._rpc("goals", c.goals, state))
+        steps = []
+        for line in proof_attempt:
+            ast, next_state = await asyncio.gather(
+                self._call(parser, lambda c, state=state, line=line: parser._rpc("ast", c.ast, state, line)),
+                self._call(parser, lambda c, state=state, line=line: parser._rpc("run", c.run, state, line, timeout=self.timeout)),
+            )
+            constants, hypotheses = parser._step_constants(ast, goals)
+            resolved, next_goals = await asyncio.gather(
+                asyncio.gather(*[
+                    self._call(parser, lambda c, state=state, constant=constant: parser._resolve(c, state, constant, context, hypotheses, source.declared_names))
+                    for constant in constants
+                ]),
+                self._call(parser, lambda c, next_state=next_state: parser._rpc("goals", c.goals, next_state)),
+            )
+            steps.append(parser._make_step(line, goals, next_goals, resolved))
+            state, goals = next_state, next_goals
+        parser._check_complete(goals)
+        return steps
+
+    async def __call__(self, theorem: Element, source: Source, modules: Optional[List[str]] = None) -> List[Step]:
+        """Extract the proof steps for a single theorem."""
+        async with self.slots:
+            i = self._pick()
+            self.load[i] += 1
+            try:
+                return await self._extract_proof(self.backends[i], theorem, source, modules)
+            finally:
+                self.load[i] -= 1
+
+    async def extract_all(self, tasks: Iterable[Tuple[Element, Source, Optional[List[str]]]]) -> List[Any]:
+        """Extract many theorems concurrently; failed ones come back as their exception."""
+        return await asyncio.gather(*[self(theorem, source, modules) for theorem, source, modules in tasks], return_exceptions=True)
+
+    async def extract_toc(self, source: Source) -> List[Element]:
+        """Read the table of contents for a source file."""
+        parser = self.backends[self._pick()]
+        return await asyncio.get_running_loop().run_in_executor(self.executor, parser.extract_toc, source)
+
+    async def extract_dependencies(self, source: Source, thms: List[Element]) -> Tuple[List[str], List[str]]:
+        """Collect load paths and module dependencies, with the missing `Locate`s sent concurrently."""
+        parser = self.backends[self._pick()]
+        keys = parser._locate_keys(source)
+        missing = parser._missing_locates(keys)
+        loadpath = parser._cached_loadpath()
+        if loadpath is not None and not missing:
+            return loadpath, parser._located(keys)
+        state = await self._call(parser, lambda c: parser._start_any(c, source, thms))
+
+        def run(op, cmd):
+            return self._call(parser, lambda c: parser._extract_one_feedback(parser._rpc(op, c.run, state, cmd)))
+
+        feedbacks = await asyncio.gather(*[run("locate", f'Locate {module}.') for module in missing.values()])
+        for key, feedback in zip(missing, feedbacks):
+            parser.locate_cache.put(key, parser._parse_locate(feedback))
+        if loadpath is None:
+            parser._learn_loadpath(await run("loadpath", 'Print LoadPath.'))
+        return parser.loadpath, parser._located(keys)
+
+    def close(self):
+        """Stop the worker threads and drop every connection."""
+        self.executor.shutdown(wait=True)
+        for parser in self.backends:
+            parser.pool.reset()
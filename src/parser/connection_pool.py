@@ -0,0 +1,128 @@
+"""Pool of reusable, health-checked Pytanque connections."""
+
+import select
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List
+
+from pytanque import Pytanque, PetanqueError
+
+class ConnectionPool:
+    """Hand out live connections to one pet-server, reconnecting when needed.
+
+    A connection is dropped when it is released after an error raised while a
+    request may still be in flight (a timeout or a broken pipe, but not a
+    `PetanqueError` reported by Coq), or when it fails the health check on
+    acquisition.
+    """
+
+    def __init__(self, port: int, host: str = "127.0.0.1", size: int = 1, metrics=None):
+        self.host = host
+        self.metrics = metrics
+        self.port = port
+        self.size = size
+        self.idle: List[Pytanque] = []
+        self.in_use = 0
+        self.generation = 0
+        self.cond = threading.Condition()
+        self.connects = 0
+        self.acquires = 0
+        self.discarded = 0
+        self.connect_seconds = 0.0
+
+    def _healthy(self, client: Pytanque) -> bool:
+        """An idle socket with pending data or EOF is not safe to reuse."""
+        try:
+            readable, _, _ = select.select([client.socket], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        return not readable
+
+    def _connect(self) -> Pytanque:
+        """Open a new connection and account for its setup time."""
+        start = time.perf_counter()
+        client = Pytanque(self.host, self.port)
+        client.connect()
+        elapsed = time.perf_counter() - start
+        self.connect_seconds += elapsed
+        self.connects += 1
+        if self.metrics is not None:
+            self.metrics.record("connect", elapsed)
+        return client
+
+    def _close(self, client: Pytanque):
+        """Close a connection, ignoring errors on already broken sockets."""
+        self.discarded += 1
+        try:
+            client.close()
+        except Exception:
+            pass
+
+    def acquire(self) -> Pytanque:
+        """Take a healthy connection, waiting if `size` are already in use."""
+        with self.cond:
+            while self.in_use >= self.size:
+                self.cond.wait()
+            self.in_use += 1
+            self.acquires += 1
+            while self.idle:
+                client = self.idle.pop()
+                if self._healthy(client):
+                    client.pool_generation = self.generation
+                    return client
+                self._close(client)
+            generation = self.generation
+        try:
+            client = self._connect()
+        except Exception:
+            with self.cond:
+                self.in_use -= 1
+                self.cond.notify()
+            raise
+        client.pool_generation = generation
+        return client
+
+    def release(self, client: Pytanque, healthy: bool = True):
+        """Return a connection; unhealthy or stale ones are closed."""
+        with self.cond:
+            self.in_use -= 1
+            if healthy and client.pool_generation == self.generation:
+                self.idle.append(client)
+            else:
+                self._close(client)
+            self.cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager yielding a pooled connection."""
+        client = self.acquire()
+        healthy = True
+        try:
+            yield client
+        except BaseException as e:
+            healthy = isinstance(e, (PetanqueError, AssertionError))
+            raise
+        finally:
+            self.release(client, healthy)
+
+    def reset(self, port: int = None):
+        """Drop every connection, e.g. after pet-server was restarted or moved."""
+        with self.cond:
+            if port is not None:
+                self.port = port
+            self.generation += 1
+            while self.idle:
+                self._close(self.idle.pop())
+
+    def stats(self) -> Dict[str, Any]:
+        """Setup cost actually paid versus one connection per call."""
+        avg = self.connect_seconds / self.connects if self.connects else 0.0
+        return {
+            "acquires": self.acquires,
+            "connects": self.connects,
+            "discarded": self.discarded,
+            "connect_seconds": self.connect_seconds,
+            "unpooled_connect_seconds_estimate": avg * self.acquires,
+            "saved_seconds_estimate": avg * (self.acquires - self.connects),
+        }
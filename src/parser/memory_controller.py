@@ -0,0 +1,157 @@
+"""Per-container memory accounting, sampled off the hot path, deciding when a worker restarts."""
+
+import os
+import threading
+from collections import deque
+from typing import Callable, Optional
+
+import psutil
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+def _read_int(path: str) -> int:
+    with open(path) as file:
+        return int(file.read().strip())
+
+def _inactive_file(stat_path: str, key: str) -> int:
+    """Reclaimable page cache listed in a cgroup `memory.stat`."""
+    try:
+        with open(stat_path) as file:
+            for line in file:
+                name, value = line.split()
+                if name == key:
+                    return int(value)
+    except OSError:
+        pass
+    return 0
+
+def cgroup_reader(container_id: str, root: str = CGROUP_ROOT) -> Optional[Callable[[], int]]:
+    """Reader of a container's memory use from its cgroup (v2, then v1), or `None` if not found.
+
+    Like `docker stats`, inactive page cache is not counted.
+    """
+    for directory in (f"{root}/system.slice/docker-{container_id}.scope", f"{root}/docker/{container_id}"):
+        if os.path.exists(f"{directory}/memory.current"):
+            return lambda d=directory: _read_int(f"{d}/memory.current") - _inactive_file(f"{d}/memory.stat", "inactive_file")
+    directory = f"{root}/memory/docker/{container_id}"
+    if os.path.exists(f"{directory}/memory.usage_in_bytes"):
+        return lambda: _read_int(f"{directory}/memory.usage_in_bytes") - _inactive_file(f"{directory}/memory.stat", "total_inactive_file")
+    return None
+
+def docker_stats_reader(container) -> Callable[[], int]:
+    """Reader of a container's memory use through the Docker API (slower: one stats round trip)."""
+    def read() -> int:
+        stats = container.stats(stream=False)["memory_stats"]
+        inactive = stats.get("stats", {}).get("inactive_file", stats.get("stats", {}).get("total_inactive_file", 0))
+        return stats["usage"] - inactive
+    return read
+
+def container_reader(opam_docker) -> Optional[Callable[[], int]]:
+    """Memory reader of the container behind `opam_docker` (`None` for an external pet-server)."""
+    container = getattr(opam_docker, "container", None)
+    if container is None:
+        return None
+    return cgroup_reader(container.id) or docker_stats_reader(container)
+
+def host_used_frac() -> float:
+    """Fraction of the host RAM in use."""
+    vm = psutil.virtual_memory()
+    return vm.used / vm.total
+
+class MemoryController:
+    """Decide when the pet-server container of one worker should be restarted.
+
+    A background thread samples the container's own memory use every
+    `interval` seconds; the extraction loop only reads the verdict. A restart
+    is due when the container goes above `limit` bytes, or when the host goes
+    above `host_max` and this container has grown by more than `growth` of its
+    limit over the last `window` samples, so workers whose memory is flat are
+    left alone. Without a container (external pet-server) only the host check
+    applies, as before.
+    """
+
+    def __init__(self, limit: int, host_max: float = 0.8, interval: float = 5.0, window: int = 12, growth: float = 0.05,
+                 host_probe: Callable[[], float] = host_used_frac):
+        self.limit = limit
+        self.host_max = host_max
+        self.interval = interval
+        self.growth = growth
+        self.host_probe = host_probe
+        self.samples = deque(maxlen=window)
+        self.reader: Optional[Callable[[], int]] = None
+        self.reason: Optional[str] = None
+        self.peak = 0
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def for_workers(cls, workers: int = 1, max_memory: float = 0.8, worker_memory_gb: float = 0.0, jobs: int = 1, **kwargs) -> "MemoryController":
+        """Controller with `worker_memory_gb` per worker, or else a share of `max_memory` of the host.
+
+        The share is split over the `workers` of each of the `jobs` running at once on the host.
+        """
+        share = max(workers, 1) * max(jobs, 1)
+        limit = worker_memory_gb * 2**30 if worker_memory_gb else psutil.virtual_memory().total * max_memory / share
+        return cls(int(limit), host_max=max_memory, **kwargs)
+
+    def watch(self, opam_docker, reader: Optional[Callable[[], int]] = None):
+        """(Re)bind to the container of `opam_docker`, e.g. after a restart, and forget the previous samples."""
+        with self.lock:
+            self.reader = reader if reader is not None else container_reader(opam_docker)
+            self.samples.clear()
+            self.reason = None
+
+    def sample(self):
+        """Take one sample and update the verdict."""
+        with self.lock:
+            reader = self.reader
+        usage = None
+        if reader is not None:
+            try:
+                usage = reader()
+            except Exception:
+                usage = None
+        host = self.host_probe()
+        with self.lock:
+            if reader is not self.reader:
+                return
+            reason = None
+            if usage is not None:
+                self.samples.append(usage)
+                self.peak = max(self.peak, usage)
+                if usage > self.limit:
+                    reason = f"container uses {usage / 2**30:.1f} GB, above its {self.limit / 2**30:.1f} GB limit"
+                elif host > self.host_max and len(self.samples) > 1 and usage - self.samples[0] > self.growth * self.limit:
+                    reason = f"host memory at {host:.0%} and container grew by {(usage - self.samples[0]) / 2**30:.1f} GB"
+            elif host > self.host_max:
+                reason = f"host memory at {host:.0%}"
+            self.reason = reason
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self, opam_docker=None) -> "MemoryController":
+        """Watch `opam_docker` and start the sampler thread."""
+        if opam_docker is not None:
+            self.watch(opam_docker)
+        self.sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def restart_reason(self) -> Optional[str]:
+        """Why the worker should restart now, or `None` (no I/O: reads the last verdict)."""
+        return self.reason
+
+    def stats(self):
+        """Last sample, peak and limit, in bytes."""
+        with self.lock:
+            return {"usage": self.samples[-1] if self.samples else None, "peak": self.peak, "limit": self.limit}
+
+    def close(self):
+        """Stop the sampler thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
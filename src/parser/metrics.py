@@ -0,0 +1,122 @@
+"""Lightweight tracing of pet-server calls and pipeline operations."""
+
+import bisect
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+# Upper bounds (ms) of the latency histogram buckets: 0.125ms, 0.25ms, ..., ~17min.
+BOUNDS_MS = [0.125 * 2**k for k in range(24)]
+
+class OpStats:
+    """Count, total, max and log2 histogram of one operation's latency."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.hist = [0] * (len(BOUNDS_MS) + 1)
+
+    def add(self, seconds: float):
+        """Record one call."""
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.hist[bisect.bisect_left(BOUNDS_MS, seconds * 1000)] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-friendly view."""
+        return {"count": self.count, "total_s": self.total, "max_s": self.max, "hist": self.hist}
+
+class Metrics:
+    """Per-operation latency histograms, per-theorem/per-file totals and counters.
+
+    Scopes (`theorem`, `file`) are appended to the sidecar as they close; the
+    cumulative operation histograms and counters are appended on `flush` as a
+    snapshot tagged with this run's id. Without a path nothing is written.
+    """
+
+    def __init__(self, path: Optional[str] = None, flush_every: int = 200, **tags):
+        self.path = path
+        self.tags = tags
+        self.run_id = uuid.uuid4().hex
+        self.flush_every = flush_every
+        self.ops: Dict[str, OpStats] = {}
+        self.counters: Dict[str, int] = {}
+        self.info: Dict[str, Any] = {}
+        self.scopes: List[Dict[str, Any]] = []
+        self.pending: List[str] = []
+        self.lock = threading.Lock()
+
+    def record(self, op: str, seconds: float):
+        """Record one call of `op` in the histograms and in every open scope."""
+        with self.lock:
+            stats = self.ops.get(op)
+            if stats is None:
+                stats = self.ops[op] = OpStats()
+            stats.add(seconds)
+            for scope in self.scopes:
+                scope["ops"][op] = scope["ops"].get(op, 0.0) + seconds
+
+    @contextmanager
+    def timer(self, op: str):
+        """Time the enclosed block as one call of `op`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(op, time.perf_counter() - start)
+
+    def count(self, name: str, n: int = 1):
+        """Increment a counter (e.g. restarts)."""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def set_info(self, name: str, value: Any):
+        """Attach a JSON-friendly summary (cache or pool stats) to the next snapshot."""
+        self.info[name] = value
+
+    @contextmanager
+    def scope(self, kind: str, name: str, **extra):
+        """Accumulate wall time and per-operation time of a theorem or a file."""
+        scope = {"kind": kind, "name": name, "ops": {}, **self.tags, **extra}
+        self.scopes.append(scope)
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield scope
+            ok = True
+        finally:
+            self.scopes = [other for other in self.scopes if other is not scope]
+            scope["total_s"] = time.perf_counter() - start
+            scope["ok"] = ok
+            if self.path:
+                self.pending.append(json.dumps(scope))
+                if len(self.pending) >= self.flush_every:
+                    self.flush()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Cumulative state of this run."""
+        return {
+            "kind": "snapshot",
+            **self.tags,
+            "run_id": self.run_id,
+            "pid": os.getpid(),
+            "time": time.time(),
+            "ops": {op: stats.to_dict() for op, stats in self.ops.items()},
+            "counters": self.counters,
+            "info": self.info,
+        }
+
+    def flush(self):
+        """Append closed scopes and a cumulative snapshot to the sidecar."""
+        if not self.path:
+            return
+        self.pending.append(json.dumps(self.snapshot()))
+        with open(self.path, 'a') as file:
+            file.write("\n".join(self.pending) + "\n")
+        self.pending = []
@@ -2,8 +2,9 @@
 
 import os
 import time, socket
+import tarfile
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Iterator
 import re
 
 import docker, shlex, sys
@@ -11,6 +12,65 @@ import docker, shlex, sys
 from src.config.opam_config import OpamConfig
 from .parser import Source
 
+class _ChunkReader:
+    """File-like view over an iterator of byte chunks, for streaming `tarfile`."""
+
+    def __init__(self, chunks: Iterator[bytes]):
+        self.chunks = iter(chunks)
+        self.buffer = b""
+        self.pos = 0
+
+    def read(self, size: int = -1) -> bytes:
+        """Read up to `size` bytes (everything when negative)."""
+        parts = []
+        while size != 0:
+            if self.pos >= len(self.buffer):
+                chunk = next(self.chunks, None)
+                if chunk is None:
+                    break
+                self.buffer, self.pos = chunk, 0
+            available = len(self.buffer) - self.pos
+            take = available if size < 0 else min(size, available)
+            parts.append(self.buffer[self.pos:self.pos + take])
+            self.pos += take
+            if size > 0:
+                size -= take
+        return b"".join(parts)
+
+class ExternalPet:
+    """Same interface as `OpamDocker` for a pet-server started elsewhere (e.g. a replay stand-in)."""
+
+    container = None
+
+    def __init__(self, host: str = "127.0.0.1"):
+        self.host = host
+        self.pet_port = None
+
+    def start_pet(self, port=8765, timeout=30):
+        """Wait until the external pet-server accepts connections on `port`."""
+        self.pet_port = port
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.pet_alive():
+                return
+            time.sleep(0.2)
+        raise RuntimeError(f"No pet-server listening on {self.host}:{port}")
+
+    def pet_alive(self) -> bool:
+        """Whether the server accepts connections."""
+        try:
+            with socket.create_connection((self.host, self.pet_port), timeout=1):
+                return True
+        except OSError:
+            return False
+
+    def restart_pet(self, timeout=30):
+        """The process is not ours to restart: only wait for it to be reachable."""
+        self.start_pet(self.pet_port, timeout=timeout)
+
+    def close(self):
+        """Nothing to tear down."""
+
 class OpamDocker:
     """Wraps Docker interactions for extracting data from an OPAM switch."""
 
@@ -23,16 +83,7 @@ class OpamDocker:
             image_name = config.base_image
         
         if kill_clone:
-            try:
-                for c in self.client.containers.list(all=True, filters={"ancestor": image_name}):
-                    c.reload()
-                    if c.status == "running":
-                        try:
-                            c.kill()
-                        except Exception:
-                            pass
-            except Exception as e:
-                raise RuntimeError(f"Failed to kill clones for image {image_name}: {e}")
+            self.kill_clones(self.client, image_name)
         self.container = self.client.containers.run(
             image_name,
             detach=True,
@@ -44,6 +95,20 @@ class OpamDocker:
         )
         self.opam_env_path = config.opam_env_path
         
+    @staticmethod
+    def kill_clones(client, image_name: str):
+        """Kill every running container started from `image_name`."""
+        try:
+            for c in client.containers.list(all=True, filters={"ancestor": image_name}):
+                c.reload()
+                if c.status == "running":
+                    try:
+                        c.kill()
+                    except Exception:
+                        pass
+        except Exception as e:
+            raise RuntimeError(f"Failed to kill clones for image {image_name}: {e}")
+
     def _ensure_running(self):
         """Guarantee the container is running before issuing commands."""
         self.container.reload()
@@ -153,6 +218,19 @@ class OpamDocker:
         log = self.exec_cmd("sh -lc 'tail -n +200 /tmp/pet.log || true'")
         raise RuntimeError(f"pet-server failed to start on port {port}.\n{log}")
 
+    def pet_alive(self) -> bool:
+        """Whether the pet-server process recorded in `/tmp/pet.pid` is still running."""
+        out = self.exec_cmd("sh -lc 'kill -0 $(cat /tmp/pet.pid) 2>/dev/null && echo alive || true'")
+        return "alive" in out
+
+    def restart_pet(self, timeout=30):
+        """Kill the pet-server process and start a new one on the same port."""
+        self.exec_cmd(
+            "sh -lc 'pid=$(cat /tmp/pet.pid 2>/dev/null) || exit 0; kill -9 $pid 2>/dev/null; "
+            "for i in $(seq 50); do kill -0 $pid 2>/dev/null || break; sleep 0.1; done; rm -f /tmp/pet.pid'"
+        )
+        self.start_pet(self.pet_port, timeout=timeout)
+
     def extract_opam_path(self, package_name: str, info_path: Dict[str, str]):
         """Resolve the OPAM installation path for a package."""
         opam_show = self.exec_cmd(f"opam show {package_name}")
@@ -174,4 +252,21 @@ class OpamDocker:
         """Return a `Source` dataclass for a file inside the container."""
         content = self._read_file(filepath)
         return Source(path=Path(filepath), content=content)
-    
+
+    def export_sources(self, lib: Dict[str, Any], encoding="utf-8") -> Iterator[Source]:
+        """Stream the `.v` files of a package listed by `extract_files` from one archive.
+
+        Same sources as `get_source` on each of `lib["subfiles"]`, but with a
+        single `get_archive` call instead of one `docker exec` per file. Each
+        source is yielded as soon as its tar member is decoded.
+        """
+        sources_path = os.path.join(lib["root"], lib["fqn"].replace('.', '/'))
+        parent = os.path.dirname(sources_path.rstrip('/'))
+        self._ensure_running()
+        stream, _ = self.container.get_archive(sources_path)
+        with tarfile.open(fileobj=_ChunkReader(stream), mode="r|") as tar:
+            for member in tar:
+                if not member.isfile() or not member.name.endswith('.v'):
+                    continue
+                content = tar.extractfile(member).read().decode(encoding, errors="replace")
+                yield Source(path=Path(os.path.join(parent, member.name)), content=content)
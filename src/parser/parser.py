@@ -1,10 +1,14 @@
 """Dataclasses and interfaces shared by the parser components."""
 
+import re
 from abc import ABC, abstractmethod
+from bisect import bisect_right
+from functools import cached_property
+from itertools import accumulate
 from pathlib import Path
 from dataclasses import dataclass, asdict
 
-from typing import List, Dict, Any
+from typing import List, Dict, Any, FrozenSet
 
 @dataclass
 class Position:
@@ -88,30 +92,99 @@ class Step:
             dependencies=[Dependency.from_dict(x) for x in d["dependencies"]],
         )
 
+DECLARATION = re.compile(
+    r"^\s*(?:(?:Local|Global|Program|Polymorphic|#\[[^\]]*\])\s+)*"
+    r"(?:Lemma|Theorem|Fact|Remark|Corollary|Proposition|Definition|Fixpoint|CoFixpoint|Inductive|CoInductive"
+    r"|Record|Structure|Class|Instance|Let|Variable|Hypothesis|Axiom|Parameter|Example)\s+([A-Za-z_][\w']*)",
+    re.MULTILINE,
+)
+
 @dataclass
 class Source:
-    """Raw Coq source file plus helper accessors."""
+    """Raw Coq source file plus helper accessors.
+
+    Positions count lines separated by `"\n"`. The offsets of line starts are
+    computed on first use and kept, so converting or slicing by position costs
+    O(1) (O(log n) from an offset) however many theorems the file holds.
+    """
 
     path: Path
     content: str
+
+    @cached_property
+    def line_starts(self) -> List[int]:
+        """Offset of the first character of each line."""
+        return list(accumulate([len(line) + 1 for line in self.content.split("\n")], initial=0))[:-1]
+
+    @property
+    def line_count(self) -> int:
+        """Number of lines (a final `"\n"` does not start a new one)."""
+        return len(self.line_starts) - (not self.content or self.content[-1] == "\n")
+
+    def line_end(self, line: int) -> int:
+        """Offset of the end of `line`, before its `"\n"`."""
+        starts = self.line_starts
+        return starts[line + 1] - 1 if line + 1 < len(starts) else len(self.content)
+
+    def line(self, line: int) -> str:
+        """Text of `line`, without its `"\n"`."""
+        return self.content[self.line_starts[line]:self.line_end(line)]
+
+    def offset(self, position: Position) -> int:
+        """Character offset of `position`, clamped to the end of its line.
+
+        The line after the last one is accepted and maps to the end of the content.
+        """
+        starts = self.line_starts
+        if position.line == len(starts):
+            return len(self.content)
+        if not 0 <= position.line < len(starts):
+            raise IndexError(f"Line {position.line} out of range in {self.path}")
+        return min(starts[position.line] + position.character, self.line_end(position.line))
+
+    def position(self, offset: int) -> Position:
+        """Position of a character offset."""
+        line = bisect_right(self.line_starts, offset) - 1
+        return Position(line, offset - self.line_starts[line])
+
+    def slice(self, start: Position, end: Position) -> str:
+        """Text between two positions."""
+        return self.content[self.offset(start):self.offset(end)]
+
+    @cached_property
+    def declared_names(self) -> FrozenSet[str]:
+        """Short names of the theorems, definitions, variables... declared in the file."""
+        return frozenset(DECLARATION.findall(self.content))
+
     @property
     def content_lines(self) -> List[str]:
         """Return the source as a list of lines."""
-        return self.content.splitlines()
+        return [self.line(i) for i in range(self.line_count)]
     
-    def to_dict(self) -> dict:
-        """Serialize the source for JSON output."""
+    def to_dict(self, store=None) -> dict:
+        """Serialize the source for JSON output.
+
+        With a `BlobStore`, the content is stored there and only its hash is kept.
+        """
+        if store is not None:
+            return {"path": str(self.path), "hash": store.put(self.content)}
         d = asdict(self)
         d["path"] = str(d["path"])
         return d
     
     @classmethod
-    def from_dict(cls, d: Dict[str, Any]) -> "Source":
+    def from_dict(cls, d: Dict[str, Any], store=None) -> "Source":
         """Build a source from a dictionary representation."""
         p = d.get("path")
+        if "content" in d:
+            content = d["content"]
+        elif store is not None:
+            content = store.get(d["hash"])
+        else:
+            raise ValueError(f"Content of {p} lives in a blob store, pass it to `Source.from_dict`")
         return cls(
             path=p if isinstance(p, Path) else Path(p),
-            content=d["content"],
+            content=content,
         )
 
 class ProofNotFound(Exception):
@@ -125,10 +198,7 @@ class TimeOut(Exception):
 def update_statement(theorem: Element, source: Source):
     """Populate the theorem statement text from its source range."""
     try:
-        lines = source.content_lines[theorem.range.start.line: theorem.range.end.line+1]
-        lines[0] = lines[0][theorem.range.start.character:]
-        lines[-1] = lines[-1][:theorem.range.end.character]
-        theorem.statement = "\n".join(lines)
+        theorem.statement = source.slice(theorem.range.start, theorem.range.end)
     except IndexError:
         print(f"Failed to extract statement from {theorem} in {source.path}")
 
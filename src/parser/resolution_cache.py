@@ -0,0 +1,79 @@
+"""Persistent memo of name resolutions shared across theorems and runs."""
+
+import fcntl
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+def context_digest(items: Iterable[str]) -> str:
+    """Short stable digest of a resolution context (e.g. loaded modules)."""
+    h = hashlib.blake2b(digest_size=8)
+    for item in items:
+        h.update(item.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+class ResolutionCache:
+    """Key/value cache persisted as one JSON object per library image.
+
+    Several processes may share the same file: `save` merges the entries found
+    on disk with the ones learned since the last save, under a file lock.
+    """
+
+    def __init__(self, path: Optional[str] = None, autosave: int = 1000):
+        self.path = path
+        self.autosave = autosave
+        self.entries: Dict[str, Any] = {}
+        self.new_entries: Dict[str, Any] = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.RLock()
+        if path and os.path.exists(path):
+            with open(path, 'r') as file:
+                self.entries = json.load(file)
+
+    @staticmethod
+    def key(name: str, *context: str) -> str:
+        """Build the cache key of `name` resolved within `context`."""
+        return "\x1f".join((*context, name))
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """Return `(found, value)` and update the hit/miss counters."""
+        if key in self.entries:
+            self.hits += 1
+            return True, self.entries[key]
+        self.misses += 1
+        return False, None
+
+    def put(self, key: str, value: Any):
+        """Record a resolution; flushes to disk every `autosave` new entries."""
+        with self.lock:
+            self.entries[key] = value
+            self.new_entries[key] = value
+            if self.path and self.autosave and len(self.new_entries) >= self.autosave:
+                self.save()
+
+    def save(self):
+        """Merge new entries into the on-disk cache."""
+        if not self.path or not self.new_entries:
+            return
+        with self.lock, open(self.path + ".lock", 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            on_disk = {}
+            if os.path.exists(self.path):
+                with open(self.path, 'r') as file:
+                    on_disk = json.load(file)
+            on_disk.update(self.new_entries)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as file:
+                json.dump(on_disk, file)
+            os.replace(tmp_path, self.path)
+            self.entries.update(on_disk)
+            self.new_entries = {}
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for end-of-run reporting."""
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0, "size": len(self.entries)}
@@ -0,0 +1,218 @@
+"""Pool of pet-server backends serving `sandbox(cmd)` calls from cached theorem states."""
+
+import hashlib
+import threading
+from dataclasses import asdict, is_dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import psutil
+from pytanque import PetanqueError
+
+from src.config.opam_config import OpamConfig
+from .connection_pool import ConnectionPool
+from .opam_docker import OpamDocker, ExternalPet
+from .state_cache import StateCache
+
+def _system_memory() -> float:
+    """Fraction of the host RAM in use."""
+    return psutil.virtual_memory().percent / 100
+
+class _Backend:
+    """One pet-server: its container, connections and the states started on it."""
+
+    def __init__(self, opam_docker, port: int, connections: int, cache_size: int, metrics=None):
+        self.docker = opam_docker
+        self.pool = ConnectionPool(port, size=connections, metrics=metrics)
+        self.cache = StateCache(cache_size)
+        self.generation = 0
+        self.sessions = 0
+        self.lock = threading.Lock()
+        self.sessions_lock = threading.Lock()
+
+    def enter(self, n: int = 1):
+        """Count a session opened (or closed, with `n = -1`) on this backend."""
+        with self.sessions_lock:
+            self.sessions += n
+
+    def restart(self):
+        """Restart pet-server, which frees every state it holds."""
+        with self.lock:
+            self.docker.restart_pet()
+            self.pool.reset()
+            self.cache.clear()
+            self.generation += 1
+
+class SandboxSession:
+    """A rollout's branch from the cached state of one theorem.
+
+    States are immutable on the pet-server side, so running a command never
+    alters the cached state others branch from. The commands run so far are
+    kept, so the branch is rebuilt if its backend restarts in between.
+    """
+
+    def __init__(self, pool: "SandboxPool", backend: _Backend, key: Tuple[str, str]):
+        self.pool = pool
+        self.backend = backend
+        self.key = key
+        self.history: List[str] = []
+        self.generation = None
+        self.state = None
+
+    def _sync(self, client):
+        """(Re)position on the theorem state plus the commands run so far."""
+        if self.generation == self.backend.generation and self.state is not None:
+            return
+        generation = self.backend.generation
+        state = self.pool.root_state(self.backend, self.key, client)
+        for cmd in self.history:
+            state = client.run(state, cmd, timeout=self.pool.timeout)
+        self.state, self.generation = state, generation
+
+    def run(self, cmd: str, timeout: Optional[int] = None) -> Dict[str, Any]:
+        """Run `cmd` from the current state; on a Coq error the state is unchanged.
+
+        An error caused by the backend restarting during the call is not
+        reported: the branch is rebuilt on the new pet-server and `cmd` retried.
+        """
+        while True:
+            generation = self.backend.generation
+            with self.backend.pool.connection() as client:
+                try:
+                    self._sync(client)
+                    state = client.run(self.state, cmd, timeout=timeout or self.pool.timeout)
+                    goals = client.goals(state)
+                    break
+                except PetanqueError as e:
+                    if self.backend.generation == generation:
+                        return {"ok": False, "error": str(e)}
+        self.state = state
+        self.history.append(cmd)
+        return {
+            "ok": True,
+            "feedback": [message for _, message in (state.feedback or [])],
+            "goals": [asdict(goal) if is_dataclass(goal) else goal for goal in goals],
+            "proof_finished": not goals,
+        }
+
+    def fork(self) -> "SandboxSession":
+        """Independent branch from the current state."""
+        other = SandboxSession(self.pool, self.backend, self.key)
+        other.history, other.state, other.generation = list(self.history), self.state, self.generation
+        other.backend.enter()
+        return other
+
+    def reset(self):
+        """Go back to the theorem's initial state."""
+        self.history, self.state = [], None
+
+    def close(self):
+        """Release the backend slot."""
+        self.backend.enter(-1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class SandboxPool:
+    """pet-server backends serving sessions branched from cached `(file, theorem)` states.
+
+    A theorem is routed to a fixed backend (by hash), so its started state is
+    reused across rollouts; a backend with more open sessions than connections
+    hands new ones to the least busy backend instead. Cached states are
+    evicted by LRU; pet-server offers no way to free one, so when memory use
+    goes above `max_memory` the backend holding the most states is restarted.
+    """
+
+    def __init__(self, config: OpamConfig, ports: List[int], connections: int = 4, cache_size: int = 512, timeout: int = 30,
+                 max_memory: float = 0.85, memory_probe: Callable[[], float] = _system_memory, external_pet: bool = False, metrics=None):
+        self.timeout = timeout
+        self.max_memory = max_memory
+        self.memory_probe = memory_probe
+        self.metrics = metrics
+        self.connections = connections
+        self.backends: List[Optional[_Backend]] = [None] * len(ports)
+        errors = []
+
+        def start(i, port):
+            try:
+                opam_docker = ExternalPet() if external_pet else OpamDocker(config)
+                opam_docker.start_pet(port)
+                self.backends[i] = _Backend(opam_docker, port, connections, cache_size, metrics)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=start, args=(i, port)) for i, port in enumerate(ports)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            self.close()
+            raise RuntimeError(f"Failed to start {len(errors)} sandbox backend(s): {errors[0]}")
+
+    def _route(self, key: Tuple[str, str]) -> _Backend:
+        """Backend owning `key`, unless it is saturated."""
+        digest = hashlib.blake2b("\x1f".join(key).encode('utf-8'), digest_size=8).digest()
+        backend = self.backends[int.from_bytes(digest, "little") % len(self.backends)]
+        if backend.sessions >= self.connections:
+            idle = min(self.backends, key=lambda b: b.sessions)
+            if idle.sessions < backend.sessions:
+                return idle
+        return backend
+
+    def _check_memory(self):
+        """Restart the backend holding the most states when memory runs out."""
+        if self.memory_probe() <= self.max_memory:
+            return
+        backend = max(self.backends, key=lambda b: len(b.cache))
+        print(f"WARNING: memory above {self.max_memory:.0%}, restarting sandbox backend on port {backend.pool.port}")
+        backend.restart()
+        if self.metrics is not None:
+            self.metrics.count("sandbox_restart")
+
+    def root_state(self, backend: _Backend, key: Tuple[str, str], client):
+        """Started state of `key` on `backend`, from its cache when possible."""
+        def start():
+            if self.metrics is not None:
+                with self.metrics.timer("start"):
+                    return client.start(key[0], key[1])
+            return client.start(key[0], key[1])
+        state, hit = backend.cache.get_or_create(key, start)
+        if self.metrics is not None:
+            self.metrics.count("sandbox_state_hit" if hit else "sandbox_state_miss")
+        return state
+
+    def session(self, path: str, theorem: str) -> SandboxSession:
+        """New session positioned at the start of the proof of `theorem` in `path`."""
+        self._check_memory()
+        key = (str(path), theorem)
+        backend = self._route(key)
+        backend.enter()
+        return SandboxSession(self, backend, key)
+
+    def run(self, path: str, theorem: str, commands: List[str]) -> Dict[str, Any]:
+        """Run `commands` in a fresh session and return the result of the last one."""
+        with self.session(path, theorem) as session:
+            result = {"ok": True, "feedback": [], "goals": None, "proof_finished": False}
+            for cmd in commands:
+                result = session.run(cmd)
+                if not result["ok"]:
+                    break
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        """State cache and connection stats per backend."""
+        return {backend.pool.port: {"states": backend.cache.stats(), "connections": backend.pool.stats(), "restarts": backend.generation}
+                for backend in self.backends if backend is not None}
+
+    def close(self):
+        """Stop every backend."""
+        for backend in self.backends:
+            if backend is not None:
+                backend.pool.reset()
+                try:
+                    backend.docker.close()
+                except Exception:
+                    pass
@@ -0,0 +1,67 @@
+"""Thread-safe LRU of started proof states, computing each missing entry once."""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+class StateCache:
+    """LRU map of `key -> value` where concurrent misses on one key share one `factory` call."""
+
+    def __init__(self, capacity: int = 512):
+        self.capacity = capacity
+        self.entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.pending: Dict[Hashable, threading.Event] = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Cached value of `key` (and `True`), or the value built by `factory` (and `False`)."""
+        while True:
+            with self.lock:
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return self.entries[key], True
+                event = self.pending.get(key)
+                if event is None:
+                    event = self.pending[key] = threading.Event()
+                    self.misses += 1
+                    break
+            # Another thread is building this entry: wait, then look again.
+            event.wait()
+        try:
+            value = factory()
+        except BaseException:
+            with self.lock:
+                del self.pending[key]
+            event.set()
+            raise
+        with self.lock:
+            self.entries[key] = value
+            del self.pending[key]
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        event.set()
+        return value, False
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self.lock:
+            return key in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def clear(self):
+        """Forget every entry (e.g. after the server holding the states restarted)."""
+        with self.lock:
+            self.evictions += len(self.entries)
+            self.entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hits, misses, hit rate, evictions and size."""
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions, "size": len(self.entries)}
@@ -1,63 +1,61 @@
 """Tiny Rocq parser that replays proofs and records dependencies."""
 
-from typing import List, Optional, Tuple
+from typing import Dict, FrozenSet, List, Optional, Tuple
+import os
 import re
-from copy import deepcopy
+from dataclasses import asdict
 import random
 
-from pytanque import Pytanque, State, PetanqueError
+from pytanque import State, PetanqueError
 
 from src.parser.parser import AbstractParser, Step, Position, Range, Element, Source, update_statement, Dependency, ProofNotFound
-
-def read_keyword(keyword: str, l: list, result: list[str]) -> list[str]:
-    """Collect AST nodes tagged with the given keyword."""
-
-    if isinstance(l, list):
-        if len(l) >= 3 and l[0] == keyword:
-            result.append((l[1], l[2]))
-            l = l[3:]
-
-        for el in l:
-            result = read_keyword(keyword, el, result)
-
-    elif isinstance(l, dict):
-        for el in l.values():
-            result = read_keyword(keyword, el, result)
-
-    return result
-
-def list_dependencies(ast: dict) -> list[str]:
-    """Extract clean dependency names from an AST."""
-    expr = ast["v"]["expr"]
-    raw_dependencies = read_keyword("Ser_Qualid", expr, [])
-
-    dependencies = []
-    for dir_path, name in raw_dependencies:
-        dependencies.append(".".join(map(lambda w: w[1], dir_path[1] + [name])))
-
-    return [dependency for i, dependency in enumerate(dependencies) if not dependency in dependencies[:i]]
+from src.parser.resolution_cache import ResolutionCache, context_digest
+from src.parser.connection_pool import ConnectionPool
+from src.parser.metrics import Metrics
+from src.parser.ast_deps import list_dependencies
 
 class TinyRocqParser(AbstractParser):
     """Interact with petanque to collect proof structure and metadata."""
 
-    def __init__(self, pet_port, timeout=30):
+    LOADPATH_KEY = ResolutionCache.key("LoadPath", "Print")
+
+    def __init__(self, pet_port, timeout=30, about_cache: Optional[ResolutionCache] = None, pool_size: int = 1, metrics: Optional[Metrics] = None,
+                 locate_cache: Optional[ResolutionCache] = None):
         """Create a parser bound to a pet-server port."""
         super().__init__()
         self.pet_port = pet_port
         self.timeout = timeout
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.pool = ConnectionPool(pet_port, size=pool_size, metrics=self.metrics)
+        self.about_cache = about_cache if about_cache is not None else ResolutionCache()
+        self.locate_cache = locate_cache if locate_cache is not None else ResolutionCache()
+        self.loadpath: Optional[Dict[str, str]] = None
+
+    def _rpc(self, op: str, fn, *args, **kwargs):
+        """Call a pet-server method, timing it as `op`."""
+        with self.metrics.timer(op):
+            return fn(*args, **kwargs)
+
+    def rebind(self, pet_port):
+        """Point the parser at another pet-server, dropping pooled connections."""
+        self.pet_port = pet_port
+        self.pool.reset(port=pet_port)
 
     def _extract_proof_steps(self, theorem: Element, source: Source):
         """Split a proof script into tactic steps."""
-        idx_offset = 0
-        subsource_lines = source.content_lines[theorem.range.end.line:]
-        subsource_lines[0] = subsource_lines[0][theorem.range.end.character:]
-        for line in subsource_lines:
-            idx_offset += 1
-            if 'Qed.' in line:
-                break
-            if 'Abort.' in line or 'Admitted.' in line:
-                raise ProofNotFound
-        proof_block = "\n".join(subsource_lines[:idx_offset])
+        # The proof runs to the end of the first line containing `Qed.`, unless an
+        # earlier line gives it up. Only the text of the proof itself is scanned.
+        content = source.content
+        start = source.offset(theorem.range.end)
+        qed = content.find('Qed.', start)
+        if qed < 0:
+            block_start, block_end = len(content), len(content)
+        else:
+            qed_line = source.position(qed).line
+            block_start, block_end = max(start, source.line_starts[qed_line]), source.line_end(qed_line)
+        if content.find('Abort.', start, block_start) >= 0 or content.find('Admitted.', start, block_start) >= 0:
+            raise ProofNotFound
+        proof_block = content[start:block_end]
         proof_attempt = re.split(r'(?<=[^\.]\.)\s+', proof_block)
         result = []
         for line in proof_attempt:
@@ -69,6 +67,13 @@ class TinyRocqParser(AbstractParser):
             result.append(line)
         return result
     
+    def _proof_end(self, theorem: Element, source: Source) -> Position:
+        """Position right after the `Qed.` closing the proof of `theorem`."""
+        idx = source.content.find('Qed.', source.offset(theorem.range.end))
+        if idx < 0:
+            raise ProofNotFound
+        return source.position(idx + len('Qed.'))
+
     def _parse_about(self, result: str) -> Optional[Dependency]:
         """Turn `About` feedback into a dependency record."""
         name = result.split(' :')[0]
@@ -96,40 +101,85 @@ class TinyRocqParser(AbstractParser):
             return Dependency(origin=origin, name=name, range=r, kind='premise')
         return None
         
-    def _extract_proof(self, theorem: Element, source: Source):
-        """Replay a proof and capture the states plus dependencies."""
-        proof_attempt = self._extract_proof_steps(theorem, source)
+    def _hypothesis_names(self, goals) -> set:
+        """Names bound in the hypotheses of the current goals."""
+        return {name for goal in goals for hyp in goal.hyps for name in hyp.names}
+
+    def _about(self, client, state, constant: str) -> Optional[Dependency]:
+        """Ask pet-server where `constant` comes from."""
+        substate = self._rpc("about", client.run, state, f'About {constant}.')
+        return self._parse_about(substate.feedback[0][1]) if substate.feedback else None
+
+    def _resolve(self, client, state, constant: str, context: Tuple[str, str], hypotheses: set, declared: FrozenSet[str] = frozenset()) -> Optional[Dependency]:
+        """Resolve a qualid through `About`, using the cache when it is safe to.
+
+        Only premises of other files are cached. Hypotheses depend on the goal.
+        A name the file itself declares depends on the position: before its
+        declaration it is unknown or names an imported constant that it shadows
+        afterwards.
+        """
+        if constant in hypotheses or constant.rsplit(".", 1)[-1] in declared:
+            return self._about(client, state, constant)
+        key = ResolutionCache.key(constant, *context)
+        found, cached = self.about_cache.get(key)
+        if found and cached:
+            self.metrics.count("about_cache_hit")
+            return Dependency.from_dict(cached)
+        self.metrics.count("about_cache_miss")
+        dependency = self._about(client, state, constant)
+        if dependency is not None and dependency.kind == 'premise' and dependency.origin != context[0]:
+            self.about_cache.put(key, asdict(dependency))
+        return dependency
+
+    def _step_constants(self, ast, goals) -> Tuple[List[str], set]:
+        """Qualids of a tactic's AST, and the hypothesis names of the goals it runs on."""
+        return (list_dependencies(ast) if ast else []), self._hypothesis_names(goals)
+
+    def _make_step(self, line: str, state_in, state_out, resolved: List[Optional[Dependency]]) -> Step:
+        """Step record of a tactic, keeping the constants that resolved."""
+        return Step(step=line, state_in=state_in, state_out=state_out, dependencies=[d for d in resolved if d])
+
+    def _check_complete(self, goals):
+        """A replayed proof must leave no goal."""
+        assert not goals, "Proof incomplete"
+
+    def _replay_steps(self, client, state, proof_attempt: List[str], context: Tuple[str, str], declared: FrozenSet[str] = frozenset()) -> Tuple[List[Step], State]:
+        """Run the tactics of a proof from `state`, returning the steps and the final state."""
         proof_check = []
-        with Pytanque("127.0.0.1", self.pet_port) as client:
-            state = client.start(source.path, theorem.name)
-            goals_out = client.goals(state)
-            for line in proof_attempt:
-                state_in = deepcopy(goals_out)
-                ast = client.ast(state, line)
-                if ast:
-                    constants = list_dependencies(ast)
-                else:
-                    constants = []
-                dependencies = []
-                for constant in constants:
-                    substate = client.run(state, f'About {constant}.')
-                    if substate.feedback:
-                        result = substate.feedback[0][1]
-                        dependancy = self._parse_about(result)
-                        if dependancy:
-                            dependencies.append(dependancy)
-                state = client.run(state, line, timeout=self.timeout)
-                goals = client.goals(state)
-                step = Step(step=line, state_in=state_in, state_out=goals, dependencies=dependencies)
-                proof_check.append(step)
-            assert not goals, "Proof incomplete"
+        goals = self._rpc("goals", client.goals, state)
+        for line in proof_attempt:
+            # Goals are never mutated: step k's `state_out` is step k+1's `state_in`.
+            state_in = goals
+            ast = self._rpc("ast", client.ast, state, line)
+            constants, hypotheses = self._step_constants(ast, goals)
+            resolved = [self._resolve(client, state, constant, context, hypotheses, declared) for constant in constants]
+            state = self._rpc("run", client.run, state, line, timeout=self.timeout)
+            goals = self._rpc("goals", client.goals, state)
+            proof_check.append(self._make_step(line, state_in, goals, resolved))
+        self._check_complete(goals)
+        return proof_check, state
+
+    def _proof_plan(self, theorem: Element, source: Source, modules: Optional[List[str]] = None) -> Tuple[List[str], Tuple[str, str]]:
+        """Tactics of a proof, and the `About` cache context of its file."""
+        return self._extract_proof_steps(theorem, source), (str(source.path), context_digest(modules or []))
+
+    def _extract_proof(self, theorem: Element, source: Source, modules: Optional[List[str]] = None):
+        """Replay a proof and capture the states plus dependencies."""
+        proof_attempt, context = self._proof_plan(theorem, source, modules)
+        with self.pool.connection() as client:
+            state = self._rpc("start", client.start, source.path, theorem.name)
+            proof_check, _ = self._replay_steps(client, state, proof_attempt, context, source.declared_names)
         return proof_check
 
+    def file_replay(self, source: Source, modules: Optional[List[str]] = None, incremental: bool = True) -> "FileReplay":
+        """Return a replayer that walks `source` theorem by theorem."""
+        return FileReplay(self, source, modules, incremental)
+
     def extract_toc(self, source: Source) -> List[Element]:
         """Read the table of contents for a source file."""
         elements = []
-        with Pytanque("127.0.0.1", self.pet_port) as client:
-            for name, details in client.toc(source.path):
+        with self.pool.connection() as client:
+            for name, details in self._rpc("toc", client.toc, source.path):
                 if details[-1]['detail'] in ['Lemma', 'Theorem']:
                     theorem = Element.from_dict(details[-1] | {"origin": str(source.path), "name": name, "statement": "statement"})
                     update_statement(theorem, source)
@@ -155,15 +205,12 @@ class TinyRocqParser(AbstractParser):
         """Read module names from `Locate` output."""
         return re.findall(r"^Module\s+([A-Za-z0-9_.]+)", feedback, re.MULTILINE)
 
-    def extract_dependencies(self, source: Source, thms: List[Element]) -> Tuple[List[str], List[str]]:
-        """Collect load paths and module dependencies from a source."""
-        """
-        TODO: for the moment Pytanque requires to be in a proof to use cmd such as About.
-        """
+    def _requires(self, source: Source) -> List[Tuple[str, str]]:
+        """`(From prefix, module)` of each module named by the `Require` commands of a source."""
         pattern = re.compile(
             r"""
             ^\s*
-            (?:From\s+\S+\s+)?      # optional 'From <library>'
+            (?:From\s+(?P<lib>\S+)\s+)?  # optional 'From <library>'
             Require\s+
             (?:Import|Export)?\s*   # optional 'Import' or 'Export'
             (?P<mods>[^.;]+)        # capture module list
@@ -176,30 +223,169 @@ class TinyRocqParser(AbstractParser):
        
         all_modules = []
         for m in pattern.finditer(source_content):
-            line_no = source_content.count("\n", 0, m.start()) + 1 # TODO: use it to recover the first usable state to Locate modules.
-            raw = m.group(1)
+            raw = m.group("mods")
             modules = [x for x in re.split(r"[\s,]+", raw.strip()) if x]
-            all_modules += modules
-    
-        with Pytanque("127.0.0.1", self.pet_port) as client:
-            for _ in range(10):
-                thm = random.choice(thms)
-                try:
-                    state = client.start(source.path, thm.name)
-                    break
-                except PetanqueError:
-                    pass
-            loadpath_state = client.run(state, 'Print LoadPath.')
-            feedback = self._extract_one_feedback(loadpath_state)
-            loadpath = self._parse_loadpath(feedback)
-            dependencies = []
-            for module in all_modules:
-                locatemodule_state = client.run(state, f'Locate {module}.')
-                feedback = self._extract_one_feedback(locatemodule_state)
-                dependency = self._parse_locate(feedback)
-                dependencies += dependency
-        return loadpath, dependencies
-
-    def __call__(self, theorem: Element, source: Source) -> List[Step]:
+            all_modules += [(m.group("lib") or "", module) for module in modules]
+        return all_modules
+
+    def _required_modules(self, source: Source) -> List[str]:
+        """Modules named by the `Require` commands of a source."""
+        return [module for _, module in self._requires(source)]
+
+    def _locate_keys(self, source: Source) -> List[Tuple[str, str]]:
+        """`(cache key, module)` of each required module.
+
+        Which module a `Require` loads depends on the load path (fixed for an
+        image), its `From` prefix and, for relative names, the file's directory.
+        """
+        directory = os.path.dirname(str(source.path))
+        return [(ResolutionCache.key(module, prefix, directory), module) for prefix, module in self._requires(source)]
+
+    def _cached_loadpath(self) -> Optional[Dict[str, str]]:
+        """Load path of the image, if already known."""
+        if self.loadpath is None:
+            found, loadpath = self.locate_cache.get(self.LOADPATH_KEY)
+            if found:
+                self.loadpath = loadpath
+        return self.loadpath
+
+    def _learn_loadpath(self, feedback: str):
+        """Record the parsed `Print LoadPath` output."""
+        self.loadpath = self._parse_loadpath(feedback)
+        self.locate_cache.put(self.LOADPATH_KEY, self.loadpath)
+
+    def _missing_locates(self, keys: List[Tuple[str, str]]) -> Dict[str, str]:
+        """Modules (by cache key) whose `Locate` is not cached yet."""
+        missing = {}
+        for key, module in keys:
+            if key in missing:
+                continue
+            found, _ = self.locate_cache.get(key)
+            self.metrics.count("locate_cache_hit" if found else "locate_cache_miss")
+            if not found:
+                missing[key] = module
+        return missing
+
+    def _located(self, keys: List[Tuple[str, str]]) -> List[str]:
+        """Concatenated cached `Locate` answers of `keys`, in order."""
+        dependencies = []
+        for key, _ in keys:
+            dependencies += self.locate_cache.entries[key]
+        return dependencies
+
+    def _start_any(self, client, source: Source, thms: List[Element], tries: int = 10):
+        """Start a proof of some theorem of `source` (commands such as `Locate` need one)."""
+        error = None
+        for _ in range(tries):
+            thm = random.choice(thms)
+            try:
+                return self._rpc("start", client.start, source.path, thm.name)
+            except PetanqueError as e:
+                error = e
+        raise error
+
+    def extract_dependencies(self, source: Source, thms: List[Element]) -> Tuple[List[str], List[str]]:
+        """Collect load paths and module dependencies from a source.
+
+        The load path is read once per image and each `Locate` once per
+        `locate_cache` key. A proof is started only when some Locate/LoadPath
+        answer is not cached, because Pytanque needs a proof state to run these
+        commands.
+        """
+        keys = self._locate_keys(source)
+        missing = self._missing_locates(keys)
+        if self._cached_loadpath() is None or missing:
+            with self.pool.connection() as client:
+                state = self._start_any(client, source, thms)
+                if self.loadpath is None:
+                    loadpath_state = self._rpc("loadpath", client.run, state, 'Print LoadPath.')
+                    self._learn_loadpath(self._extract_one_feedback(loadpath_state))
+                for key, module in missing.items():
+                    locatemodule_state = self._rpc("locate", client.run, state, f'Locate {module}.')
+                    feedback = self._extract_one_feedback(locatemodule_state)
+                    self.locate_cache.put(key, self._parse_locate(feedback))
+        return self.loadpath, self._located(keys)
+
+    def __call__(self, theorem: Element, source: Source, modules: Optional[List[str]] = None) -> List[Step]:
         """Extract the proof steps for a single theorem."""
-        return self._extract_proof(theorem, source)
+        return self._extract_proof(theorem, source, modules)
+
+
+class FileReplay:
+    """Replay the theorems of one file in document order, reusing checked states.
+
+    The state reached after the `Qed.` of a theorem is advanced over the text
+    up to the end of the next statement, so pet-server never rechecks the file
+    prefix. Whenever that fails (or after `reset`), the replay falls back to
+    `client.start` for the theorem and resynchronizes on its final state.
+    A theorem given up with `Admitted.` or `Abort.` raises `ProofNotFound`
+    before any call, so the next advance checks its text along the way.
+    """
+
+    def __init__(self, parser: TinyRocqParser, source: Source, modules: Optional[List[str]] = None, incremental: bool = True):
+        self.parser = parser
+        self.source = source
+        self.modules = modules
+        self.incremental = incremental
+        self.context = (str(source.path), context_digest(modules or []))
+        self.client = None
+        self.healthy = True
+        self.state = None
+        self.cursor = Position(0, 0)
+        self.reused = 0
+        self.started = 0
+
+    def _connect(self):
+        """Borrow the pooled connection used for the whole file."""
+        if self.client is None:
+            self.client = self.parser.pool.acquire()
+            self.healthy = True
+        return self.client
+
+    def _advance(self, theorem: Element) -> State:
+        """Check the text between the previous proof and the end of `theorem`'s statement."""
+        text = self.source.slice(self.cursor, theorem.range.end)
+        state = self.parser._rpc("advance", self.client.run, self.state, text, timeout=self.parser.timeout)
+        assert self.parser._rpc("goals", self.client.goals, state), f"Not in proof mode after {theorem.name} statement"
+        return state
+
+    def __call__(self, theorem: Element) -> List[Step]:
+        """Extract the proof steps of the next theorem of the file."""
+        if not self.incremental:
+            return self.parser._extract_proof(theorem, self.source, self.modules)
+        proof_attempt = self.parser._extract_proof_steps(theorem, self.source)
+        proof_end = self.parser._proof_end(theorem, self.source)
+        client = self._connect()
+        start = (theorem.range.start.line, theorem.range.start.character)
+        if self.state is not None and start >= (self.cursor.line, self.cursor.character):
+            try:
+                state = self._advance(theorem)
+                steps, self.state = self.parser._replay_steps(client, state, proof_attempt, self.context, self.source.declared_names)
+                self.cursor = proof_end
+                self.reused += 1
+                return steps
+            except (PetanqueError, AssertionError):
+                pass
+        self.state = None
+        try:
+            state = self.parser._rpc("start", client.start, self.source.path, theorem.name)
+            steps, self.state = self.parser._replay_steps(client, state, proof_attempt, self.context, self.source.declared_names)
+        except BaseException as e:
+            # Coq errors leave the connection usable; anything else may leave a reply in flight.
+            self.healthy = isinstance(e, (PetanqueError, AssertionError))
+            raise
+        self.cursor = proof_end
+        self.started += 1
+        return steps
+
+    def reset(self):
+        """Forget the current state, e.g. after pet-server was restarted."""
+        self.state = None
+        self.healthy = False
+        self.close()
+
+    def close(self):
+        """Give the connection back to the parser's pool."""
+        if self.client is not None:
+            self.parser.pool.release(self.client, self.healthy)
+            self.client = None
@@ -0,0 +1,85 @@
+"""Pre-started containers kept on standby for instant failover."""
+
+import queue
+import threading
+from typing import List, Optional
+
+from src.config.opam_config import OpamConfig
+from .opam_docker import OpamDocker
+
+WARM_PORT_STRIDE = 1000
+
+def standby_ports(port: int, size: int) -> List[int]:
+    """Ports of the standby containers of the process whose pet-server uses `port`."""
+    return [port + (i + 1) * WARM_PORT_STRIDE for i in range(size)]
+
+class WarmPool:
+    """Keep `size` containers of the same image with pet-server already listening.
+
+    `swap` hands out a ready container immediately; the replaced container is
+    closed and its port reused for a new standby in a background thread, so a
+    failover costs no container or pet-server start-up on the hot path.
+    """
+
+    def __init__(self, config: OpamConfig, ports: List[int], pet_timeout=30):
+        self.config = config
+        self.pet_timeout = pet_timeout
+        self.ready: "queue.Queue[OpamDocker]" = queue.Queue()
+        self.closed = False
+        self.threads: List[threading.Thread] = []
+        self.swaps = 0
+        self.misses = 0
+        for port in ports:
+            self._refill(port)
+
+    def _start(self, port: int, previous: Optional[OpamDocker] = None):
+        """Close `previous` (if any) then start a standby container on `port`."""
+        if previous is not None:
+            try:
+                previous.close()
+            except Exception:
+                pass
+        if self.closed:
+            return
+        try:
+            opam_docker = OpamDocker(self.config)
+            opam_docker.start_pet(port, timeout=self.pet_timeout)
+        except Exception as e:
+            print(f"WARNING: failed to start standby container on port {port}: {e}")
+            return
+        if self.closed:
+            opam_docker.close()
+            return
+        self.ready.put(opam_docker)
+
+    def _refill(self, port: int, previous: Optional[OpamDocker] = None):
+        """Start a standby container in the background."""
+        thread = threading.Thread(target=self._start, args=(port, previous), daemon=True)
+        thread.start()
+        self.threads = [t for t in self.threads if t.is_alive()] + [thread]
+
+    def available(self) -> int:
+        """Number of standby containers ready right now."""
+        return self.ready.qsize()
+
+    def swap(self, opam_docker: OpamDocker) -> Optional[OpamDocker]:
+        """Replace `opam_docker` by a ready standby, or return `None` if none is ready."""
+        try:
+            warm = self.ready.get_nowait()
+        except queue.Empty:
+            self.misses += 1
+            return None
+        self.swaps += 1
+        self._refill(opam_docker.pet_port, previous=opam_docker)
+        return warm
+
+    def close(self):
+        """Stop refilling and remove every standby container."""
+        self.closed = True
+        for thread in self.threads:
+            thread.join(timeout=self.pet_timeout + 10)
+        while not self.ready.empty():
+            try:
+                self.ready.get_nowait().close()
+            except Exception:
+                pass
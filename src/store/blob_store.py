@@ -0,0 +1,114 @@
+"""Content-addressed, compressed store for source texts shared by all stages."""
+
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import zlib
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+class BlobStore:
+    """Append-only pack of zlib-compressed blobs addressed by content hash.
+
+    `<root>/blobs.pack` holds the compressed blobs back to back and
+    `<root>/blobs.idx` holds one fixed-size record per blob (digest, offset,
+    compressed length), so the whole index loads with a single read and the
+    pack is read through `mmap`. Appends take a file lock, so several
+    processes may write to the same store.
+    """
+
+    DIGEST_SIZE = 20
+    RECORD = struct.Struct(f"<{DIGEST_SIZE}sQQ")
+
+    def __init__(self, root: str, cache_size: int = 256, level: int = 6):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.pack_path = os.path.join(root, "blobs.pack")
+        self.index_path = os.path.join(root, "blobs.idx")
+        self.level = level
+        self.cache_size = cache_size
+        self.cache: "OrderedDict[str, str]" = OrderedDict()
+        self.index: Dict[bytes, Tuple[int, int]] = {}
+        self.index_bytes = 0
+        self.map: Optional[mmap.mmap] = None
+        for path in (self.pack_path, self.index_path):
+            open(path, 'ab').close()
+        self._refresh_index()
+
+    @classmethod
+    def for_output(cls, output: str, create: bool = False) -> Optional["BlobStore"]:
+        """Store attached to a pipeline `output` prefix, if it exists (or `create`)."""
+        root = output + '_blobs'
+        if not create and not os.path.isdir(root):
+            return None
+        return cls(root)
+
+    @classmethod
+    def hash(cls, text: str) -> str:
+        """Content hash used as blob key."""
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=cls.DIGEST_SIZE).hexdigest()
+
+    def _refresh_index(self):
+        """Load index records appended since the last refresh."""
+        with open(self.index_path, 'rb') as file:
+            file.seek(self.index_bytes)
+            data = file.read()
+        data = data[:len(data) - len(data) % self.RECORD.size]
+        for digest, offset, length in self.RECORD.iter_unpack(data):
+            self.index[digest] = (offset, length)
+        self.index_bytes += len(data)
+
+    def _mapped(self, end: int) -> mmap.mmap:
+        """Memory map of the pack covering at least `end` bytes."""
+        if self.map is None or len(self.map) < end:
+            if self.map is not None:
+                self.map.close()
+            with open(self.pack_path, 'rb') as file:
+                self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.map
+
+    def __contains__(self, key: str) -> bool:
+        digest = bytes.fromhex(key)
+        if digest not in self.index:
+            self._refresh_index()
+        return digest in self.index
+
+    def put(self, text: str) -> str:
+        """Store `text` (once) and return its hash."""
+        key = self.hash(text)
+        if key in self:
+            return key
+        data = zlib.compress(text.encode('utf-8'), self.level)
+        with open(self.index_path, 'ab') as index_file:
+            fcntl.flock(index_file, fcntl.LOCK_EX)
+            self._refresh_index()
+            if bytes.fromhex(key) not in self.index:
+                with open(self.pack_path, 'ab') as pack_file:
+                    offset = pack_file.tell()
+                    pack_file.write(data)
+                index_file.write(self.RECORD.pack(bytes.fromhex(key), offset, len(data)))
+                index_file.flush()
+                self._refresh_index()
+        return key
+
+    def get(self, key: str) -> str:
+        """Return the text stored under `key`."""
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        if key not in self:
+            raise KeyError(f"Blob {key} not found in {self.root}")
+        offset, length = self.index[bytes.fromhex(key)]
+        text = zlib.decompress(self._mapped(offset + length)[offset:offset + length]).decode('utf-8')
+        self.cache[key] = text
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return text
+
+    def close(self):
+        """Release the memory map."""
+        if self.map is not None:
+            self.map.close()
+            self.map = None
@@ -0,0 +1,245 @@
+"""Columnar, memory-mapped training set of (goal, premises) proof steps."""
+
+import hashlib
+import json
+import mmap
+import os
+import random
+import shutil
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+FORMAT_VERSION = 1
+
+# Column name -> array typecode; `*_offsets` columns have one more entry than rows.
+COLUMNS = {
+    "goal_ids": "I",        # row -> distinct goal
+    "goal_offsets": "Q",    # distinct goal -> byte range in goals.bin
+    "tactic_offsets": "Q",  # row -> byte range in tactics.bin
+    "premise_offsets": "Q", # row -> range in premise_ids
+    "premise_ids": "I",     # concatenated premise ids of every row
+    "theorem_ids": "I",     # row -> theorem
+}
+
+def render_goals(goals: List[Dict[str, Any]]) -> str:
+    """Plain-text view of a goal list: hypotheses then conclusion, one block per goal."""
+    blocks = []
+    for goal in goals:
+        lines = [f"{', '.join(hyp['names'])} : {hyp['ty']}" for hyp in goal.get("hyps", [])]
+        blocks.append("\n".join(lines + [f"⊢ {goal['ty']}"]))
+    return "\n\n".join(blocks)
+
+class ColumnarWriter:
+    """Build a dataset directory row by row.
+
+    Texts go to `goals.bin`/`tactics.bin`, numbers to one flat binary file per
+    column (native `array` layout), names to JSON tables. Identical goals are
+    stored once. Everything is written to `<root>.tmp` and renamed on `close`.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.tmp = root + '.tmp'
+        shutil.rmtree(self.tmp, ignore_errors=True)
+        os.makedirs(self.tmp)
+        self.columns = {name: array(typecode) for name, typecode in COLUMNS.items()}
+        self.columns["goal_offsets"].append(0)
+        self.columns["tactic_offsets"].append(0)
+        self.columns["premise_offsets"].append(0)
+        self.goals_file = open(os.path.join(self.tmp, "goals.bin"), 'wb')
+        self.tactics_file = open(os.path.join(self.tmp, "tactics.bin"), 'wb')
+        self.goal_index: Dict[bytes, int] = {}
+        self.premises: Dict[Tuple[str, str], int] = {}
+        self.theorems: List[Tuple[str, str]] = []
+
+    def add_theorem(self, origin: str, name: str) -> int:
+        """Register a theorem and return its id."""
+        self.theorems.append((origin, name))
+        return len(self.theorems) - 1
+
+    def premise_id(self, origin: str, name: str) -> int:
+        """Integer id of a premise, assigned on first sight."""
+        return self.premises.setdefault((origin, name), len(self.premises))
+
+    def _goal_id(self, text: str) -> int:
+        data = text.encode('utf-8')
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        goal_id = self.goal_index.get(digest)
+        if goal_id is None:
+            goal_id = self.goal_index[digest] = len(self.goal_index)
+            self.goals_file.write(data)
+            offsets = self.columns["goal_offsets"]
+            offsets.append(offsets[-1] + len(data))
+        return goal_id
+
+    def add_step(self, theorem_id: int, goal: str, tactic: str, premise_ids: List[int]):
+        """Append one row."""
+        c = self.columns
+        c["goal_ids"].append(self._goal_id(goal))
+        data = tactic.encode('utf-8')
+        self.tactics_file.write(data)
+        c["tactic_offsets"].append(c["tactic_offsets"][-1] + len(data))
+        c["premise_ids"].extend(premise_ids)
+        c["premise_offsets"].append(len(c["premise_ids"]))
+        c["theorem_ids"].append(theorem_id)
+
+    def close(self) -> int:
+        """Write the columns and tables, publish the directory and return the number of rows."""
+        self.goals_file.close()
+        self.tactics_file.close()
+        for name, values in self.columns.items():
+            with open(os.path.join(self.tmp, name + ".bin"), 'wb') as file:
+                values.tofile(file)
+        rows = len(self.columns["goal_ids"])
+        tables = {
+            "premises.json": [list(key) for key in sorted(self.premises, key=self.premises.get)],
+            "theorems.json": [list(key) for key in self.theorems],
+            "meta.json": {"version": FORMAT_VERSION, "rows": rows, "goals": len(self.goal_index),
+                          "typecodes": {name: [code, array(code).itemsize] for name, code in COLUMNS.items()}},
+        }
+        for name, value in tables.items():
+            with open(os.path.join(self.tmp, name), 'w') as file:
+                json.dump(value, file)
+        shutil.rmtree(self.root, ignore_errors=True)
+        os.replace(self.tmp, self.root)
+        return rows
+
+def export_elements(entries: Iterable[Dict[str, Any]], root: str, min_premises: int = 1) -> int:
+    """Write the steps of `_elements.jsonl` entries (with plain goals) as a columnar dataset."""
+    writer = ColumnarWriter(root)
+    for entry in entries:
+        theorem = entry["theorem"]
+        theorem_id = None
+        for step in entry["steps"]:
+            premises = [writer.premise_id(dep["origin"], dep["name"]) for dep in step["dependencies"] if dep["kind"] == "premise"]
+            if len(premises) < min_premises:
+                continue
+            if theorem_id is None:
+                theorem_id = writer.add_theorem(theorem["origin"], theorem["name"])
+            writer.add_step(theorem_id, render_goals(step["state_in"]), step["step"], premises)
+    return writer.close()
+
+def key_at(blob: memoryview, offsets: memoryview, i: int, order: Optional[memoryview] = None) -> bytes:
+    """`i`-th string of a `blob`/`offsets` pair, through the permutation `order` if given."""
+    if order is not None:
+        i = order[i]
+    return bytes(blob[offsets[i]:offsets[i + 1]])
+
+def lower_bound(blob: memoryview, offsets: memoryview, key: bytes, order: Optional[memoryview] = None) -> int:
+    """First position whose string is `>= key`, the strings being sorted (in `order` if given)."""
+    lo, hi = 0, len(offsets) - 1
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if key_at(blob, offsets, mid, order) < key:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+class MappedFiles:
+    """Read-only memory maps of the files of a directory, released together."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.maps: List[mmap.mmap] = []
+        self.views: List[memoryview] = []
+
+    def open(self, name: str, typecode: Optional[str] = None) -> memoryview:
+        """Content of `name`, as bytes or cast to an array `typecode`."""
+        with open(os.path.join(self.root, name), 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                view = memoryview(b"")
+            else:
+                mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                self.maps.append(mapped)
+                view = memoryview(mapped)
+        if typecode is not None:
+            self.views.append(view)
+            view = view.cast(typecode)
+        self.views.append(view)
+        return view
+
+    def close(self):
+        """Release every view, then the maps."""
+        for view in reversed(self.views):
+            view.release()
+        for mapped in self.maps:
+            mapped.close()
+        self.views, self.maps = [], []
+
+class StepDataset:
+    """Read-only, memory-mapped view of a dataset written by `ColumnarWriter`.
+
+    Nothing is parsed up front: rows are decoded on access from the shared
+    page cache, so data-loader processes forked after opening (or opening the
+    same directory) hold no private copy.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        with open(os.path.join(root, "meta.json")) as file:
+            self.meta = json.load(file)
+        if self.meta["version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported dataset version {self.meta['version']} in {root}")
+        for name, (code, size) in self.meta["typecodes"].items():
+            if array(code).itemsize != size:
+                raise ValueError(f"Column {name} was written with {size}-byte items, this platform uses {array(code).itemsize}")
+        self.files = MappedFiles(root)
+        self.goals = self.files.open("goals.bin")
+        self.tactics = self.files.open("tactics.bin")
+        for name, code in COLUMNS.items():
+            setattr(self, name, self.files.open(name + ".bin", code))
+        self._premises: Optional[List[List[str]]] = None
+        self._theorems: Optional[List[List[str]]] = None
+
+    def __len__(self) -> int:
+        return self.meta["rows"]
+
+    def goal(self, i: int) -> str:
+        """Goal text of row `i`."""
+        goal_id = self.goal_ids[i]
+        return bytes(self.goals[self.goal_offsets[goal_id]:self.goal_offsets[goal_id + 1]]).decode('utf-8')
+
+    def tactic(self, i: int) -> str:
+        """Tactic of row `i`."""
+        return bytes(self.tactics[self.tactic_offsets[i]:self.tactic_offsets[i + 1]]).decode('utf-8')
+
+    def premises(self, i: int) -> List[int]:
+        """Premise ids of row `i`."""
+        return self.premise_ids[self.premise_offsets[i]:self.premise_offsets[i + 1]].tolist()
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return {"goal": self.goal(i), "tactic": self.tactic(i), "premises": self.premises(i), "theorem": self.theorem_ids[i]}
+
+    def premise_name(self, premise_id: int) -> Tuple[str, str]:
+        """`(origin, name)` of a premise id."""
+        if self._premises is None:
+            with open(os.path.join(self.root, "premises.json")) as file:
+                self._premises = json.load(file)
+        return tuple(self._premises[premise_id])
+
+    def theorem_name(self, theorem_id: int) -> Tuple[str, str]:
+        """`(origin, name)` of a theorem id."""
+        if self._theorems is None:
+            with open(os.path.join(self.root, "theorems.json")) as file:
+                self._theorems = json.load(file)
+        return tuple(self._theorems[theorem_id])
+
+    def batches(self, batch_size: int, shuffle: bool = True, seed: Optional[int] = None, drop_last: bool = False,
+                rank: int = 0, world_size: int = 1) -> Iterator[List[Dict[str, Any]]]:
+        """Yield lists of rows; with `world_size > 1`, only the `rank`-th shard of the (shuffled) order."""
+        order = list(range(len(self)))
+        if shuffle:
+            random.Random(seed).shuffle(order)
+        order = order[rank::world_size]
+        for start in range(0, len(order), batch_size):
+            chunk = order[start:start + batch_size]
+            if drop_last and len(chunk) < batch_size:
+                return
+            yield [self[i] for i in chunk]
+
+    def close(self):
+        """Release the memory maps."""
+        self.files.close()
@@ -0,0 +1,75 @@
+"""Per-library table of proof goals interned by content hash."""
+
+import json
+import os
+from dataclasses import asdict, is_dataclass
+from typing import Any, Dict, List, Optional
+
+from .blob_store import BlobStore
+
+class GoalTable:
+    """Goals stored once in a `BlobStore`, referred to by their hash.
+
+    `intern_steps` turns the `state_in`/`state_out` goal lists of serialized
+    steps into lists of goal ids; `expand_entry` rebuilds the plain format.
+    Consecutive steps share their goal objects, so each one is hashed once.
+    """
+
+    def __init__(self, root: str, cache_size: int = 4096):
+        self.blobs = BlobStore(root, cache_size=cache_size)
+        self.interned = 0
+        self.stored = 0
+
+    @classmethod
+    def for_output(cls, output: str, create: bool = False) -> Optional["GoalTable"]:
+        """Table attached to a pipeline `output` prefix, if it exists (or `create`)."""
+        root = output + '_goals'
+        if not create and not os.path.isdir(root):
+            return None
+        return cls(root)
+
+    def intern(self, goal: Any) -> str:
+        """Store one goal (dataclass or dict) and return its id."""
+        text = json.dumps(asdict(goal) if is_dataclass(goal) else goal, sort_keys=True, separators=(",", ":"))
+        before = len(self.blobs.index)
+        key = self.blobs.put(text)
+        self.interned += 1
+        self.stored += len(self.blobs.index) - before
+        return key
+
+    def intern_steps(self, steps: List[Any]) -> List[Dict[str, Any]]:
+        """Serialize `Step`s with their goals replaced by ids."""
+        ids: Dict[int, str] = {}
+
+        def refs(goals):
+            out = []
+            for goal in goals:
+                if id(goal) not in ids:
+                    ids[id(goal)] = self.intern(goal)
+                out.append(ids[id(goal)])
+            return out
+
+        serialized = []
+        for step in steps:
+            serialized.append({
+                "step": step.step,
+                "state_in": refs(step.state_in),
+                "state_out": refs(step.state_out),
+                "dependencies": [asdict(dependency) for dependency in step.dependencies],
+            })
+        return serialized
+
+    def lookup(self, goal_id: str) -> Dict[str, Any]:
+        """Goal stored under `goal_id`."""
+        return json.loads(self.blobs.get(goal_id))
+
+    def expand_entry(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """`_elements.jsonl` entry with goal ids replaced by the goals (in place)."""
+        for step in entry["steps"]:
+            for field in ("state_in", "state_out"):
+                step[field] = [self.lookup(goal) if isinstance(goal, str) else goal for goal in step[field]]
+        return entry
+
+    def close(self):
+        """Release the underlying store."""
+        self.blobs.close()
@@ -0,0 +1,175 @@
+"""Inverted index from premises to the proofs that use them, for `sample_uses`."""
+
+import fcntl
+import json
+import os
+import random
+import shutil
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .columnar import MappedFiles, key_at, lower_bound, render_goals
+
+MANIFEST = "segments.json"
+
+def premise_key(origin: str, name: str) -> str:
+    """Fully qualified name under which a premise is indexed."""
+    return f"{origin}.{name}" if origin else name
+
+def build_segment(entries: Iterable[Dict[str, Any]], root: str) -> Dict[str, int]:
+    """Write the index of one library's `_elements.jsonl` entries (with plain goals) to `root`.
+
+    `keys.bin`/`key_offsets.bin` hold the sorted premise keys, `postings.bin`
+    the `(proof, step)` pairs of each key (one per proof, at the first step
+    using it) and `proofs.bin`/`proof_offsets.bin` one JSON record per proof
+    with its statement, initial goal and tactics.
+    """
+    tmp = root + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    uses: Dict[str, List[Tuple[int, int]]] = {}
+    proof_offsets = array("Q", [0])
+    n_proofs = 0
+    with open(os.path.join(tmp, "proofs.bin"), 'wb') as proofs_file:
+        for entry in entries:
+            first_use: Dict[str, int] = {}
+            for i, step in enumerate(entry["steps"]):
+                for dep in step["dependencies"]:
+                    if dep["kind"] == "premise":
+                        first_use.setdefault(premise_key(dep["origin"], dep["name"]), i)
+            if not first_use:
+                continue
+            theorem, steps = entry["theorem"], entry["steps"]
+            record = {"origin": theorem["origin"], "name": theorem["name"], "statement": theorem.get("statement"),
+                      "goal": render_goals(steps[0]["state_in"]), "proof": [step["step"] for step in steps]}
+            data = json.dumps(record).encode('utf-8')
+            proofs_file.write(data)
+            proof_offsets.append(proof_offsets[-1] + len(data))
+            for key, step in first_use.items():
+                uses.setdefault(key, []).append((n_proofs, step))
+            n_proofs += 1
+
+    keys = sorted(uses)
+    key_offsets, postings_offsets, postings = array("Q", [0]), array("Q", [0]), array("I")
+    with open(os.path.join(tmp, "keys.bin"), 'wb') as keys_file:
+        for key in keys:
+            data = key.encode('utf-8')
+            keys_file.write(data)
+            key_offsets.append(key_offsets[-1] + len(data))
+            for proof, step in uses[key]:
+                postings.extend((proof, step))
+            postings_offsets.append(len(postings) // 2)
+    for name, values in (("key_offsets", key_offsets), ("postings_offsets", postings_offsets), ("postings", postings), ("proof_offsets", proof_offsets)):
+        with open(os.path.join(tmp, name + ".bin"), 'wb') as file:
+            values.tofile(file)
+    shutil.rmtree(root, ignore_errors=True)
+    os.replace(tmp, root)
+    return {"premises": len(keys), "proofs": n_proofs, "uses": len(postings) // 2}
+
+def update_index(root: str, segment: str, entries: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+    """(Re)build the segment of one library and register it in the index manifest."""
+    os.makedirs(root, exist_ok=True)
+    stats = build_segment(entries, os.path.join(root, segment))
+    with open(os.path.join(root, ".lock"), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        manifest = _read_manifest(root)
+        manifest[segment] = stats
+        tmp = os.path.join(root, MANIFEST + f".{os.getpid()}.tmp")
+        with open(tmp, 'w') as file:
+            json.dump(manifest, file)
+        os.replace(tmp, os.path.join(root, MANIFEST))
+    return stats
+
+def _read_manifest(root: str) -> Dict[str, Dict[str, int]]:
+    path = os.path.join(root, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+class _Segment:
+    """Memory-mapped index of one library."""
+
+    def __init__(self, root: str):
+        self.files = MappedFiles(root)
+        self.keys = self.files.open("keys.bin")
+        self.key_offsets = self.files.open("key_offsets.bin", "Q")
+        self.postings = self.files.open("postings.bin", "I")
+        self.postings_offsets = self.files.open("postings_offsets.bin", "Q")
+        self.proofs = self.files.open("proofs.bin")
+        self.proof_offsets = self.files.open("proof_offsets.bin", "Q")
+
+    def find(self, key: bytes) -> Tuple[int, int]:
+        """Range of postings of `key` (empty if absent), by binary search over the sorted keys."""
+        i = lower_bound(self.keys, self.key_offsets, key)
+        if i < len(self.key_offsets) - 1 and key_at(self.keys, self.key_offsets, i) == key:
+            return self.postings_offsets[i], self.postings_offsets[i + 1]
+        return 0, 0
+
+    def use(self, posting: int) -> Dict[str, Any]:
+        """Proof record of one posting, with the index of the step using the premise."""
+        proof, step = self.postings[2 * posting], self.postings[2 * posting + 1]
+        record = json.loads(bytes(self.proofs[self.proof_offsets[proof]:self.proof_offsets[proof + 1]]))
+        record["step"] = step
+        return record
+
+    def close(self):
+        self.files.close()
+
+class PremiseIndex:
+    """Read side of the index: every segment of the manifest, memory-mapped.
+
+    Lookups touch only the mapped pages, so one index can be opened by many
+    rollout workers; `refresh` picks up segments added or rebuilt since.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.segments: Dict[str, _Segment] = {}
+        self.manifest_version = None
+        self.refresh()
+
+    def refresh(self):
+        """Reopen the segments if the manifest changed (not concurrently with queries)."""
+        path = os.path.join(self.root, MANIFEST)
+        stat = os.stat(path) if os.path.exists(path) else None
+        version = (stat.st_ino, stat.st_mtime_ns) if stat else None
+        if version == self.manifest_version:
+            return
+        self.manifest_version = version
+        old, self.segments = self.segments, {name: _Segment(os.path.join(self.root, name)) for name in _read_manifest(self.root)}
+        for segment in old.values():
+            segment.close()
+
+    def _ranges(self, premise: str) -> List[Tuple[_Segment, int, int]]:
+        key = premise.encode('utf-8')
+        ranges = []
+        for segment in self.segments.values():
+            start, end = segment.find(key)
+            if end > start:
+                ranges.append((segment, start, end))
+        return ranges
+
+    def count(self, premise: str) -> int:
+        """Number of indexed proofs using `premise`."""
+        return sum(end - start for _, start, end in self._ranges(premise))
+
+    def sample_uses(self, premise: str, k: int = 3, rng: Optional[random.Random] = None) -> List[Dict[str, Any]]:
+        """Up to `k` distinct random proofs using `premise`, with their initial goals."""
+        ranges = self._ranges(premise)
+        total = sum(end - start for _, start, end in ranges)
+        picks = (rng or random).sample(range(total), min(k, total))
+        uses = []
+        for pick in picks:
+            for segment, start, end in ranges:
+                if pick < end - start:
+                    uses.append(segment.use(start + pick))
+                    break
+                pick -= end - start
+        return uses
+
+    def close(self):
+        """Release every segment."""
+        for segment in self.segments.values():
+            segment.close()
+        self.segments = {}
@@ -0,0 +1,122 @@
+"""Precomputed simplified views of source files, backing the `read` tool."""
+
+import json
+import os
+import re
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from src.parser.parser import Position, Source
+from .blob_store import BlobStore
+
+PROOF_END = re.compile(r"\b(Qed|Defined|Admitted|Abort)\.")
+
+def simplify(source: Source, theorems: List[Dict[str, Any]]) -> str:
+    """Content of `source` with the proof of every theorem (after its statement range) replaced by a one-line stub."""
+    content = source.content
+    parts, cursor = [], 0
+    for theorem in sorted(theorems, key=lambda t: (t["range"]["end"]["line"], t["range"]["end"]["character"])):
+        end = Position.from_dict(theorem["range"]["end"])
+        start = source.offset(Position(min(end.line, len(source.line_starts) - 1), end.character))
+        if start < cursor:
+            continue
+        end = PROOF_END.search(content, start)
+        if end is None:
+            continue
+        elided = content.count("\n", start, end.start())
+        parts.append(content[cursor:start])
+        parts.append(f"\nProof. (* {elided} lines elided *) {end.group(0)}")
+        cursor = end.end()
+    parts.append(content[cursor:])
+    return "".join(parts)
+
+def views_path(output: str) -> str:
+    """Directory of the read views of a library."""
+    return output + '_views'
+
+class ReadViewWriter:
+    """Split views into fixed-size line chunks stored (deduplicated, compressed) in a `BlobStore`."""
+
+    def __init__(self, root: str, chunk_lines: int = 100):
+        self.root = root
+        self.chunk_lines = chunk_lines
+        self.blobs = BlobStore(root, cache_size=0)
+        self.index: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, path: str, view: str):
+        """Store the view of `path`."""
+        view = Source(path, view)
+        lines = view.line_count
+        chunks = [view.slice(Position(i, 0), Position(min(i + self.chunk_lines, lines), 0)) for i in range(0, lines, self.chunk_lines)]
+        self.index[path] = {"lines": lines, "chunks": [self.blobs.put(chunk) for chunk in chunks]}
+
+    def close(self):
+        """Write the index atomically."""
+        tmp = os.path.join(self.root, f"index.json.{os.getpid()}.tmp")
+        with open(tmp, 'w') as file:
+            json.dump({"chunk_lines": self.chunk_lines, "views": self.index}, file)
+        os.replace(tmp, os.path.join(self.root, "index.json"))
+        self.blobs.close()
+
+class ReadViews:
+    """Serve line ranges of the views, through an LRU of decoded chunks bounded in bytes."""
+
+    def __init__(self, root: str, cache_bytes: int = 64 * 2**20, metrics=None):
+        with open(os.path.join(root, "index.json")) as file:
+            index = json.load(file)
+        self.chunk_lines = index["chunk_lines"]
+        self.views: Dict[str, Dict[str, Any]] = index["views"]
+        self.blobs = BlobStore(root, cache_size=0)
+        self.cache: "OrderedDict[str, Source]" = OrderedDict()
+        self.cache_bytes = cache_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.metrics = metrics
+
+    def _chunk(self, key: str) -> Source:
+        """Decoded chunk, with its line index."""
+        chunk = self.cache.get(key)
+        if chunk is not None:
+            self.cache.move_to_end(key)
+            self.hits += 1
+            if self.metrics is not None:
+                self.metrics.count("read_view_hit")
+            return chunk
+        self.misses += 1
+        if self.metrics is not None:
+            self.metrics.count("read_view_miss")
+        chunk = self.cache[key] = Source(key, self.blobs.get(key))
+        self.size += len(chunk.content)
+        while self.size > self.cache_bytes and len(self.cache) > 1:
+            _, evicted = self.cache.popitem(last=False)
+            self.size -= len(evicted.content)
+            self.evictions += 1
+        return chunk
+
+    def lines(self, path: str) -> int:
+        """Number of lines of the view of `path`."""
+        return self.views[path]["lines"]
+
+    def read(self, path: str, start: int = 0, count: Optional[int] = None) -> str:
+        """Lines `[start, start + count)` of the view of `path` (to the end by default)."""
+        view = self.views.get(path)
+        if view is None:
+            raise KeyError(f"No view for {path}")
+        end = view["lines"] if count is None else min(view["lines"], start + count)
+        out = []
+        for i in range(start // self.chunk_lines, -(-end // self.chunk_lines)):
+            chunk, base = self._chunk(view["chunks"][i]), i * self.chunk_lines
+            out.append(chunk.slice(Position(max(start - base, 0), 0), Position(min(end - base, chunk.line_count), 0)))
+        return "".join(out)
+
+    def stats(self):
+        """Cache hits, misses, hit rate, evictions and size in bytes."""
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions, "size_bytes": self.size}
+
+    def close(self):
+        """Release the underlying store."""
+        self.blobs.close()
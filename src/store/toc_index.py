@@ -0,0 +1,177 @@
+"""Module/theorem trie keyed by logical path, backing the `toc` tool."""
+
+import json
+import os
+import shutil
+from array import array
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional
+
+from .columnar import MappedFiles, key_at, lower_bound
+
+FORMAT_VERSION = 1
+STATEMENT_WIDTH = 160
+
+def logical_path(source_path: str, loadpath: Dict[str, str], library: str = "") -> str:
+    """Logical module of a source file, from the longest load-path root containing it."""
+    best = None
+    for name, physical in loadpath.items():
+        prefix = physical.rstrip("/") + "/"
+        if source_path.startswith(prefix) and (best is None or len(prefix) > len(best[1])):
+            best = (name, prefix)
+    if best is None:
+        stem = os.path.splitext(os.path.basename(source_path))[0]
+        return f"{library}.{stem}" if library else stem
+    relative = os.path.splitext(source_path[len(best[1]):])[0]
+    return ".".join([best[0]] + [part for part in relative.split("/") if part])
+
+class _Node:
+    __slots__ = ("children", "statement", "theorems")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.statement: Optional[str] = None
+        self.theorems = 0
+
+def _ordered(node: _Node) -> List[str]:
+    """Children names: modules first, then theorems, each alphabetically."""
+    return sorted(node.children, key=lambda name: (not node.children[name].children, name))
+
+def _line(name: str, node: _Node) -> str:
+    """One-line view of a node as listed under its parent."""
+    if node.children:
+        line = f"module {name} ({node.theorems} theorems)"
+        if node.statement is not None:
+            line += f" | {node.statement}"
+        return line + "\n"
+    return f"{node.statement or name}\n"
+
+def build_toc_index(entries: Iterable[Dict[str, Any]], root: str) -> int:
+    """Write the trie of the `_metadata.jsonl` entries of any number of libraries to `root`.
+
+    Nodes are numbered breadth-first so the children of a node are contiguous:
+    their listing lines (`lines.bin`) form one slice, which makes a rendered
+    page a single copy. Paths are stored with a sorted permutation for lookup
+    and prefix search.
+    """
+    top = _Node()
+    for entry in entries:
+        module = logical_path(entry["source"]["path"], entry.get("loadpath") or {}, entry.get("library", ""))
+        node = top
+        for part in module.split("."):
+            node = node.children.setdefault(part, _Node())
+        for theorem in entry["theorems"]:
+            leaf = node.children.setdefault(theorem["name"], _Node())
+            statement = " ".join(theorem.get("statement", "").split())
+            leaf.statement = statement[:STATEMENT_WIDTH] + ("..." if len(statement) > STATEMENT_WIDTH else "") or theorem["name"]
+
+    def count(node: _Node) -> int:
+        node.theorems = (node.statement is not None) + sum(count(child) for child in node.children.values())
+        return node.theorems
+    count(top)
+
+    tmp = root + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    columns = {name: array("Q", [0]) for name in ("path_offsets", "line_offsets")}
+    columns.update({name: array("I") for name in ("first_child", "child_count", "theorem_count")})
+    paths: List[bytes] = []
+    queue = deque([("", "", top)])
+    next_id = 1
+    with open(os.path.join(tmp, "paths.bin"), 'wb') as paths_file, open(os.path.join(tmp, "lines.bin"), 'wb') as lines_file:
+        while queue:
+            path, name, node = queue.popleft()
+            data = path.encode('utf-8')
+            paths.append(data)
+            paths_file.write(data)
+            columns["path_offsets"].append(columns["path_offsets"][-1] + len(data))
+            line = _line(name, node).encode('utf-8') if path else b""
+            lines_file.write(line)
+            columns["line_offsets"].append(columns["line_offsets"][-1] + len(line))
+            names = _ordered(node)
+            columns["first_child"].append(next_id)
+            columns["child_count"].append(len(names))
+            columns["theorem_count"].append(node.theorems)
+            next_id += len(names)
+            for child in names:
+                queue.append((f"{path}.{child}" if path else child, child, node.children[child]))
+    columns["sorted_ids"] = array("I", sorted(range(len(paths)), key=paths.__getitem__))
+    for name, values in columns.items():
+        with open(os.path.join(tmp, name + ".bin"), 'wb') as file:
+            values.tofile(file)
+    with open(os.path.join(tmp, "meta.json"), 'w') as file:
+        json.dump({"version": FORMAT_VERSION, "nodes": len(paths)}, file)
+    shutil.rmtree(root, ignore_errors=True)
+    os.replace(tmp, root)
+    return len(paths)
+
+class TocIndex:
+    """Memory-mapped trie written by `build_toc_index`.
+
+    Opening maps a few files and parses nothing, so it takes milliseconds, and
+    rollout workers opening the same directory share its pages.
+    """
+
+    def __init__(self, root: str):
+        with open(os.path.join(root, "meta.json")) as file:
+            meta = json.load(file)
+        if meta["version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported ToC index version {meta['version']} in {root}")
+        self.files = MappedFiles(root)
+        self.paths = self.files.open("paths.bin")
+        self.lines = self.files.open("lines.bin")
+        for name in ("path_offsets", "line_offsets"):
+            setattr(self, name, self.files.open(name + ".bin", "Q"))
+        for name in ("first_child", "child_count", "theorem_count", "sorted_ids"):
+            setattr(self, name, self.files.open(name + ".bin", "I"))
+
+    def __len__(self) -> int:
+        return len(self.first_child)
+
+    def find(self, path: str) -> Optional[int]:
+        """Node id of a logical path (`""` is the root), or `None`."""
+        key = path.encode('utf-8')
+        i = lower_bound(self.paths, self.path_offsets, key, self.sorted_ids)
+        if i < len(self) and key_at(self.paths, self.path_offsets, i, self.sorted_ids) == key:
+            return self.sorted_ids[i]
+        return None
+
+    def path(self, node: int) -> str:
+        """Logical path of a node."""
+        return key_at(self.paths, self.path_offsets, node).decode('utf-8')
+
+    def children(self, path: str, offset: int = 0, limit: int = 50) -> List[Dict[str, Any]]:
+        """Entries directly under `path` (modules first), paginated."""
+        node = self.find(path)
+        if node is None:
+            raise KeyError(path)
+        first, count = self.first_child[node], self.child_count[node]
+        return [{"path": self.path(child), "module": self.child_count[child] > 0, "theorems": self.theorem_count[child]}
+                for child in range(first + offset, first + min(count, offset + limit))]
+
+    def search(self, prefix: str, offset: int = 0, limit: int = 50) -> List[str]:
+        """Logical paths starting with `prefix`, in lexicographic order, paginated."""
+        key = prefix.encode('utf-8')
+        start = lower_bound(self.paths, self.path_offsets, key, self.sorted_ids) + offset
+        found = []
+        for i in range(start, len(self)):
+            path = key_at(self.paths, self.path_offsets, i, self.sorted_ids)
+            if not path.startswith(key) or len(found) >= limit:
+                break
+            found.append(path.decode('utf-8'))
+        return found
+
+    def render(self, path: str, page: int = 0, page_size: int = 50) -> str:
+        """Text view of one page of the entries under `path`."""
+        node = self.find(path)
+        if node is None:
+            return f"{path}: not found\n"
+        first, count = self.first_child[node], self.child_count[node]
+        pages = max(1, -(-count // page_size))
+        start, end = first + min(page * page_size, count), first + min((page + 1) * page_size, count)
+        header = f"{path or '<root>'}: {count} entries, {self.theorem_count[node]} theorems (page {page + 1}/{pages})\n"
+        return header + bytes(self.lines[self.line_offsets[start]:self.line_offsets[end]]).decode('utf-8')
+
+    def close(self):
+        """Release the memory maps."""
+        self.files.close()
@@ -0,0 +1,29 @@
+"""Unit tests for the tactic-AST dependency extractor."""
+
+import random
+
+from bench.bench_ast import reference_dependencies, synthetic_ast
+from src.parser.ast_deps import list_dependencies, qualid_references
+
+def _qualid(path, name):
+    return ["Ser_Qualid", ["DirPath", [["Id", part] for part in path]], ["Id", name]]
+
+def test_matches_recursive_walk():
+    """Same names, in the same order, as the original implementation."""
+    rng = random.Random(1)
+    for _ in range(50):
+        ast = synthetic_ast(rng, rng.randint(1, 40), vocabulary=10)
+        assert list_dependencies(ast) == reference_dependencies(ast)
+
+def test_locations_and_dedup():
+    """Each name is kept once, at the innermost `loc` of its first occurrence."""
+    outer, inner = {"bp": 0, "ep": 20}, {"bp": 5, "ep": 8}
+    ast = {"v": {"expr": ["CApp", {"v": ["CRef", _qualid(["Init", "Nat"], "add")], "loc": inner},
+                          _qualid([], "x"), _qualid(["Init", "Nat"], "add")]}, "loc": outer}
+    assert qualid_references(ast) == [("Init.Nat.add", inner), ("x", outer)]
+
+def test_qualid_arguments_and_loc_subtrees():
+    """References in a qualid's trailing arguments count; `loc` subtrees are ignored."""
+    loc = {"fname": ["InFile", _qualid([], "ignored")]}
+    ast = {"v": {"expr": _qualid([], "f") + [_qualid(["M"], "g")]}, "loc": loc}
+    assert list_dependencies(ast) == ["f", "M.g"]
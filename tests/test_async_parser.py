@@ -0,0 +1,86 @@
+"""Unit tests for the asyncio parser, checked against the blocking one."""
+
+import asyncio
+import threading
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from src.parser.async_parser import AsyncTinyRocqParser
+from src.parser.tiny_rocq_parser import TinyRocqParser, Source, Element, Range, Position
+
+CONTENT = """Lemma foo_bar : True.
+Proof. apply foo H0. exact bar unknown foo. Qed.
+Lemma open : True.
+Proof. apply foo. Qed.
+"""
+
+FOO_BAR = Element(origin="a.v", name="foo_bar", statement="", range=Range(Position(0, 0), Position(0, 21)))
+OPEN = Element(origin="a.v", name="open", statement="", range=Range(Position(2, 0), Position(2, 18)))
+
+def _qualid(name):
+    return ["Ser_Qualid", ["DirPath", []], ["Id", name]]
+
+class FakeClient:
+    """States are the commands run since `start`; `Qed.` closes the goal of `foo_bar` only."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = []
+
+    def _log(self, call):
+        with self.lock:
+            self.calls.append(call)
+
+    def start(self, path, name):
+        self._log(("start", name))
+        return SimpleNamespace(name=name, cmds=(), feedback=[])
+
+    def goals(self, state):
+        if state.name == "foo_bar" and "Qed." in state.cmds:
+            return []
+        hyps = [SimpleNamespace(names=[f"H{i}"], ty="nat") for i in range(len(state.cmds))]
+        return [SimpleNamespace(hyps=hyps, ty="True")]
+
+    def ast(self, state, line):
+        self._log(("ast", line))
+        return {"v": {"expr": [_qualid(word) for word in line.rstrip(".").split()[1:]]}}
+
+    def run(self, state, cmd, timeout=None):
+        self._log(("run", cmd))
+        if cmd.startswith("About "):
+            name = cmd[len("About "):-1]
+            if name.startswith("H"):
+                answer = f"{name} : nat\n\nHypothesis of the goal context."
+            elif name == "unknown":
+                return SimpleNamespace(feedback=[])
+            else:
+                answer = f"{name} : nat\n\nDeclared in library Coq.Init.{name}, line 3, characters 0-10"
+            return SimpleNamespace(feedback=[(3, answer)])
+        return SimpleNamespace(name=state.name, cmds=state.cmds + (cmd,), feedback=[])
+
+def _connect(parser, client):
+    @contextmanager
+    def connection():
+        yield client
+    parser.pool.connection = connection
+
+def test_async_steps_match_sync_parser():
+    """Same steps, goals and dependencies as `TinyRocqParser`; failures come back as exceptions."""
+    source = Source(path="a.v", content=CONTENT)
+    sync_parser = TinyRocqParser("8765")
+    _connect(sync_parser, FakeClient())
+    expected = sync_parser(FOO_BAR, source)
+    assert [step.step for step in expected] == ["Proof.", "apply foo H0.", "exact bar unknown foo.", "Qed."]
+    assert [[d.name for d in step.dependencies] for step in expected] == [[], ["foo", "H0"], ["bar", "foo"], []]
+
+    client = FakeClient()
+    async_parser = AsyncTinyRocqParser([8765, 8766], connections=2)
+    for parser in async_parser.backends:
+        _connect(parser, client)
+    try:
+        results = asyncio.run(async_parser.extract_all([(FOO_BAR, source, None), (OPEN, source, None), (FOO_BAR, source, None)]))
+    finally:
+        async_parser.close()
+    assert results[0] == expected and results[2] == expected
+    assert isinstance(results[1], AssertionError)
+    assert async_parser.load == [0, 0]
@@ -0,0 +1,24 @@
+"""Smoke test of the offline pipeline benchmark on the tiny recording."""
+
+import os
+import socket
+
+from bench.bench_pipeline import run_benchmark, regressions
+from src.config.opam_config import OpamConfig
+
+RECORDING = os.path.join(os.path.dirname(__file__), "..", "bench", "recordings", "tiny")
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def test_run_benchmark_on_tiny_recording():
+    """Steps 2 and 3 run end to end against the recording, with every request answered."""
+    config = OpamConfig(name="tiny", output="", tag="latest", packages=[], base_image="", opam_env_path="", user="coq")
+    results = run_benchmark(RECORDING, config, port=_free_port())
+    assert results["metadata"]["entries"] == 1 and results["metadata"]["theorems"] == 1
+    assert results["elements"]["entries"] == 1
+    assert results["metadata"]["misses"] == 0 and results["elements"]["misses"] == 0
+    assert results["elements"]["calls"]["petanque/run"] == 3
+    assert regressions(results, results, tolerance=0.1) == []
@@ -0,0 +1,16 @@
+"""Unit tests for the content-addressed blob store."""
+
+from src.store.blob_store import BlobStore
+from src.parser.parser import Source
+
+def test_blob_store_roundtrip_and_dedup(tmp_path):
+    """Sources serialized through the store come back intact and are stored once."""
+    store = BlobStore(str(tmp_path / "blobs"))
+    source = Source(path="theories/a.v", content="Lemma a : True.\nProof. exact I. Qed.\n")
+    d = source.to_dict(store)
+    assert "content" not in d
+    assert source.to_dict(store) == d
+    assert len(store.index) == 1
+
+    reopened = BlobStore(str(tmp_path / "blobs"))
+    assert Source.from_dict(d, reopened).content == source.content
@@ -0,0 +1,49 @@
+"""Unit tests for the columnar training-set export."""
+
+import pytest
+
+from src.store.columnar import StepDataset, export_elements, render_goals
+
+def _dep(name, kind="premise"):
+    return {"origin": "Coq.Init.Nat", "name": name, "range": None, "kind": kind}
+
+def _goal(ty):
+    return {"hyps": [{"names": ["n", "m"], "ty": "nat"}], "ty": ty}
+
+ENTRIES = [
+    {"theorem": {"origin": "a.v", "name": "t1"}, "steps": [
+        {"step": "intros.", "state_in": [_goal("n = n")], "state_out": [], "dependencies": [_dep("n", "hypothesis")]},
+        {"step": "rewrite add_comm.", "state_in": [_goal("n + m = m + n")], "state_out": [], "dependencies": [_dep("add_comm")]},
+    ]},
+    {"theorem": {"origin": "a.v", "name": "t2"}, "steps": [
+        {"step": "apply add_comm, eq_refl.", "state_in": [_goal("n + m = m + n")], "state_out": [], "dependencies": [_dep("add_comm"), _dep("eq_refl")]},
+    ]},
+]
+
+def test_export_and_read(tmp_path):
+    """Rows keep goal text, tactic and premise ids; identical goals are stored once."""
+    root = str(tmp_path / "lib_dataset")
+    assert export_elements(ENTRIES, root) == 2
+    dataset = StepDataset(root)
+    assert len(dataset) == 2 and dataset.meta["goals"] == 1
+    assert dataset[0] == {"goal": render_goals([_goal("n + m = m + n")]), "tactic": "rewrite add_comm.", "premises": [0], "theorem": 0}
+    assert dataset[1]["premises"] == [0, 1]
+    assert dataset.premise_name(1) == ("Coq.Init.Nat", "eq_refl")
+    assert dataset.theorem_name(dataset[1]["theorem"]) == ("a.v", "t2")
+    with pytest.raises(IndexError):
+        dataset[2]
+    dataset.close()
+
+def test_batches(tmp_path):
+    """Shuffled batches cover every row once, and shards partition them."""
+    entries = [{"theorem": {"origin": "a.v", "name": f"t{i}"}, "steps": [
+        {"step": f"exact l{i}.", "state_in": [_goal(f"P {i}")], "state_out": [], "dependencies": [_dep(f"l{i}")]}]} for i in range(10)]
+    root = str(tmp_path / "lib_dataset")
+    export_elements(entries, root)
+    dataset = StepDataset(root)
+    rows = [row["tactic"] for batch in dataset.batches(3, seed=0) for row in batch]
+    assert sorted(rows) == sorted(f"exact l{i}." for i in range(10)) and rows != sorted(rows)
+    shards = [[row["tactic"] for batch in dataset.batches(4, seed=0, rank=r, world_size=2) for row in batch] for r in range(2)]
+    assert sorted(shards[0] + shards[1]) == sorted(rows) and not set(shards[0]) & set(shards[1])
+    assert [len(batch) for batch in dataset.batches(4, drop_last=True)] == [4, 4]
+    dataset.close()
@@ -0,0 +1,52 @@
+"""Unit tests for the step 3 cost model."""
+
+import json
+
+from script.cost_model import CostModel, load_history, proof_lines
+
+def _theorem(name, line, character):
+    return {"origin": "a.v", "name": name, "statement": "", "range": {"start": {"line": line, "character": 0}, "end": {"line": line, "character": character}}}
+
+THEOREMS = [_theorem("short", 0, 19), _theorem("long", 2, 25), _theorem("bad", 8, 18)]
+
+def _scope(name, seconds, ok, ops=None):
+    return json.dumps({"kind": "theorem", "name": name, "file": "a.v", "stage": "elements", "ops": ops or {}, "total_s": seconds, "ok": ok})
+
+HISTORY = [_scope("short", 4.0, True, {"start": 1.0, "run": 2.5}), _scope("bad", 5.0, False), _scope("bad", 5.0, False)]
+
+def test_proof_lines():
+    """Lines up to the next theorem, the median of the others for the last one."""
+    assert proof_lines(THEOREMS) == [2, 6, 4]
+    assert proof_lines(THEOREMS[:1]) == [1]
+
+def test_history_estimates_and_timeouts(tmp_path):
+    """Known theorems cost their past proof time; only they get a shortened limit, which covers their file's start."""
+    path = tmp_path / "lib_metrics.jsonl"
+    path.write_text("\n".join(HISTORY) + "\n")
+    history = load_history(str(path))
+    assert history[("a.v", "bad")].failures == 2
+    assert (history[("a.v", "short")].seconds, history[("a.v", "short")].start) == (3.0, 1.0)
+
+    model = CostModel(history, factor=4.0, min_timeout=10, max_timeout=120)
+    model.fit([(("a.v", "short"), 2), (("a.v", "long"), 6)])
+    assert model.per_line == 1.5
+    assert model.estimate(("a.v", "long"), 6) == 9.0
+    assert model.timeout(("a.v", "long"), 9.0) == 120
+    assert model.timeout(("a.v", "short"), 3.0) == 13.0
+    assert model.timeout(("a.v", "short"), 1.0) == 10
+    assert model.offender(("a.v", "bad")) and not model.offender(("a.v", "long"))
+    assert CostModel(history, factor=0).timeout(("a.v", "short"), 3.0) == 120
+
+def test_schedule_longest_first_and_final_pass(tmp_path):
+    """Tasks come longest first as `(ref, indices, timeouts)`; offenders wait for the final pass with the full limit."""
+    path = tmp_path / "lib_metrics.jsonl"
+    path.write_text("\n".join(HISTORY) + "\n")
+    model = CostModel(load_history(str(path)), max_timeout=120)
+    files = [(0, THEOREMS, [0, 1, 2])]
+
+    first, final = model.schedule(files)
+    assert first == [(0, [1], [120]), (0, [0], [13.0])]
+    assert final == [(0, [2], [120])]
+
+    first, final = model.schedule(files, per_file=True)
+    assert first == [(0, [0, 1], [13.0, 120])]
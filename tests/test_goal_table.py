@@ -0,0 +1,33 @@
+"""Unit tests for goal interning."""
+
+from dataclasses import asdict, dataclass
+from typing import List
+
+from src.parser.parser import Dependency, Position, Range, Step
+from src.store.goal_table import GoalTable
+
+@dataclass
+class Goal:
+    hyps: List[str]
+    ty: str
+
+def _steps():
+    g0, g1, g2 = [Goal(["n : nat"], "n + 0 = n")], [Goal([], "0 = 0"), Goal(["n : nat"], "S n + 0 = S n")], []
+    dep = Dependency("Coq.Init.Nat", "add", Range(Position(1, 0), Position(1, 3)), "premise")
+    return [Step("induction n.", g0, g1, []), Step("all: simpl; auto.", g1, g2, [dep])]
+
+def test_intern_round_trip(tmp_path):
+    """Interned steps reference each distinct goal once and expand back to the plain format."""
+    assert GoalTable.for_output(str(tmp_path / "lib")) is None
+    table = GoalTable.for_output(str(tmp_path / "lib"), create=True)
+    steps = _steps()
+    interned = table.intern_steps(steps)
+    assert interned[0]["state_out"] == interned[1]["state_in"]
+    assert all(isinstance(goal, str) for goal in interned[0]["state_in"])
+    assert table.interned == 3 and table.stored == 3
+
+    again = table.intern_steps(_steps())
+    assert again == interned and table.stored == 3
+
+    entry = GoalTable.for_output(str(tmp_path / "lib")).expand_entry({"steps": interned})
+    assert entry["steps"] == [asdict(step) for step in steps]
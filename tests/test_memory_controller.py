@@ -0,0 +1,81 @@
+"""Unit tests for the per-container memory controller."""
+
+import time
+
+import psutil
+
+from src.parser.memory_controller import MemoryController, cgroup_reader
+
+GB = 2**30
+
+def _controller(usage, host, **kwargs):
+    controller = MemoryController(4 * GB, host_max=0.8, host_probe=lambda: host[0], **kwargs)
+    controller.watch(None, reader=lambda: usage[0])
+    return controller
+
+def test_limit_and_growth_under_host_pressure():
+    """Only a container above its limit, or growing while the host is short, needs a restart."""
+    usage, host = [1 * GB], [0.9]
+    controller = _controller(usage, host)
+    for _ in range(3):
+        controller.sample()
+    assert controller.restart_reason() is None
+
+    usage[0] = int(1.5 * GB)
+    controller.sample()
+    assert "grew" in controller.restart_reason()
+
+    host[0] = 0.5
+    controller.sample()
+    assert controller.restart_reason() is None
+    usage[0] = 5 * GB
+    controller.sample()
+    assert "limit" in controller.restart_reason()
+
+    controller.watch(None, reader=lambda: GB)
+    assert controller.restart_reason() is None and controller.stats()["peak"] == 5 * GB
+
+def test_default_limit_is_shared_by_jobs_and_workers():
+    """Without `worker_memory_gb`, every container of every job gets an equal part of `max_memory`."""
+    total = psutil.virtual_memory().total
+    assert MemoryController.for_workers(2, 0.8, jobs=3).limit == int(total * 0.8 / 6)
+    assert MemoryController.for_workers(2, 0.8, 1.5, jobs=3).limit == int(1.5 * GB)
+
+def test_without_container_falls_back_to_host():
+    """An external pet-server is judged on host memory alone."""
+    host = [0.5]
+    controller = MemoryController(4 * GB, host_max=0.8, host_probe=lambda: host[0])
+    controller.watch(None)
+    controller.sample()
+    assert controller.restart_reason() is None
+    host[0] = 0.9
+    controller.sample()
+    assert controller.restart_reason() is not None
+
+def test_background_sampler():
+    """The verdict is refreshed by the sampler thread."""
+    usage = [1 * GB]
+    controller = MemoryController(4 * GB, interval=0.01, host_probe=lambda: 0.1)
+    controller.start()
+    controller.watch(None, reader=lambda: usage[0])
+    usage[0] = 8 * GB
+    deadline = time.time() + 5
+    while controller.restart_reason() is None and time.time() < deadline:
+        time.sleep(0.01)
+    controller.close()
+    assert controller.restart_reason() is not None
+
+def test_cgroup_reader(tmp_path):
+    """cgroup v2 and v1 files are found and inactive page cache is not counted."""
+    v2 = tmp_path / "v2" / "system.slice" / "docker-abc.scope"
+    v2.mkdir(parents=True)
+    (v2 / "memory.current").write_text("1000\n")
+    (v2 / "memory.stat").write_text("anon 700\ninactive_file 200\n")
+    assert cgroup_reader("abc", str(tmp_path / "v2"))() == 800
+
+    v1 = tmp_path / "v1" / "memory" / "docker" / "abc"
+    v1.mkdir(parents=True)
+    (v1 / "memory.usage_in_bytes").write_text("1000\n")
+    (v1 / "memory.stat").write_text("total_inactive_file 100\n")
+    assert cgroup_reader("abc", str(tmp_path / "v1"))() == 900
+    assert cgroup_reader("missing", str(tmp_path / "v1")) is None
@@ -0,0 +1,26 @@
+"""Unit tests for extraction tracing."""
+
+from src.parser.metrics import Metrics
+from script.metrics_report import load_metrics, merge_ops, percentile_ms
+
+def test_metrics_scopes_and_snapshots(tmp_path):
+    """Scoped op time is attributed to theorems and files, snapshots merge across runs."""
+    path = str(tmp_path / "lib_metrics.jsonl")
+    for _ in range(2):
+        metrics = Metrics(path, stage="elements")
+        with metrics.scope("file", "a.v"):
+            with metrics.scope("theorem", "thm", file="a.v"):
+                metrics.record("run", 0.002)
+                metrics.record("about", 0.001)
+            metrics.record("start", 0.5)
+        metrics.count("restart:pet")
+        metrics.flush()
+
+    snapshots, scopes = load_metrics(path, stage="elements")
+    ops = merge_ops(snapshots)
+    assert ops["run"]["count"] == 2 and ops["start"]["count"] == 2
+    assert percentile_ms(ops["start"]["hist"], 0.5) >= 500
+    theorem = next(scope for scope in scopes if scope["kind"] == "theorem")
+    assert set(theorem["ops"]) == {"run", "about"}
+    file_scope = next(scope for scope in scopes if scope["kind"] == "file")
+    assert set(file_scope["ops"]) == {"run", "about", "start"}
@@ -0,0 +1,48 @@
+"""Unit tests for the recorded pet-server stand-in."""
+
+import socket
+import threading
+
+from bench.pet_replay import JsonStream, Recording, RecordingProxy, ReplayServer, replay_stats, _send
+
+def _query(port, requests):
+    answers = []
+    with socket.create_connection(("127.0.0.1", port)) as sock:
+        stream = JsonStream()
+        for request in requests:
+            _send(sock, request)
+            expected = len(answers) + 1
+            while len(answers) < expected:
+                answers += stream.feed(sock.recv(65536))
+    return answers
+
+def _serve(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def test_json_stream_split_objects():
+    """Objects are recovered whatever the chunking and framing."""
+    stream = JsonStream()
+    data = '{"a": "é"}\n{"b": [1, {"c": 2}]}{"d": 3}'.encode()
+    objects = []
+    for i in range(len(data)):
+        objects += stream.feed(data[i:i + 1])
+    assert objects == [{"a": "é"}, {"b": [1, {"c": 2}]}, {"d": 3}]
+
+def test_record_then_replay(tmp_path):
+    """Answers captured through the proxy are served back without the upstream."""
+    recording = tmp_path / "pet.jsonl"
+    recording.write_text('{"method": "petanque/start", "params": {"uri": "a.v", "thm": "t"}, "response": {"result": {"st": 1}}}\n')
+    upstream = _serve(ReplayServer(0, Recording([str(recording)])))
+    proxy = _serve(RecordingProxy(0, upstream.server_address[1], str(tmp_path / "copy.jsonl")))
+    start = {"jsonrpc": "2.0", "id": 7, "method": "petanque/start", "params": {"thm": "t", "uri": "a.v"}}
+    missing = {"jsonrpc": "2.0", "id": 8, "method": "petanque/run", "params": {"st": 1, "tac": "idtac."}}
+    answers = _query(proxy.server_address[1], [start, missing])
+    assert answers[0] == {"jsonrpc": "2.0", "id": 7, "result": {"st": 1}}
+    assert "error" in answers[1]
+    proxy.shutdown(), upstream.shutdown()
+
+    replay = _serve(ReplayServer(0, Recording([str(tmp_path / "copy.jsonl")])))
+    assert _query(replay.server_address[1], [start, start]) == [answers[0], answers[0]]
+    assert replay_stats(replay.server_address[1]) == {"calls": {"petanque/start": 2}, "misses": 0}
+    replay.shutdown()
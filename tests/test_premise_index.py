@@ -0,0 +1,32 @@
+"""Unit tests for the premise-usage index."""
+
+import random
+
+from src.store.premise_index import PremiseIndex, premise_key, update_index
+
+def _entry(name, steps):
+    return {"theorem": {"origin": "a.v", "name": name, "statement": f"Lemma {name}."}, "steps": [
+        {"step": tactic, "state_in": [{"hyps": [], "ty": f"goal {name} {i}"}], "state_out": [],
+         "dependencies": [{"origin": "Coq.Arith", "name": dep, "range": None, "kind": "premise"} for dep in deps]}
+        for i, (tactic, deps) in enumerate(steps)]}
+
+def test_sample_uses_across_segments(tmp_path):
+    """Each proof counts once per premise, and segments are added and rebuilt incrementally."""
+    root = str(tmp_path / "premise_index")
+    update_index(root, "lib1", [_entry("t1", [("intro.", []), ("rewrite add_comm add_comm.", ["add_comm", "add_comm"])]),
+                                _entry("t2", [("apply add_comm.", ["add_comm"]), ("exact eq_refl.", ["eq_refl"])])])
+    index = PremiseIndex(root)
+    add_comm = premise_key("Coq.Arith", "add_comm")
+    assert index.count(add_comm) == 2 and index.count("missing") == 0
+    uses = index.sample_uses(add_comm, k=3, rng=random.Random(0))
+    assert sorted((use["name"], use["step"]) for use in uses) == [("t1", 1), ("t2", 0)]
+    assert uses[0]["goal"].startswith("⊢ goal") and uses[0]["proof"]
+    assert index.sample_uses("missing") == []
+
+    update_index(root, "lib2", [_entry("t3", [("apply add_comm.", ["add_comm"])])])
+    index.refresh()
+    assert index.count(add_comm) == 3 and len(index.sample_uses(add_comm, k=2)) == 2
+    update_index(root, "lib1", [])
+    index.refresh()
+    assert index.count(add_comm) == 1 and index.count(premise_key("Coq.Arith", "eq_refl")) == 0
+    index.close()
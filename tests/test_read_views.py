@@ -0,0 +1,53 @@
+"""Unit tests for the precomputed read views."""
+
+from src.parser.parser import Source
+from src.store.read_views import ReadViewWriter, ReadViews, simplify
+
+SOURCE = """Require Import Arith.
+
+(* Commutativity. *)
+Lemma add_comm' n m : n + m = m + n.
+Proof.
+  induction n; simpl.
+  - auto.
+  - rewrite IHn; auto.
+Qed.
+
+Theorem t : True.
+Proof. exact I. Defined.
+"""
+
+THEOREMS = [
+    {"name": "add_comm'", "range": {"start": {"line": 3, "character": 0}, "end": {"line": 3, "character": 36}}},
+    {"name": "t", "range": {"start": {"line": 10, "character": 0}, "end": {"line": 10, "character": 17}}},
+]
+
+def test_simplify_elides_proofs():
+    """Statements and comments stay, proofs become one line."""
+    view = simplify(Source("add.v", SOURCE), THEOREMS)
+    assert view == """Require Import Arith.
+
+(* Commutativity. *)
+Lemma add_comm' n m : n + m = m + n.
+Proof. (* 5 lines elided *) Qed.
+
+Theorem t : True.
+Proof. (* 1 lines elided *) Defined.
+"""
+
+def test_read_lines_through_cache(tmp_path):
+    """Line ranges span chunks; identical chunks are shared and the byte-bounded LRU evicts."""
+    writer = ReadViewWriter(str(tmp_path / "lib_views"), chunk_lines=3)
+    text = "".join(f"line {i}\n" for i in range(10))
+    writer.add("a.v", text)
+    writer.add("b.v", text)
+    writer.close()
+
+    views = ReadViews(str(tmp_path / "lib_views"), cache_bytes=30)
+    assert views.lines("a.v") == 10
+    assert views.read("a.v", 2, 3) == "line 2\nline 3\nline 4\n"
+    assert views.read("b.v") == text
+    assert views.read("a.v", 9) == "line 9\n"
+    stats = views.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 6 and stats["evictions"] > 0 and stats["size_bytes"] <= 30
+    views.close()
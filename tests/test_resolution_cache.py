@@ -0,0 +1,18 @@
+"""Unit tests for the persistent resolution cache."""
+
+from src.parser.resolution_cache import ResolutionCache
+
+def test_resolution_cache_merges_concurrent_saves(tmp_path):
+    """Two caches on the same file keep each other's entries on save."""
+    path = str(tmp_path / "about.json")
+    first, second = ResolutionCache(path), ResolutionCache(path)
+    first.put(ResolutionCache.key("eqP", "a.v", "0"), {"name": "eqP"})
+    second.put(ResolutionCache.key("andP", "a.v", "0"), None)
+    first.save()
+    second.save()
+
+    reloaded = ResolutionCache(path)
+    assert reloaded.get(ResolutionCache.key("eqP", "a.v", "0")) == (True, {"name": "eqP"})
+    assert reloaded.get(ResolutionCache.key("andP", "a.v", "0")) == (True, None)
+    assert reloaded.get(ResolutionCache.key("eqP", "b.v", "0")) == (False, None)
+    assert reloaded.stats()["hits"] == 2
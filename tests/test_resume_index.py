@@ -0,0 +1,37 @@
+"""Unit tests for the streaming resume index."""
+
+import json
+
+from script.utils import ResumeIndex, iter_jsonl_offsets, read_jsonl_at, uid_metadata
+
+def _entry(path):
+    return {"source": {"path": path, "content": ""}}
+
+def test_resume_index_uses_sidecar_and_drops_torn_line(tmp_path):
+    """Appends are indexed, the sidecar is reused and a torn line is dropped."""
+    output = str(tmp_path / "out_metadata.jsonl")
+    index = ResumeIndex(uid_metadata, output)
+    index.append(_entry("a.v"))
+    index.append(_entry("b.v"))
+    with open(output, 'a') as file:
+        file.write(json.dumps(_entry("c.v")) + "\n")
+        file.write('{"source": {"pa')
+
+    reloaded = ResumeIndex(uid_metadata, output)
+    assert "a.v" in reloaded and "b.v" in reloaded and "c.v" in reloaded
+    assert len(reloaded) == 3
+    with open(output) as file:
+        assert file.read().endswith("\n")
+
+    again = ResumeIndex(uid_metadata, output)
+    assert len(again) == 3 and "d.v" not in again
+
+def test_entries_read_back_at_their_offsets(tmp_path):
+    """Offsets streamed from a JSONL file locate the same entries later."""
+    output = str(tmp_path / "out_metadata.jsonl")
+    index = ResumeIndex(uid_metadata, output)
+    for path in ("a.v", "é.v", "c.v"):
+        index.append(_entry(path))
+    offsets = list(iter_jsonl_offsets(output))
+    with open(output, 'rb') as file:
+        assert [read_jsonl_at(file, offset) for offset, _ in reversed(offsets)] == [entry for _, entry in reversed(offsets)]
@@ -0,0 +1,143 @@
+"""Unit tests for the sandbox pool, against fake pet-servers."""
+
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+from pytanque import PetanqueError
+
+import src.parser.sandbox as sandbox
+from src.parser.metrics import Metrics
+from src.parser.sandbox import SandboxPool
+
+class FakePet:
+    """Stands in for `ExternalPet`, counting restarts."""
+
+    def __init__(self):
+        self.restarts = 0
+
+    def start_pet(self, port=8765, timeout=30):
+        self.pet_port = port
+
+    def restart_pet(self, timeout=30):
+        self.restarts += 1
+
+    def close(self):
+        pass
+
+class FakeClient:
+    """States are the commands run since `start`; `fail` commands are Coq errors."""
+
+    def __init__(self):
+        self.calls = []
+        self.on_run = None
+
+    def start(self, path, name):
+        self.calls.append(("start", name))
+        return SimpleNamespace(cmds=(), feedback=[])
+
+    def run(self, state, cmd, timeout=None):
+        self.calls.append(cmd)
+        if self.on_run is not None:
+            self.on_run(cmd)
+        if cmd.startswith("fail"):
+            raise PetanqueError(-32000, f"Error in {cmd}")
+        return SimpleNamespace(cmds=state.cmds + (cmd,), feedback=[(3, cmd)])
+
+    def goals(self, state):
+        return [] if state.cmds and state.cmds[-1] == "qed." else [{"goal": " ".join(state.cmds)}]
+
+@pytest.fixture
+def make_pool(monkeypatch):
+    """Build a pool of fake backends sharing one `FakeClient`."""
+    monkeypatch.setattr(sandbox, "ExternalPet", FakePet)
+
+    def make(n_backends=2, connections=2, memory=0.0, metrics=None):
+        pool = SandboxPool(None, ports=list(range(9000, 9000 + n_backends)), connections=connections, external_pet=True,
+                           memory_probe=lambda: memory, metrics=metrics)
+        client = FakeClient()
+
+        @contextmanager
+        def connection():
+            yield client
+        for backend in pool.backends:
+            backend.pool.connection = connection
+        return pool, client
+    return make
+
+def test_route_is_fixed_until_saturated(make_pool):
+    """A theorem keeps its backend; once that one is full, sessions go to the least busy."""
+    pool, _ = make_pool(n_backends=2, connections=2)
+    key = ("a.v", "foo")
+    owner = pool._route(key)
+    assert all(pool._route(key) is owner for _ in range(5))
+
+    first = pool.session(*key)
+    branch = first.fork()
+    assert owner.sessions == 2 and first.backend is owner
+    third = pool.session(*key)
+    assert third.backend is not owner
+
+    branch.close()
+    assert owner.sessions == 1 and pool._route(key) is owner
+    first.close()
+    third.close()
+    assert [backend.sessions for backend in pool.backends] == [0, 0]
+
+def test_session_and_fork_branch_independently(make_pool):
+    """Runs extend a branch; a fork shares the past but not the future; errors leave the state alone."""
+    pool, client = make_pool()
+    with pool.session("a.v", "foo") as session:
+        assert session.run("intros.")["goals"] == [{"goal": "intros."}]
+        with session.fork() as branch:
+            assert branch.run("qed.")["proof_finished"]
+        failed = session.run("fail.")
+        assert not failed["ok"] and "Error in fail." in failed["error"]
+        assert session.run("auto.")["goals"] == [{"goal": "intros. auto."}]
+        assert branch.history == ["intros.", "qed."] and session.history == ["intros.", "auto."]
+    assert client.calls.count(("start", "foo")) == 1
+
+def test_sync_rebuilds_history_after_restart(make_pool):
+    """After a restart the theorem is started again and the branch's commands replayed."""
+    pool, client = make_pool()
+    session = pool.session("a.v", "foo")
+    session.run("intros.")
+    session.run("split.")
+    session.backend.restart()
+    client.calls = []
+    assert session.run("auto.")["goals"] == [{"goal": "intros. split. auto."}]
+    assert client.calls == [("start", "foo"), "intros.", "split.", "auto."]
+
+def test_restart_during_run_is_retried(make_pool):
+    """A pet-server killed mid-call is not reported as a Coq error."""
+    pool, client = make_pool()
+    session = pool.session("a.v", "foo")
+    session.run("intros.")
+
+    def crash(cmd):
+        if cmd == "fail-once." and not session.backend.generation:
+            session.backend.restart()
+    client.on_run = crash
+    client.calls = []
+    result = session.run("fail-once.")
+    assert not result["ok"] and "Error in fail-once." in result["error"]
+    assert client.calls == ["fail-once.", ("start", "foo"), "intros.", "fail-once."]
+
+    def restart_then_fail(cmd):
+        if cmd == "auto." and session.backend.generation == 1:
+            session.backend.restart()
+            raise PetanqueError(-32000, "connection lost")
+    client.on_run = restart_then_fail
+    assert session.run("auto.")["ok"]
+    assert session.history == ["intros.", "auto."]
+
+def test_memory_pressure_restarts_fullest_backend(make_pool):
+    """Above `max_memory`, the backend holding the most states is restarted on the next session."""
+    metrics = Metrics()
+    pool, _ = make_pool(n_backends=2, memory=0.9, metrics=metrics)
+    fullest = pool.backends[0]
+    fullest.cache.get_or_create(("a.v", "foo"), lambda: "state")
+    pool.session("a.v", "bar").close()
+    assert fullest.generation == 1 and len(fullest.cache) == 0 and fullest.docker.restarts == 1
+    assert pool.backends[1].generation == 0
+    assert metrics.counters["sandbox_restart"] == 1
@@ -0,0 +1,46 @@
+"""Unit tests for the multi-library scheduler."""
+
+import yaml
+
+from script.scheduler import LibraryScheduler
+from script.segments import SegmentStore
+from script.utils import uid_metadata
+
+def _record(config, port, log_dir, **_):
+    with open(f"{log_dir}/{config.name}.txt", 'a') as file:
+        file.write(f"{port}\n")
+
+def _fail(config, **_):
+    raise RuntimeError("boom")
+
+def _configs(tmp_path, names):
+    paths = []
+    for name in names:
+        path = tmp_path / f"{name}.yaml"
+        path.write_text(yaml.safe_dump({"name": name, "output": str(tmp_path / name), "tag": "1", "packages": [],
+                                        "base_image": "img", "opam_env_path": "/", "user": "u"}))
+        paths.append(str(path))
+    return paths
+
+def test_scheduler_runs_stages_in_order(tmp_path):
+    """Each library runs every stage in order; failures are reported, not fatal."""
+    paths = _configs(tmp_path, ("a", "b", "c"))
+    stages = [("one", _record), ("two", _fail), ("three", _record)]
+    scheduler = LibraryScheduler(paths, stages, {"log_dir": str(tmp_path)}, max_jobs=2, base_port=9000, ports_per_job=4, report_every=1e9, log=False)
+    failed = scheduler.run()
+    assert sorted(failed) == [("a", "two"), ("b", "two"), ("c", "two")]
+    for name in ("a", "b", "c"):
+        ports = (tmp_path / f"{name}.txt").read_text().split()
+        assert len(ports) == 2 and set(ports) <= {"9000", "9004"}
+
+def test_progress_counts_committed_segments(tmp_path):
+    """Entries committed to segments count before the stage compacts them."""
+    scheduler = LibraryScheduler(_configs(tmp_path, ("a",)), [("metadata", _record)], {}, report_every=1e9, log=False)
+    library = scheduler.libraries[0]
+    assert scheduler._records(library) is None
+    store = SegmentStore(uid_metadata, library.config.output + "_metadata.jsonl", max_bytes=0)
+    for i in range(3):
+        store.append({"source": {"path": f"{i}.v", "content": ""}})
+    assert scheduler._records(library) == 3
+    store.close()
+    assert scheduler._records(library) == 3
@@ -0,0 +1,88 @@
+"""Unit tests for the segmented output store."""
+
+import json
+import os
+
+from script.segments import MANIFEST, SegmentStore, manifest_count
+from script.utils import iter_jsonl, uid_metadata
+
+def _entry(path):
+    return {"source": {"path": path, "content": ""}}
+
+def _paths(output):
+    return sorted(entry["source"]["path"] for entry in iter_jsonl(output))
+
+def test_buffered_segments_resume_and_compact(tmp_path):
+    """Entries become visible to a new process once flushed, and compaction writes each UID once."""
+    output = str(tmp_path / "out_metadata.jsonl")
+    store = SegmentStore(uid_metadata, output, max_bytes=80)
+    for i in range(5):
+        store.append(_entry(f"{i}.v"))
+    assert "4.v" in store and len(store) == 5
+    assert len([name for name in os.listdir(store.root) if name.startswith("seg-")]) == 2
+    assert not os.path.exists(output)
+    assert manifest_count(output) == 4
+
+    killed = SegmentStore(uid_metadata, output)
+    assert "0.v" in killed and "3.v" in killed and "4.v" not in killed
+    killed.append(_entry("0.v"))
+    killed.close()
+    assert _paths(output) == ["0.v", "1.v", "2.v", "3.v"]
+    assert manifest_count(output) == 0
+    assert not any(name.startswith("seg-") for name in os.listdir(store.root))
+
+    store.append(_entry("5.v"))
+    store.close()
+    assert _paths(output) == ["0.v", "1.v", "2.v", "3.v", "4.v", "5.v"]
+    assert len(SegmentStore(uid_metadata, output)) == 6
+
+def test_concurrent_writers(tmp_path):
+    """Several writers commit to one manifest and see each other's entries."""
+    output = str(tmp_path / "out_metadata.jsonl")
+    a, b = SegmentStore(uid_metadata, output), SegmentStore(uid_metadata, output)
+    a.append(_entry("a.v"))
+    b.append(_entry("b.v"))
+    a.flush()
+    b.flush()
+    assert "a.v" in b
+    a.compact()
+    b.append(_entry("c.v"))
+    b.close()
+    assert "c.v" in SegmentStore(uid_metadata, output)
+    assert _paths(output) == ["a.v", "b.v", "c.v"]
+
+def test_crash_recovery(tmp_path):
+    """A torn manifest record is dropped, an unrecorded segment is adopted and a rerun compaction adds no duplicate."""
+    output = str(tmp_path / "out_metadata.jsonl")
+    store = SegmentStore(uid_metadata, output)
+    store.append(_entry("a.v"))
+    store.flush()
+    root = store.root
+    with open(os.path.join(root, "seg-1-dead-000000.jsonl"), 'w') as file:
+        file.write(json.dumps(_entry("b.v")) + "\n")
+    with open(os.path.join(root, MANIFEST), 'a') as file:
+        file.write('{"segment": "seg-1-dead-0000')
+    with open(os.path.join(root, ".tmp-seg-999999999-dead-000001.jsonl"), 'w') as file:
+        file.write('{"source": ')
+
+    resumed = SegmentStore(uid_metadata, output)
+    assert "a.v" in resumed and "b.v" in resumed
+    # Compaction interrupted after the output was written: the segments are still listed.
+    resumed.base.extend([(open(os.path.join(root, name), 'rb').read(), digests[0]) for name, digests in resumed.segments.items()])
+    resumed.close()
+    assert _paths(output) == ["a.v", "b.v"]
+    assert sorted(os.listdir(root)) == [".lock", MANIFEST]
+
+def test_compact_syncs_output_before_dropping_segments(tmp_path, monkeypatch):
+    """The output and its `.uids` sidecar reach the disk before the manifest is reset."""
+    output = str(tmp_path / "out_metadata.jsonl")
+    store = SegmentStore(uid_metadata, output)
+    store.append(_entry("0.v"))
+    store.flush()
+    events = []
+    fsync, replace = os.fsync, os.replace
+    monkeypatch.setattr(os, "fsync", lambda fd: events.append(os.path.basename(os.readlink(f"/proc/self/fd/{fd}"))) or fsync(fd))
+    monkeypatch.setattr(os, "replace", lambda src, dst: events.append(os.path.basename(dst)) or replace(src, dst))
+    store.compact()
+    assert events.index("out_metadata.jsonl") < events.index(MANIFEST)
+    assert events.index("out_metadata.jsonl.uids") < events.index(MANIFEST)
@@ -0,0 +1,29 @@
+"""Unit tests for the line index of sources."""
+
+import pytest
+
+from src.parser.parser import Element, Position, Range, Source, update_statement
+
+CONTENT = "Lemma a : True.\nProof.\n  exact I.\nQed.\n\nLemma b n :\n  n = n.\nProof. reflexivity. Qed.\n"
+
+def test_line_index():
+    """Lines, offsets and positions agree with a plain split."""
+    source = Source("a.v", CONTENT)
+    lines = CONTENT.split("\n")[:-1]
+    assert source.line_count == len(lines) and source.content_lines == lines
+    for i, line in enumerate(lines):
+        assert source.line(i) == line
+        assert source.position(source.offset(Position(i, 2))) == Position(i, min(2, len(line)))
+    assert source.offset(Position(0, 100)) == len(lines[0])
+    assert source.offset(Position(len(lines) + 1, 0)) == len(CONTENT)
+    with pytest.raises(IndexError):
+        source.offset(Position(len(lines) + 2, 0))
+    assert Source("e.v", "").line_count == 0 and Source("n.v", "a\nb").content_lines == ["a", "b"]
+
+def test_slice_and_statement():
+    """Multi-line and single-line ranges slice the same text as the old line-based code."""
+    source = Source("a.v", CONTENT)
+    assert source.slice(Position(5, 6), Position(6, 8)) == "b n :\n  n = n."
+    theorem = Element("a.v", "b", "", Range(Position(7, 7), Position(7, 19)))
+    update_statement(theorem, source)
+    assert theorem.statement == "reflexivity."
@@ -0,0 +1,42 @@
+"""Unit tests for the sandbox state cache."""
+
+import threading
+import time
+
+import pytest
+
+from src.parser.state_cache import StateCache
+
+def test_lru_eviction():
+    """The least recently used entry goes first."""
+    cache = StateCache(capacity=2)
+    cache.get_or_create("a", lambda: 1)
+    cache.get_or_create("b", lambda: 2)
+    assert cache.get_or_create("a", lambda: 0) == (1, True)
+    cache.get_or_create("c", lambda: 3)
+    assert "a" in cache and "b" not in cache
+    assert cache.stats() == {"hits": 1, "misses": 3, "hit_rate": 0.25, "evictions": 1, "size": 2}
+
+def test_concurrent_misses_share_one_start():
+    """Rollouts missing the same theorem at once wait for a single start."""
+    cache, calls = StateCache(), []
+
+    def start():
+        calls.append(1)
+        time.sleep(0.05)
+        return "state"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_create("thm", start))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1 and sorted(hit for _, hit in results) == [False] + [True] * 7
+
+def test_failed_start_is_not_cached():
+    """A failing factory is retried by the next caller."""
+    cache = StateCache()
+    with pytest.raises(RuntimeError):
+        cache.get_or_create("thm", lambda: (_ for _ in ()).throw(RuntimeError("pet-server down")))
+    assert cache.get_or_create("thm", lambda: "state") == ("state", False)
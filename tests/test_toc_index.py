@@ -0,0 +1,39 @@
+"""Unit tests for the logical-path table of contents."""
+
+from src.store.toc_index import TocIndex, build_toc_index, logical_path
+
+LOADPATH = {"mathcomp": "/opam/lib/coq/user-contrib/mathcomp", "Coq": "/opam/lib/coq/theories"}
+
+def _entry(path, theorems):
+    return {"library": "coq-mathcomp", "source": {"path": path}, "loadpath": LOADPATH,
+            "theorems": [{"name": name, "statement": statement} for name, statement in theorems]}
+
+ENTRIES = [
+    _entry("/opam/lib/coq/user-contrib/mathcomp/ssreflect/ssrnat.v", [("addnC", "Lemma addnC :\n  commutative addn."), ("addn0", "Lemma addn0 : right_id 0 addn.")]),
+    _entry("/opam/lib/coq/user-contrib/mathcomp/ssreflect/seq.v", [("size_cat", "Lemma size_cat s1 s2 : size (s1 ++ s2) = size s1 + size s2.")]),
+    _entry("/opam/lib/coq/theories/Arith/PeanoNat.v", [("add_comm", "Theorem add_comm n m : n + m = m + n.")]),
+]
+
+def test_logical_path():
+    """The longest matching load-path root gives the module name."""
+    assert logical_path("/opam/lib/coq/user-contrib/mathcomp/ssreflect/ssrnat.v", LOADPATH) == "mathcomp.ssreflect.ssrnat"
+    assert logical_path("/elsewhere/Foo.v", LOADPATH, "lib") == "lib.Foo"
+
+def test_toc_queries(tmp_path):
+    """Listing, prefix search and paginated rendered views."""
+    root = str(tmp_path / "toc_index")
+    build_toc_index(ENTRIES, root)
+    toc = TocIndex(root)
+    assert [c["path"] for c in toc.children("")] == ["Coq", "mathcomp"]
+    assert toc.children("mathcomp.ssreflect") == [
+        {"path": "mathcomp.ssreflect.seq", "module": True, "theorems": 1},
+        {"path": "mathcomp.ssreflect.ssrnat", "module": True, "theorems": 2},
+    ]
+    assert [c["path"] for c in toc.children("mathcomp.ssreflect.ssrnat", offset=1)] == ["mathcomp.ssreflect.ssrnat.addnC"]
+    assert toc.search("mathcomp.ssreflect.ssrnat.add") == ["mathcomp.ssreflect.ssrnat.addn0", "mathcomp.ssreflect.ssrnat.addnC"]
+    assert toc.search("mathcomp.ssreflect.s", limit=1) == ["mathcomp.ssreflect.seq"]
+    assert toc.render("mathcomp.ssreflect.ssrnat", page=1, page_size=1) == (
+        "mathcomp.ssreflect.ssrnat: 2 entries, 2 theorems (page 2/2)\nLemma addnC : commutative addn.\n")
+    assert "module ssreflect (3 theorems)" in toc.render("mathcomp")
+    assert toc.find("mathcomp.nope") is None
+    toc.close()
@@ -1,6 +1,16 @@
 """Unit tests for tiny Rocq parser helpers."""
 
+import json
+from contextlib import contextmanager
+from dataclasses import asdict
+from types import SimpleNamespace
+
+from src.parser.resolution_cache import ResolutionCache
+from src.parser.state_cache import StateCache
+from src.store.blob_store import BlobStore
 from src.parser.tiny_rocq_parser import TinyRocqParser, Source, Element, Range, Position
+import script.steps.step_3_elements as step_3
+from script.steps.step_3_elements import replay_task, load_tasks, load_source
 
 def test__extract_proof_steps():
     """Ensure proof extraction keeps bullets and tactics in order."""
@@ -12,8 +22,147 @@ def test__extract_proof_steps():
         "Lemma cmp0 x : unify_itv i (Itv.Real `]-oo, +oo[) -> 0 >=< x%:num. Proof. by case: i x => [//| i' [x /=/andP[]]].\n- by case: y => [y /=/andP[]]. Qed.",
     ]
     thm = Element(origin="", name="", statement="", range=Range(start_pos, end_pos))
-    source = Source(path="", content="", content_lines=content_lines)
+    source = Source(path="", content="\n".join(content_lines))
     assert parser._extract_proof_steps(thm, source) == ['Proof.', "by case: i x => [//| i' [x /=/andP[]]].", "-",  "by case: y => [y /=/andP[]].", 'Qed.']
 
+class FakeClient:
+    """Answers `Print LoadPath` and `Locate` like pet-server, counting the calls."""
+
+    def __init__(self):
+        self.calls = []
+
+    def start(self, path, name):
+        self.calls.append("start")
+        return None
+
+    def run(self, state, cmd, timeout=None):
+        self.calls.append(cmd)
+        if cmd == 'Print LoadPath.':
+            answer = "Logical Path / Physical path:\nmathcomp /lib/mathcomp\n"
+        else:
+            answer = f"Module mathcomp.ssreflect.{cmd.split()[1][:-1]}"
+        return SimpleNamespace(feedback=[(3, answer)])
+
+def test_extract_dependencies_cached(tmp_path):
+    """Load path and `Locate` answers are asked once, then served from the persisted cache."""
+    client = FakeClient()
+    parser = TinyRocqParser("8765", locate_cache=ResolutionCache(str(tmp_path / "locate.json")))
+
+    @contextmanager
+    def connection():
+        yield client
+    parser.pool.connection = connection
+    thm = Element(origin="", name="foo", statement="", range=Range(Position(2, 0), Position(2, 10)))
+    a = Source(path="/lib/a.v", content="From mathcomp Require Import ssrnat eqtype.\nRequire Import ssrnat.\nLemma foo : True.")
+    b = Source(path="/lib/b.v", content="From mathcomp Require Import eqtype.\nLemma foo : True.")
+
+    loadpath, dependencies = parser.extract_dependencies(a, [thm])
+    assert loadpath == {"mathcomp": "/lib/mathcomp"}
+    assert dependencies == ["mathcomp.ssreflect.ssrnat", "mathcomp.ssreflect.eqtype", "mathcomp.ssreflect.ssrnat"]
+    assert client.calls == ["start", 'Print LoadPath.', 'Locate ssrnat.', 'Locate eqtype.', 'Locate ssrnat.']
+
+    client.calls = []
+    assert parser.extract_dependencies(b, [thm]) == (loadpath, ["mathcomp.ssreflect.eqtype"])
+    assert client.calls == []
+
+    parser.locate_cache.save()
+    other = TinyRocqParser("8765", locate_cache=ResolutionCache(str(tmp_path / "locate.json")))
+    other.pool.connection = connection
+    assert other.extract_dependencies(a, [thm]) == (loadpath, dependencies)
+    assert client.calls == []
+
+class AboutClient:
+    """Answers `About` from a fixed table, counting the calls."""
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.calls = []
+
+    def run(self, state, cmd, timeout=None):
+        self.calls.append(cmd)
+        answer = self.answers.get(cmd[len("About "):-1])
+        return SimpleNamespace(feedback=[(3, answer)] if answer else [])
+
+def test_resolve_caches_only_imported_premises():
+    """Unknown names and names the file declares are asked again; imported premises come from the cache."""
+    parser = TinyRocqParser("8765")
+    source = Source(path="/lib/a.v", content="Lemma foo : True.\nProof. exact I. Qed.\nDefinition later := 0.\n")
+    assert source.declared_names == {"foo", "later"}
+    imported = "{} : nat\n\nDeclared in library mathcomp.ssrnat, line 3, characters 0-10"
+    client = AboutClient({"addnC": imported.format("addnC"), "foo": imported.format("foo")})
+    context = ("/lib/a.v", "")
+    for constant, calls in (("addnC", 1), ("missing", 2), ("foo", 2), ("ssrnat.foo", 2)):
+        client.calls = []
+        for _ in range(2):
+            result = parser._resolve(client, None, constant, context, set(), source.declared_names)
+        assert len(client.calls) == calls, constant
+        assert (result is None) == (constant == "missing" or constant == "ssrnat.foo")
+    assert list(parser.about_cache.entries.values()) == [{"origin": "mathcomp.ssrnat", "name": "addnC", "kind": "premise",
+                                                          "range": {"start": {"line": 3, "character": 0}, "end": {"line": 3, "character": 10}}}]
+
+class ReplayClient:
+    """States are the commands run since `start`; a state ending with `Qed.` has no goal left."""
+
+    def __init__(self):
+        self.calls = []
+
+    def start(self, path, name):
+        self.calls.append(("start", name))
+        return SimpleNamespace(cmds=(), feedback=[])
+
+    def run(self, state, cmd, timeout=None):
+        self.calls.append(("run", cmd))
+        return SimpleNamespace(cmds=state.cmds + (cmd,), feedback=[])
+
+    def goals(self, state):
+        return [] if state.cmds and state.cmds[-1].endswith("Qed.") else [SimpleNamespace(hyps=[], ty="True")]
+
+    def ast(self, state, line):
+        return None
+
+def test_file_replay_skips_admitted_lemma():
+    """An admitted lemma is skipped without restart; the next theorem still reuses the file state."""
+    parser = TinyRocqParser("8765")
+    client = ReplayClient()
+    parser.pool.acquire = lambda: client
+    parser.pool.release = lambda client, healthy=True: None
+    replays = []
+    file_replay = parser.file_replay
+    parser.file_replay = lambda *args, **kwargs: replays.append(file_replay(*args, **kwargs)) or replays[-1]
+    content = "Lemma first : True.\nProof. exact I. Qed.\nLemma skipped : False.\nProof. Admitted.\nLemma last : True.\nProof. exact I. Qed.\n"
+    theorems = [Element(origin="a.v", name=name, statement="", range=Range(Position(line, 0), Position(line, length)))
+                for name, line, length in (("first", 0, 19), ("skipped", 2, 22), ("last", 4, 18))]
+    restarts = []
+    task = ("lib", Source(path="a.v", content=content).to_dict(), [asdict(thm) for thm in theorems], None, [10] * 3)
+    entries, retry = replay_task(task, parser, None, None, lambda *args, **kwargs: restarts.append(args), SimpleNamespace(restart_reason=lambda: None), replay_mode="file")
+    assert [entry["theorem"]["name"] for entry in entries] == ["first", "last"] and retry is None
+    assert restarts == [] and replays[0].started == 1 and replays[0].reused == 1
+    assert ("run", "\nLemma skipped : False.\nProof. Admitted.\nLemma last : True.") in client.calls
+    assert parser.metrics.counters["proof_not_found"] == 1
+
+def test_load_tasks_reads_each_file_once(tmp_path, monkeypatch):
+    """Consecutive tasks of one entry share a read; workers build each file's `Source` once from its blob reference."""
+    output = str(tmp_path / "lib")
+    entries = [{"library": "lib", "source": {"path": f"{name}.v", "content": f"Lemma {name} : True."}, "dependencies": [],
+                "theorems": [{"name": f"{name}{i}"} for i in range(2)]} for name in ("a", "b")]
+    with open(output + "_metadata.jsonl", "w") as file:
+        for entry in entries:
+            file.write(json.dumps(entry) + "\n")
+    second = len(json.dumps(entries[0])) + 1
+    reads = []
+    read_jsonl_at = step_3.read_jsonl_at
+    monkeypatch.setattr(step_3, "read_jsonl_at", lambda file, offset: reads.append(offset) or read_jsonl_at(file, offset))
+    store = BlobStore(str(tmp_path / "blobs"))
+    plan = [(0, [0], [10]), (0, [1], [10]), (second, [0, 1], [10, 10]), (0, [0], [10])]
+    tasks = list(load_tasks(output, plan, store))
+    assert reads == [0, second, 0]
+    assert [[thm["name"] for thm in task[2]] for task in tasks] == [["a0"], ["a1"], ["b0", "b1"], ["a0"]]
+    assert tasks[0][1] == {"path": "a.v", "hash": BlobStore.hash("Lemma a : True.")}
+
+    sources = StateCache(4)
+    loaded = [load_source(task[1], store, sources) for task in tasks]
+    assert loaded[0][0] is loaded[1][0] and loaded[0][0].content == "Lemma a : True." and loaded[0][1] == tasks[0][1]
+    assert sources.stats()["misses"] == 2
+
 if __name__ == '__main__':
     test__extract_proof_steps()
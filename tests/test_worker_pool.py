@@ -0,0 +1,21 @@
+"""Unit tests for the pet-server worker pool."""
+
+import os
+
+from script.worker_pool import WorkerPool, worker_loop
+
+def _square_main(worker_id, port, task_queue, result_queue, crash_file):
+    """Square integers; the first worker to see 3 dies once."""
+    def handle(task):
+        if task == 3 and not os.path.exists(crash_file):
+            open(crash_file, 'w').close()
+            os._exit(1)
+        return task * task
+    worker_loop(worker_id, task_queue, result_queue, handle)
+
+def test_worker_pool_respawns_dead_worker(tmp_path):
+    """A dead worker is restarted and its task replayed on the new process."""
+    pool = WorkerPool(2, _square_main, (str(tmp_path / "crashed"),), base_port=9000)
+    results = sorted(pool.run(range(6)))
+    assert results == [0, 1, 4, 9, 16, 25]
+    assert pool.respawns == 1